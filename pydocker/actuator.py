@@ -0,0 +1,93 @@
+"""
+Shares actuation class
+
+Current assumptions:
+- Nobody else changes container shares, cpusets or quotas behind the
+  controller's back
+
+"""
+
+__author__ = "Christos Kozyrakis"
+__email__ = "christos@hyperpilot.io"
+__copyright__ = "Copyright 2017, HyperPilot Inc"
+
+# standard
+import time
+import multiprocessing
+import requests
+import docker
+
+
+class SharesActuator(object):
+  """This class applies the cpu shares, cpusets and CFS quotas decided by
+     the controller.
+
+     Policies only set desired shares in the container table, and
+     cont.cpuset_cpus and cont.cpu_quota. Shares to write come straight from
+     the rows of the table whose desired and applied shares differ; each
+     container also remembers its applied cpuset and quota. apply() skips
+     no-op writes and issues the remaining ones concurrently. A write that
+     fails leaves the applied values untouched and is retried next cycle.
+     Cpusets and quotas always go through docker.
+  """
+  def __init__(self, pool, timeout, cgroup_shares=None):
+    self.pool = pool
+    self.timeout = timeout
+    self.cgroup_shares = cgroup_shares
+
+
+  def changes(self, cont):
+    """ Returns the cpuset and quota update arguments that differ from the
+        applied ones
+    """
+    changes = {}
+    if cont.cpuset_cpus != cont.applied_cpuset_cpus:
+      changes['cpuset_cpus'] = cont.cpuset_cpus
+    if cont.cpu_quota != cont.applied_cpu_quota:
+      changes['cpu_quota'] = cont.cpu_quota
+    return changes
+
+
+  def write(self, cont, changes):
+    """ Writes the changed settings of one container
+    """
+    changes = dict(changes)
+    if self.cgroup_shares is not None and 'cpu_shares' in changes:
+      self.cgroup_shares.setShares(cont.docker_id, changes.pop('cpu_shares'))
+    if changes:
+      cont.docker.update(**changes)
+
+
+  def apply(self, table, containers=None):
+    """ Applies the pending shares of table and, when containers are given,
+        their cpusets and quotas that differ from the applied ones
+        Returns the number of writes that succeeded
+    """
+    updates = {}
+    for _, cont in (containers or {}).items():
+      changes = self.changes(cont)
+      if changes:
+        updates[cont.docker_id] = (cont, changes)
+    for cont, shares in table.pending():
+      updates.setdefault(cont.docker_id, (cont, {}))[1]['cpu_shares'] = shares
+    pending = []
+    for cont, changes in updates.values():
+      pending.append((cont, changes, self.pool.apply_async(self.write, (cont, changes))))
+
+    deadline = time.time() + self.timeout
+    actuations = 0
+    for cont, changes, result in pending:
+      try:
+        result.get(max(0.0, deadline - time.time()))
+      except multiprocessing.TimeoutError:
+        print "Timeout updating shares for container %s" % cont.docker_name
+        continue
+      except (docker.errors.APIError, requests.exceptions.RequestException, IOError):
+        print "Cannot update shares for container %s" % cont.docker_name
+        continue
+      if 'cpu_shares' in changes:
+        table.setApplied(cont.docker_id, changes['cpu_shares'])
+      cont.applied_cpuset_cpus = changes.get('cpuset_cpus', cont.applied_cpuset_cpus)
+      cont.applied_cpu_quota = changes.get('cpu_quota', cont.applied_cpu_quota)
+      actuations += 1
+    return actuations
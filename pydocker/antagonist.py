@@ -0,0 +1,139 @@
+"""
+Antagonist workload utilities
+
+Current assumptions:
+- One worker process per core to load; workers run independently and
+  only share their work counts with the reporting process
+- Intensity is a duty cycle: workers work for that fraction of every
+  slice and sleep for the rest; a rate limit, if any, also ends the
+  busy part of a slice
+- Workers set up their own state (e.g. buffers, sockets) after the fork,
+  so that footprints add up across workers
+
+"""
+
+__author__ = "Christos Kozyrakis"
+__email__ = "christos@hyperpilot.io"
+__copyright__ = "Copyright 2017, HyperPilot Inc"
+
+# Standard
+import sys
+import json
+import time
+import argparse
+import multiprocessing
+
+# seconds of one duty cycle
+SLICE = 0.1
+
+
+def Parser(description):
+  """ Argument parser with the options shared by all antagonists
+  """
+  parser = argparse.ArgumentParser(description=description)
+  parser.add_argument("-w", "--workers", type=int, default=1,
+                      help="worker processes, 0 for one per core")
+  parser.add_argument("-d", "--duration", type=float, default=0,
+                      help="seconds to run, 0 to run forever")
+  parser.add_argument("-i", "--intensity", type=float, default=1.0,
+                      help="fraction of time each worker works, (0, 1]")
+  parser.add_argument("-r", "--interval", type=float, default=5.0,
+                      help="seconds between throughput reports")
+  parser.add_argument("-f", "--format", type=str, default="text", choices=("text", "json"),
+                      help="report format; json prints one object per line")
+  return parser
+
+
+def ParseArgs(parser):
+  """ Parses and checks the shared options
+  """
+  args = parser.parse_args()
+  if not 0.0 < args.intensity <= 1.0 or args.workers < 0 or args.interval <= 0:
+    parser.error("intensity must be in (0, 1], workers at least 0, interval positive")
+  return args
+
+
+def Worker(counts, index, setup, args, limit):
+  """ Calls the step returned by setup(args) forever, at the given duty
+      cycle and at most limit units per second (0 for no limit), counting
+      the units of work in counts[index]
+      With a limit, each step gets the units left in the slice and should
+      do no more than that, so that small limits hold too
+  """
+  busy = args.intensity * SLICE
+  try:
+    step = setup(args)
+    while 1:
+      start = time.time()
+      done = 0
+      while 1:
+        units = step(limit * SLICE - done) if limit else step()
+        counts[index] += units
+        done += units
+        elapsed = time.time() - start
+        if elapsed >= busy or (limit and done >= limit * SLICE):
+          break
+      idle = SLICE - (time.time() - start)
+      if idle > 0:
+        time.sleep(idle)
+  except KeyboardInterrupt:
+    pass
+
+
+def Report(args, unit, record):
+  """ Prints one record, as JSON or text
+  """
+  rate = record[unit + '_per_sec']
+  if args.format == 'json':
+    print json.dumps(record, sort_keys=True)
+  elif 'interval' in record:
+    print "%s per second = %0.2f" % (unit.capitalize(), rate)
+  else:
+    print "Total: %d %s in %0.2f seconds, %s per second = %0.2f" \
+          % (record[unit], unit, record['seconds'], unit, rate)
+  sys.stdout.flush()
+
+
+def Run(args, setup, unit, limit=0, **info):
+  """ Starts the workers and reports their throughput, in units per second,
+      every interval, then once for the whole run
+      limit caps the units per second of all workers together; info is
+      added to every report
+  """
+  workers = args.workers or multiprocessing.cpu_count()
+  counts = multiprocessing.Array('L', workers, lock=False)
+  procs = [multiprocessing.Process(target=Worker, \
+                                   args=(counts, i, setup, args, float(limit) / workers)) \
+           for i in range(workers)]
+  for proc in procs:
+    proc.daemon = True
+    proc.start()
+  info.update({'workers': workers, 'intensity': args.intensity})
+
+  start = last = time.time()
+  last_counts = [0] * workers
+  try:
+    while not args.duration or last - start < args.duration:
+      interval = args.interval
+      if args.duration:
+        interval = min(interval, start + args.duration - last)
+      time.sleep(max(interval, 0.0))
+      now = time.time()
+      current = list(counts)
+      rates = [float(c - l) / (now - last) for c, l in zip(current, last_counts)]
+      record = {'time': now, 'interval': now - last, unit + '_per_sec': sum(rates),
+                'worker_' + unit + '_per_sec': rates}
+      record.update(info)
+      Report(args, unit, record)
+      last, last_counts = now, current
+  except KeyboardInterrupt:
+    pass
+  for proc in procs:
+    proc.terminate()
+
+  total = sum(last_counts)
+  seconds = last - start
+  record = {'time': last, 'seconds': seconds, unit: total,
+            unit + '_per_sec': float(total) / seconds if seconds else 0.0}
+  record.update(info)
+  Report(args, unit, record)
@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+
+"""
+An infinite loop program that reads a working set one cache line at a
+time in random order and reports the cache lines read per second
+
+Current assumptions:
+- LLC antagonist: a working set a bit larger than the LLC (per worker)
+  evicts the lines of everything else; a smaller one holds onto its share
+- 64 byte cache lines; a random order defeats the hardware prefetchers
+
+"""
+
+__author__ = "Christos Kozyrakis"
+__email__ = "christos@hyperpilot.io"
+__copyright__ = "Copyright 2017, HyperPilot Inc"
+
+
+# Standard
+# External
+import numpy as np
+# Local
+import antagonist
+
+LINE_BYTES = 64
+# lines read per step
+BATCH = 1 << 16
+
+def Setup(args):
+  """ Step of one worker: reads a batch of random lines of its working set,
+      returns the lines read
+  """
+  words = LINE_BYTES // 8
+  lines = max(int(args.size * 1024 * 1024) // LINE_BYTES, 1)
+  # touch every page, so that the working set is resident
+  data = np.ones(lines * words, dtype=np.int64)
+  order = np.random.permutation(lines) * words
+  batches = [order[_:_ + BATCH] for _ in range(0, lines, BATCH)]
+  scratch = np.empty(BATCH, dtype=np.int64)
+  state = {'next': 0}
+  def Step():
+    batch = batches[state['next']]
+    state['next'] = (state['next'] + 1) % len(batches)
+    np.take(data, batch, out=scratch[:len(batch)])
+    return len(batch)
+  return Step
+
+def main():
+  parser = antagonist.Parser("LLC antagonist: reads a working set in random order")
+  parser.add_argument("-s", "--size", type=float, default=32.0,
+                      help="working set per worker, in MB")
+  args = antagonist.ParseArgs(parser)
+  antagonist.Run(args, Setup, 'lines', size_mbytes=args.size)
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,210 @@
+"""
+Cgroup utilities class
+
+Current assumptions:
+- Container cgroups are named after the full docker ID, either directly
+  (cgroupfs driver) or as docker-<id>.scope (systemd driver)
+- Either cgroup v1 (cpu and cpuacct controllers) or the cgroup v2 unified
+  hierarchy is mounted under the cgroup root
+
+"""
+
+__author__ = "Christos Kozyrakis"
+__email__ = "christos@hyperpilot.io"
+__copyright__ = "Copyright 2017, HyperPilot Inc"
+
+import os
+import time
+
+# seconds before looking again for a container whose cgroup was not found
+RESCAN_INTERVAL = 30.0
+
+
+class Cgroup(object):
+  """This class locates the cgroup directories of containers in one controller
+     hierarchy. Paths are cached until the container goes away. Containers
+     not found are only looked for again after rescan_interval seconds, so
+     that they do not cost a walk of the hierarchy every cycle.
+  """
+  def __init__(self, root, controller, rescan_interval=RESCAN_INTERVAL):
+    self.root = root
+    self.unified = os.path.isfile(os.path.join(root, 'cgroup.controllers'))
+    if self.unified:
+      self.hierarchy = root
+    else:
+      self.hierarchy = os.path.join(root, controller)
+    self.paths = {}
+    self.rescan_interval = rescan_interval
+    # container -> time of the walk that did not find it
+    self.misses = {}
+
+
+  def findCgroups(self, docker_ids):
+    """ Walks the hierarchy once to locate the cgroup of each unknown container
+    """
+    now = time.time()
+    wanted = {}
+    for _ in docker_ids:
+      if _ not in self.paths and now - self.misses.get(_, 0.0) >= self.rescan_interval:
+        wanted[_] = _
+        wanted['docker-%s.scope' % _] = _
+    if not wanted:
+      return
+    for dirpath, dirnames, _ in os.walk(self.hierarchy):
+      for name in dirnames:
+        if name in wanted:
+          self.paths[wanted[name]] = os.path.join(dirpath, name)
+    for _ in set(wanted.values()):
+      if _ in self.paths:
+        self.misses.pop(_, None)
+      else:
+        self.misses[_] = now
+
+
+  def findCgroup(self, docker_id):
+    """ Returns the cgroup directory of a container, or None
+    """
+    self.findCgroups([docker_id])
+    return self.paths.get(docker_id)
+
+
+class CgroupCpu(Cgroup):
+  """This class samples container CPU usage directly from cgroup accounting files.
+
+     The previous sample of each container is kept in memory, so usage is the
+     delta between two consecutive calls to sample(). Percentages follow the
+     Docker stats convention: system-wide, not scaled per core.
+
+     Useful documents:
+      - cgroup v1 cpuacct controller
+        https://www.kernel.org/doc/Documentation/cgroup-v1/cpuacct.txt
+      - cgroup v2 cpu controller
+        https://www.kernel.org/doc/Documentation/cgroup-v2.txt
+  """
+  def __init__(self, root='/sys/fs/cgroup', proc_stat='/proc/stat'):
+    super(CgroupCpu, self).__init__(root, 'cpuacct')
+    self.proc_stat = proc_stat
+    self.clk_tck = os.sysconf('SC_CLK_TCK')
+    self.samples = {}
+    self.last_system = None
+
+
+  def readUsage(self, path):
+    """ Returns the cumulative CPU time of a cgroup in nanoseconds
+    """
+    if self.unified:
+      with open(os.path.join(path, 'cpu.stat')) as _:
+        for line in _:
+          key, value = line.split()
+          if key == 'usage_usec':
+            return int(value) * 1000
+      raise IOError('No usage_usec in %s/cpu.stat' % path)
+    with open(os.path.join(path, 'cpuacct.usage')) as _:
+      return int(_.read())
+
+
+  def readSystemUsage(self):
+    """ Returns the cumulative CPU time of the host in nanoseconds
+        Same fields as the Docker daemon: user through softirq
+    """
+    with open(self.proc_stat) as _:
+      for line in _:
+        fields = line.split()
+        if fields[0] == 'cpu':
+          ticks = sum(int(x) for x in fields[1:8])
+          return ticks * 1000000000 // self.clk_tck
+    raise IOError('No cpu line in %s' % self.proc_stat)
+
+
+  def sample(self, docker_ids):
+    """ Samples the given containers and returns their CPU percent since the
+        previous sample. Containers seen for the first time report 0.0
+    """
+    self.findCgroups(docker_ids)
+    system = self.readSystemUsage()
+    system_delta = 0.0
+    if self.last_system is not None:
+      system_delta = float(system - self.last_system)
+    self.last_system = system
+
+    results = {}
+    samples = {}
+    for _ in docker_ids:
+      results[_] = 0.0
+      if _ not in self.paths:
+        continue
+      try:
+        usage = self.readUsage(self.paths[_])
+      except (IOError, OSError, ValueError):
+        # container exited or moved, look it up again next time
+        del self.paths[_]
+        continue
+      samples[_] = usage
+      if _ in self.samples and system_delta > 0.0:
+        cpu_delta = float(usage - self.samples[_])
+        if cpu_delta > 0.0:
+          results[_] = (cpu_delta / system_delta) * 100.0
+
+    # forget containers that are gone
+    self.samples = samples
+    for _ in list(self.paths):
+      if _ not in samples:
+        del self.paths[_]
+    for _ in list(self.misses):
+      if _ not in results:
+        del self.misses[_]
+    return results
+
+
+class CgroupShares(Cgroup):
+  """This class writes container CPU shares directly to the cpu controller,
+     bypassing the Docker daemon. On cgroup v2, shares are converted to
+     cpu.weight with the same formula as runc.
+  """
+  def __init__(self, root='/sys/fs/cgroup'):
+    super(CgroupShares, self).__init__(root, 'cpu')
+
+
+  def setShares(self, docker_id, shares):
+    """ Sets the CPU shares of a container
+        Raises IOError if the container cgroup cannot be found or written
+    """
+    path = self.findCgroup(docker_id)
+    if path is None:
+      raise IOError('No cpu cgroup for container %s' % docker_id)
+    try:
+      if self.unified:
+        weight = 1 + ((shares - 2) * 9999) // 262142
+        with open(os.path.join(path, 'cpu.weight'), 'w') as _:
+          _.write('%d' % weight)
+      else:
+        with open(os.path.join(path, 'cpu.shares'), 'w') as _:
+          _.write('%d' % shares)
+    except (IOError, OSError):
+      # container exited or moved, look it up again next time
+      self.paths.pop(docker_id, None)
+      raise IOError('Cannot write shares for container %s' % docker_id)
+
+
+class CgroupTasks(Cgroup):
+  """This class lists the tasks (threads) of containers, e.g. to move them
+     into a resctrl group.
+  """
+  def __init__(self, root='/sys/fs/cgroup'):
+    super(CgroupTasks, self).__init__(root, 'cpu')
+
+
+  def tasks(self, docker_id):
+    """ Returns the thread ids of a container, as strings
+        Raises IOError if the container cgroup cannot be found or read
+    """
+    path = self.findCgroup(docker_id)
+    if path is None:
+      raise IOError('No cpu cgroup for container %s' % docker_id)
+    try:
+      with open(os.path.join(path, 'cgroup.threads' if self.unified else 'tasks')) as _:
+        return _.read().split()
+    except (IOError, OSError):
+      # container exited or moved, look it up again next time
+      self.paths.pop(docker_id, None)
+      raise IOError('Cannot read tasks of container %s' % docker_id)
@@ -0,0 +1,214 @@
+"""
+Container table class
+
+Current assumptions:
+- The table outlives container records: records are rebuilt on docker
+  events (or every cycle without them), rows only change when containers
+  start, change class or stop
+- Policies only change desired shares; the actuator reports applied ones
+
+"""
+
+__author__ = "Christos Kozyrakis"
+__email__ = "christos@hyperpilot.io"
+__copyright__ = "Copyright 2017, HyperPilot Inc"
+
+import threading
+import numpy as np
+
+# rows allocated up front; the table doubles when it runs out
+CAPACITY = 64
+
+
+class ContainerTable(object):
+  """This class keeps the class, desired and applied cpu shares of all known
+     containers as parallel arrays, so that policies evaluate all BE
+     containers in one vectorized pass.
+
+     The table persists across cycles. The container inventory adds rows as
+     containers start, replaces their records as they change and frees rows
+     as they stop; freed rows are reused. Policy methods change desired
+     shares in place and return the indices that changed, and pending() hands
+     the rows whose desired and applied shares differ to the actuator, so a
+     cycle does no per container work unless shares move.
+
+     With docker_applied, new records of a known container also bring the
+     applied shares docker reports. Shares written straight to the cgroup
+     bypass docker, so then only the actuator changes applied shares.
+  """
+  def __init__(self, min_shares, docker_applied=True, capacity=CAPACITY):
+    self.min_shares = min_shares
+    self.docker_applied = docker_applied
+    self.lock = threading.RLock()
+    self.index = {}
+    self.records = [None] * capacity
+    self.free = range(capacity - 1, -1, -1)
+    self.used = np.zeros(capacity, np.bool_)
+    self.be = np.zeros(capacity, np.bool_)
+    self.shares = np.zeros(capacity, np.int64)
+    self.applied = np.zeros(capacity, np.int64)
+
+
+  def expand(self):
+    """ Doubles the number of rows
+    """
+    capacity = len(self.records)
+    self.records.extend([None] * capacity)
+    self.free.extend(range(2 * capacity - 1, capacity - 1, -1))
+    self.used = np.concatenate((self.used, np.zeros(capacity, np.bool_)))
+    self.be = np.concatenate((self.be, np.zeros(capacity, np.bool_)))
+    self.shares = np.concatenate((self.shares, np.zeros(capacity, np.int64)))
+    self.applied = np.concatenate((self.applied, np.zeros(capacity, np.int64)))
+
+
+  def add(self, cont):
+    """ Adds the record of a container, or replaces the one it had
+        A new container starts from the shares docker reports, raised to
+        min_shares by the next actuation; a known one keeps its desired
+        shares, and its applied ones unless docker reports them
+    """
+    with self.lock:
+      row = self.index.get(cont.docker_id)
+      if row is None:
+        if not self.free:
+          self.expand()
+        row = self.free.pop()
+        self.index[cont.docker_id] = row
+        self.used[row] = True
+        self.shares[row] = max(cont.docker_shares, self.min_shares)
+        self.applied[row] = cont.docker_shares
+      elif self.docker_applied:
+        self.applied[row] = cont.docker_shares
+      self.records[row] = cont
+      self.be[row] = (cont.wclass == 'BE')
+      return row
+
+
+  def remove(self, docker_id):
+    """ Frees the row of a container
+    """
+    with self.lock:
+      row = self.index.pop(docker_id, None)
+      if row is None:
+        return
+      self.records[row] = None
+      self.used[row] = self.be[row] = False
+      self.shares[row] = self.applied[row] = 0
+      self.free.append(row)
+
+
+  def sync(self, containers):
+    """ Makes the table hold exactly the records of containers
+    """
+    with self.lock:
+      for docker_id in [_ for _ in self.index if _ not in containers]:
+        self.remove(docker_id)
+      for _, cont in containers.items():
+        self.add(cont)
+
+
+  def setClass(self, docker_id, wclass):
+    """ Records a class change of a container
+    """
+    with self.lock:
+      row = self.index.get(docker_id)
+      if row is not None:
+        self.be[row] = (wclass == 'BE')
+
+
+  def totals(self):
+    """ Returns the number and total shares of HP and BE containers
+    """
+    with self.lock:
+      hp = self.used & ~self.be
+      return int(hp.sum()), int(self.shares[hp].sum()), \
+             int(self.be.sum()), int(self.shares[self.be].sum())
+
+
+  def sharesOf(self, docker_id):
+    """ Desired shares of a container, None if unknown
+    """
+    with self.lock:
+      row = self.index.get(docker_id)
+      return None if row is None else int(self.shares[row])
+
+
+  def indices(self, containers):
+    """ Indices of the given container records that are in the table
+    """
+    with self.lock:
+      rows = [self.index[cont.docker_id] for cont in containers if cont.docker_id in self.index]
+      return np.array(rows, np.intp)
+
+
+  def update(self, rows, new_shares):
+    """ Sets the shares of rows and returns the indices that changed
+    """
+    diff = (new_shares != self.shares[rows])
+    changed = rows[diff]
+    self.shares[changed] = new_shares[diff]
+    return changed
+
+
+  def grow(self, rate):
+    """ Grows the shares of all BE containers by rate; shares too small to
+        grow by rate are doubled
+    """
+    with self.lock:
+      rows = np.flatnonzero(self.be)
+      shares = self.shares[rows]
+      new_shares = (rate * shares).astype(np.int64)
+      stuck = (new_shares == shares)
+      new_shares[stuck] = 2 * shares[stuck]
+      return self.update(rows, new_shares)
+
+
+  def shrink(self, rate, min_shares, rows=None):
+    """ Shrinks the shares of BE containers (or of rows) by rate, down to
+        min_shares; shares too small to shrink by rate are halved
+    """
+    with self.lock:
+      if rows is None:
+        rows = np.flatnonzero(self.be)
+      shares = self.shares[rows]
+      new_shares = (rate * shares).astype(np.int64)
+      stuck = (new_shares == shares)
+      new_shares[stuck] = shares[stuck] // 2
+      np.maximum(new_shares, min_shares, out=new_shares)
+      return self.update(rows, new_shares)
+
+
+  def scale(self, total, min_shares, rows=None):
+    """ Scales the shares of BE containers (or of rows) by a common factor,
+        so that all BE shares add up to total, down to min_shares
+    """
+    with self.lock:
+      if rows is None:
+        rows = np.flatnonzero(self.be)
+      shares = self.shares[rows]
+      if not shares.sum():
+        return rows[:0]
+      # BE shares outside rows stay as they are
+      others = self.shares[self.be].sum() - shares.sum()
+      factor = max(total - others, 0) / float(shares.sum())
+      new_shares = (factor * shares).astype(np.int64)
+      np.maximum(new_shares, min_shares, out=new_shares)
+      return self.update(rows, new_shares)
+
+
+  def pending(self):
+    """ Returns (record, desired shares) of the containers whose desired
+        shares are not applied yet
+    """
+    with self.lock:
+      rows = np.flatnonzero(self.used & (self.shares != self.applied))
+      return [(self.records[i], int(self.shares[i])) for i in rows]
+
+
+  def setApplied(self, docker_id, shares):
+    """ Records shares written to a container, unless it has gone
+    """
+    with self.lock:
+      row = self.index.get(docker_id)
+      if row is not None:
+        self.applied[row] = shares
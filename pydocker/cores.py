@@ -0,0 +1,141 @@
+"""
+CPU core partitioning classes
+
+Current assumptions:
+- Online CPUs do not change while the controller runs
+- Hyperthread siblings are listed in sysfs for every online CPU
+
+"""
+
+__author__ = "Christos Kozyrakis"
+__email__ = "christos@hyperpilot.io"
+__copyright__ = "Copyright 2017, HyperPilot Inc"
+
+import os
+
+# default CFS period, in usec
+CFS_PERIOD = 100000
+# smallest quota the kernel accepts, in usec
+MIN_CFS_QUOTA = 1000
+
+
+def ParseCpuList(text):
+  """ Parses a kernel CPU list such as 0-3,8,10-11
+  """
+  cpus = []
+  for part in text.strip().split(','):
+    if not part:
+      continue
+    if '-' in part:
+      first, last = part.split('-')
+      cpus.extend(range(int(first), int(last) + 1))
+    else:
+      cpus.append(int(part))
+  return cpus
+
+
+def FormatCpuList(cpus):
+  """ Formats CPUs as a kernel CPU list, merging consecutive ones
+  """
+  ranges = []
+  for cpu in sorted(cpus):
+    if ranges and ranges[-1][1] == cpu - 1:
+      ranges[-1][1] = cpu
+    else:
+      ranges.append([cpu, cpu])
+  return ','.join(str(a) if a == b else '%d-%d' % (a, b) for a, b in ranges)
+
+
+class CpuTopology(object):
+  """This class lists the physical cores of the node.
+
+     Each core is the tuple of its hyperthread siblings, so that cores can be
+     handed out whole. Cores are ordered by socket and core id.
+
+     Useful documents:
+      - Linux CPU topology
+        https://www.kernel.org/doc/Documentation/cputopology.txt
+  """
+  def __init__(self, root='/sys/devices/system/cpu'):
+    self.root = root
+    self.cores = self.read()
+
+
+  def readFile(self, cpu, name):
+    """ Reads one topology attribute of a CPU
+    """
+    with open(os.path.join(self.root, 'cpu%d' % cpu, 'topology', name)) as _:
+      return _.read().strip()
+
+
+  def read(self):
+    """ Groups online CPUs into physical cores
+    """
+    with open(os.path.join(self.root, 'online')) as _:
+      online = ParseCpuList(_.read())
+    cores = {}
+    for cpu in online:
+      siblings = tuple(_ for _ in ParseCpuList(self.readFile(cpu, 'thread_siblings_list')) \
+                       if _ in online)
+      key = (int(self.readFile(cpu, 'physical_package_id')), int(self.readFile(cpu, 'core_id')))
+      cores[key] = siblings
+    return [cores[_] for _ in sorted(cores)]
+
+
+class CorePartition(object):
+  """This class splits the physical cores of the node between HP and BE.
+
+     BE cores are taken whole from the end of the core list, the last socket
+     first, so BE threads never share a core, and as long as possible a
+     socket, with HP threads. HP gets the complement. The BE allocation grows
+     and shrinks one core at a time between min_be_cores and all cores but
+     min_hp_cores.
+  """
+  def __init__(self, topology, min_hp_cores=1, min_be_cores=1):
+    self.cores = topology.cores
+    if len(self.cores) < min_hp_cores + max(1, min_be_cores):
+      raise ValueError('Not enough cores to partition: %d' % len(self.cores))
+    self.min_be_cores = max(1, min_be_cores)
+    self.max_be_cores = len(self.cores) - min_hp_cores
+    self.be_cores = self.min_be_cores
+
+
+  def grow(self):
+    """ Gives one more core to BE
+    """
+    self.be_cores = min(self.be_cores + 1, self.max_be_cores)
+
+
+  def shrink(self):
+    """ Takes one core back from BE
+    """
+    self.be_cores = max(self.be_cores - 1, self.min_be_cores)
+
+
+  def reset(self):
+    """ Returns BE to its smallest allocation
+    """
+    self.be_cores = self.min_be_cores
+
+
+  def beCpus(self):
+    """ CPUs of the BE cores
+    """
+    split = len(self.cores) - self.be_cores
+    return [cpu for core in self.cores[split:] for cpu in core]
+
+
+  def hpCpus(self):
+    """ CPUs of the HP cores
+    """
+    split = len(self.cores) - self.be_cores
+    return [cpu for core in self.cores[:split] for cpu in core]
+
+
+  def beQuota(self, containers):
+    """ CFS quota of each of containers BE containers, so that together
+        they get no more CPU time than the BE cores
+    """
+    if containers == 0:
+      return -1
+    return max(MIN_CFS_QUOTA, len(self.beCpus()) * CFS_PERIOD / containers)
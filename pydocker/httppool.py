@@ -0,0 +1,122 @@
+"""
+HTTP client class
+
+Current assumptions:
+- Polled endpoints are few and fixed (kubelet, QoS data store)
+- Responses fit in memory unless a streaming writer is given
+
+"""
+
+__author__ = "Christos Kozyrakis"
+__email__ = "christos@hyperpilot.io"
+__copyright__ = "Copyright 2017, HyperPilot Inc"
+
+# standard
+import threading
+from io import BytesIO
+import pycurl
+
+
+class HttpPool(object):
+  """This class fetches URLs over persistent connections with bounded time.
+
+     All transfers go through a single CurlMulti handle, which owns the
+     connection and DNS caches, so consecutive polls of the same endpoint
+     reuse the TCP connection. Several URLs can be fetched concurrently in
+     one call. Every transfer has a connect timeout and an overall timeout,
+     so a hung endpoint cannot stall the control loop.
+
+     Useful documents:
+      - libcurl multi interface
+        https://curl.haxx.se/libcurl/c/libcurl-multi.html
+  """
+  def __init__(self, connect_timeout=1.0, timeout=2.0):
+    self.connect_timeout = connect_timeout
+    self.timeout = timeout
+    self.multi = pycurl.CurlMulti()
+    self.handles = {}
+    self.lock = threading.Lock()
+
+
+  def handle(self, url):
+    """ Returns the (cached) easy handle of a URL
+    """
+    if url not in self.handles:
+      _ = pycurl.Curl()
+      _.setopt(_.URL, url)
+      _.setopt(_.NOSIGNAL, 1)
+      _.setopt(_.CONNECTTIMEOUT_MS, int(self.connect_timeout * 1000))
+      _.setopt(_.TIMEOUT_MS, int(self.timeout * 1000))
+      _.setopt(_.DNS_CACHE_TIMEOUT, 300)
+      self.handles[url] = _
+    return self.handles[url]
+
+
+  def getAll(self, urls, writers=None):
+    """ Fetches URLs concurrently
+        writers optionally maps a URL to a function that consumes the body
+        in chunks instead of buffering it; it may return 0 to stop early
+        Returns ({url: body}, {url: error message}); streamed URLs that
+        succeed (or stop early) get an empty body
+    """
+    writers = writers or {}
+    bodies = {}
+    errors = {}
+    with self.lock:
+      buffers = {}
+      owners = {}
+      for url in urls:
+        _ = self.handle(url)
+        owners[_] = url
+        if url in writers:
+          _.setopt(_.WRITEFUNCTION, writers[url])
+        else:
+          buffers[url] = BytesIO()
+          _.setopt(_.WRITEFUNCTION, buffers[url].write)
+        self.multi.add_handle(_)
+
+      # run all transfers to completion
+      pending = len(urls)
+      while pending:
+        while 1:
+          ret, _ = self.multi.perform()
+          if ret != pycurl.E_CALL_MULTI_PERFORM:
+            break
+        while 1:
+          queued, done, failed = self.multi.info_read()
+          for _ in done:
+            pending -= 1
+          for _, errno, errmsg in failed:
+            pending -= 1
+            url = owners[_]
+            # a writer returning 0 aborts the transfer on purpose
+            if errno != pycurl.E_WRITE_ERROR or url not in writers:
+              errors[url] = errmsg
+          if queued == 0:
+            break
+        if pending:
+          self.multi.select(0.1)
+
+      for url in urls:
+        _ = self.handles[url]
+        self.multi.remove_handle(_)
+        if url in errors:
+          continue
+        status = _.getinfo(pycurl.RESPONSE_CODE)
+        if status != 200:
+          errors[url] = 'HTTP status %d' % status
+        elif url in buffers:
+          bodies[url] = buffers[url].getvalue()
+        else:
+          bodies[url] = ''
+    return bodies, errors
+
+
+  def get(self, url, writer=None):
+    """ Fetches one URL, raising pycurl.error on failure
+    """
+    writers = {url: writer} if writer is not None else None
+    bodies, errors = self.getAll([url], writers)
+    if url in errors:
+      raise pycurl.error(errors[url])
+    return bodies[url]
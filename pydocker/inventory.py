@@ -0,0 +1,174 @@
+"""
+Container inventory class
+
+Current assumptions:
+- Container class labels do not change while a container runs
+- Docker emits an update event whenever cpu shares are changed through it
+
+"""
+
+__author__ = "Christos Kozyrakis"
+__email__ = "christos@hyperpilot.io"
+__copyright__ = "Copyright 2017, HyperPilot Inc"
+
+# standard
+import time
+import calendar
+import threading
+import requests
+import docker
+
+# hyperpilot imports
+import settings as st
+
+
+def NetWeight(label):
+  """ Parses a hyperpilot.io/net-weight label, defaulting to 1.0
+  """
+  try:
+    return max(0.0, float(label))
+  except ValueError:
+    return 1.0
+
+
+def StartedAt(attrs):
+  """ Parses the start time of a container, 0.0 if unknown
+  """
+  try:
+    started = attrs['State']['StartedAt'][:19]
+    return float(calendar.timegm(time.strptime(started, '%Y-%m-%dT%H:%M:%S')))
+  except (KeyError, TypeError, ValueError):
+    return 0.0
+
+
+def MakeContainer(cont):
+  """ Creates the tracking record of a docker container
+  """
+  _ = st.Container()
+  _.docker_id = cont.id
+  _.docker_name = cont.name
+  _.docker = cont
+  _.started_at = StartedAt(cont.attrs)
+  # check container shares
+  _.docker_shares = cont.attrs['HostConfig']['CpuShares']
+  # check container cores, left alone unless core isolation is on
+  _.applied_cpuset_cpus = cont.attrs['HostConfig'].get('CpusetCpus') or ''
+  _.cpuset_cpus = _.applied_cpuset_cpus
+  _.applied_cpu_quota = cont.attrs['HostConfig'].get('CpuQuota') or 0
+  _.cpu_quota = _.applied_cpu_quota
+  # check container class
+  if 'hyperpilot.io/wclass' in cont.attrs['Config']['Labels']:
+    _.wclass = cont.attrs['Config']['Labels']['hyperpilot.io/wclass']
+  if 'hyperpilot.io/net-weight' in cont.attrs['Config']['Labels']:
+    _.net_weight = NetWeight(cont.attrs['Config']['Labels']['hyperpilot.io/net-weight'])
+  return _
+
+
+class ContainerInventory(object):
+  """This class keeps the set of active containers up to date from the docker
+     events stream, so that the control loop does not list all containers
+     every cycle.
+
+     The inventory is seeded once with a full listing. After that, start and
+     update events (re)read a single container, while die and destroy events
+     drop it. If the events stream breaks, the inventory is seeded again.
+     The container table follows the inventory, row by row.
+
+     Useful documents:
+      - Docker events
+        https://docs.docker.com/engine/reference/commandline/events/
+  """
+  def __init__(self, denv, table):
+    self.denv = denv
+    self.table = table
+    self.lock = threading.Lock()
+    self.containers = {}
+
+
+  def seed(self):
+    """ Rebuilds the inventory from a full container listing
+    """
+    containers = {}
+    for cont in self.denv.containers.list():
+      try:
+        _ = MakeContainer(cont)
+        containers[_.docker_id] = _
+      except docker.errors.APIError:
+        print "Problem with docker container"
+    with self.lock:
+      self.containers = containers
+      self.table.sync(containers)
+
+
+  def start(self):
+    """ Seeds the inventory and starts following docker events
+    """
+    events = self.denv.events(decode=True, filters={'type': 'container'})
+    self.seed()
+    watcher = threading.Thread(name='ContainerInventory', target=self.watch, args=(events,))
+    watcher.setDaemon(True)
+    watcher.start()
+
+
+  def watch(self, events):
+    """ Applies docker events to the inventory, forever
+    """
+    while 1:
+      try:
+        for event in events:
+          self.handle(event)
+      except (docker.errors.APIError, requests.exceptions.RequestException):
+        print "Docker events stream lost, reseeding inventory"
+      # the stream should never end, open it again before reseeding so
+      # that no event falls in between
+      while 1:
+        try:
+          events = self.denv.events(decode=True, filters={'type': 'container'})
+          self.seed()
+          break
+        except (docker.errors.APIError, requests.exceptions.RequestException):
+          time.sleep(1)
+
+
+  def handle(self, event):
+    """ Applies a single docker event to the inventory
+    """
+    status = event.get('status', event.get('Action'))
+    cid = event.get('id')
+    if status in ('start', 'update'):
+      try:
+        _ = MakeContainer(self.denv.containers.get(cid))
+      except docker.errors.NotFound:
+        self.forget(cid)
+        return
+      except docker.errors.APIError:
+        print "Problem with docker container %s" % cid
+        return
+      with self.lock:
+        # keep the k8s classification of containers we already know
+        if cid in self.containers:
+          old = self.containers[cid]
+          _.wclass = old.wclass
+          _.k8s_pod_name = old.k8s_pod_name
+          _.k8s_namespace = old.k8s_namespace
+          _.ipaddress = old.ipaddress
+          _.net_weight = old.net_weight
+        self.containers[cid] = _
+        self.table.add(_)
+    elif status in ('die', 'destroy'):
+      self.forget(cid)
+
+
+  def forget(self, cid):
+    """ Drops a container from the inventory
+    """
+    with self.lock:
+      self.containers.pop(cid, None)
+      self.table.remove(cid)
+
+
+  def snapshot(self):
+    """ Returns a consistent copy of the active containers
+    """
+    with self.lock:
+      return dict(self.containers)
@@ -0,0 +1,144 @@
+"""
+Packet marking backends for NetClass
+
+Current assumptions:
+- Each BE container has its own IP address
+- The controller owns the mangle table
+
+"""
+
+__author__ = "Christos Kozyrakis"
+__email__ = "christos@hyperpilot.io"
+__copyright__ = "Copyright 2017, HyperPilot Inc"
+
+import subprocess
+
+
+def SaveMarks():
+  """ Copies packet marks to their connection, so that they can be restored
+      on inbound packets (see NetClass ingress shaping)
+  """
+  try:
+    subprocess.check_call(('iptables -t mangle -A POSTROUTING -j CONNMARK --save-mark').split())
+  except subprocess.CalledProcessError:
+    raise Exception('Could not save marks to conntrack')
+
+
+class IptablesMarker(object):
+  """This backend appends one mangle rule per container IP. Every packet walks
+     the rule list, and every change rewrites the table.
+  """
+  def __init__(self, iface_cont):
+    self.iface_cont = iface_cont
+    self.marks = {}
+
+
+  def reset(self):
+    """ Removes all marking rules
+    """
+    try:
+      subprocess.check_call(('iptables -t mangle -F').split())
+    except subprocess.CalledProcessError:
+      raise Exception('Could not reset iptables')
+    self.marks = {}
+
+
+  def saveMarks(self):
+    SaveMarks()
+
+
+  def update(self, add_marks, remove_ips):
+    """ Marks the packets of the IPs in add_marks ({ip: mark}) and stops
+        marking remove_ips
+    """
+    for cont_ip, mark in add_marks.items():
+      try:
+        subprocess.check_call(('iptables -t mangle -A PREROUTING -i %s -s %s -j MARK --set-mark %d' \
+                                 % (self.iface_cont, cont_ip, mark)).split())
+      except subprocess.CalledProcessError:
+        raise Exception('Could not add iptable filter for %s' % cont_ip)
+      self.marks[cont_ip] = mark
+    for cont_ip in remove_ips:
+      try:
+        subprocess.check_call(('iptables -t mangle -D PREROUTING -i %s -s %s -j MARK --set-mark %d' \
+                                 % (self.iface_cont, cont_ip, self.marks.pop(cont_ip))).split())
+      except subprocess.CalledProcessError:
+        raise Exception('Could not remove iptable filter for %s' % cont_ip)
+
+
+class IpsetMarker(object):
+  """This backend keeps container IPs in a hash:ip ipset matched by a single
+     mangle rule, so lookups are O(1) per packet and membership changes are
+     applied in one 'ipset restore' batch. The mark of each IP is stored in
+     the set entry (skbinfo extension) and applied by the SET target.
+
+     Useful documents:
+      - ipset
+        http://ipset.netfilter.org/ipset.man.html
+  """
+  def __init__(self, iface_cont, set_name='hyperpilot-be'):
+    self.iface_cont = iface_cont
+    self.set_name = set_name
+
+
+  def reset(self):
+    """ Recreates an empty set and the single rule that marks its members
+    """
+    try:
+      subprocess.check_call(('iptables -t mangle -F').split())
+      subprocess.check_call(('ipset create %s hash:ip skbinfo -exist' % self.set_name).split())
+      subprocess.check_call(('ipset flush %s' % self.set_name).split())
+      subprocess.check_call(('iptables -t mangle -A PREROUTING -i %s -j SET --map-set %s src --map-mark' \
+                               % (self.iface_cont, self.set_name)).split())
+    except subprocess.CalledProcessError:
+      raise Exception('Could not setup ipset %s' % self.set_name)
+
+
+  def saveMarks(self):
+    SaveMarks()
+
+
+  def update(self, add_marks, remove_ips):
+    """ Marks the packets of the IPs in add_marks ({ip: mark}) and stops
+        marking remove_ips
+    """
+    batch = ['add %s %s skbmark 0x%x' % (self.set_name, ip, mark) for ip, mark in add_marks.items()] + \
+            ['del %s %s' % (self.set_name, _) for _ in remove_ips]
+    if not batch:
+      return
+    process = subprocess.Popen(('ipset restore -exist').split(), stdin=subprocess.PIPE, \
+                               stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    output, _ = process.communicate('\n'.join(batch) + '\n')
+    if process.returncode != 0:
+      raise Exception('Could not update ipset %s: %s' % (self.set_name, output))
+
+
+class FakeMarker(object):
+  """This backend only records the marks of IPs, for tests and simulation.
+  """
+  def __init__(self, iface_cont):
+    self.marks = {}
+
+
+  def reset(self):
+    self.marks = {}
+
+
+  def saveMarks(self):
+    pass
+
+
+  def update(self, add_marks, remove_ips):
+    self.marks.update(add_marks)
+    for _ in remove_ips:
+      self.marks.pop(_, None)
+
+
+def MakeMarker(name, iface_cont):
+  """ Returns the marking backend called name
+  """
+  if name == 'fake':
+    return FakeMarker(iface_cont)
+  if name == 'ipset':
+    return IpsetMarker(iface_cont)
+  return IptablesMarker(iface_cont)
@@ -3,6 +3,10 @@
 """
 An infininite loop program that continuously tests if some numbers
 are prime and reports the time it took to calculate
+
+Current assumptions:
+- CPU antagonist: workers only use the core they run on
+
 """
 
 __author__ = "Christos Kozyrakis"
@@ -12,10 +16,10 @@ __copyright__ = "Copyright 2017, HyperPilot Inc"
 
 # Standard
 import math
-from datetime import datetime as dt
-# External
+# Local
+import antagonist
 
-N = 150
+NUMBERS = (100000015021, 100000015019)
 
 def IsPrime(number):
   if number == 2:
@@ -28,16 +32,19 @@ def IsPrime(number):
       return False
   return True
 
+def Setup(args):
+  """ Step of one worker: tests all numbers, returns the primes tested
+  """
+  def Step():
+    for number in NUMBERS:
+      IsPrime(number)
+    return len(NUMBERS)
+  return Step
+
 def main():
-  while 1:
-    time1 = dt.now()
-    for _ in range(0, N):
-      IsPrime(100000015021)
-      IsPrime(100000015019)
-      time2 = dt.now()
-      delta = time2 - time1
-    pps = float((N*2*1000000)) / float((delta.seconds*1000000 + delta.microseconds))
-    print "Primes per second = %0.2f" %(pps)
+  parser = antagonist.Parser("CPU antagonist: tests primes")
+  args = antagonist.ParseArgs(parser)
+  antagonist.Run(args, Setup, 'primes')
 
 if __name__ == "__main__":
   main()
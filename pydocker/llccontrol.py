@@ -0,0 +1,97 @@
+"""
+Cache and memory bandwidth controller
+
+Current assumptions:
+- Manual entry of the memory bandwidth the node can sustain (MB/s)
+- BE threads forked after a cycle inherit the BE group from their parent;
+  tasks of newly started containers are moved at the next cycle
+
+"""
+
+__author__ = "Christos Kozyrakis"
+__email__ = "christos@hyperpilot.io"
+__copyright__ = "Copyright 2017, HyperPilot Inc"
+
+# standard
+import time
+from datetime import datetime as dt
+
+# hyperpilot imports
+import settings as st
+import resctrl
+import cgroup
+
+
+def LlcControll():
+  """ Cache and memory bandwidth controller
+  """
+  # initialize controller
+  try:
+    rc = resctrl.Resctrl(st.params['resctrl_root'], st.params['resctrl_group'])
+    rc.create()
+  except (IOError, OSError, ValueError) as e:
+    print "Cannot use resctrl, LLC controller exiting: %s" % e
+    return
+  tasks = cgroup.CgroupTasks(st.params['cgroup_root'])
+  min_ways = max(rc.min_ways, st.params['llc_min_be_ways'])
+  max_ways = rc.ways - max(rc.min_ways, st.params['llc_min_hp_ways'])
+  if max_ways < min_ways:
+    print "Not enough cache ways to partition, LLC controller exiting"
+    return
+  max_mem_bw = st.params['max_mem_bw_mbytes']
+  if st.verbose:
+    print "Starting LlcControl (%d ways, MBA %s, %f)" % (rc.ways, rc.mba, max_mem_bw)
+  be_ways = min_ways
+  be_mba = rc.min_mba
+  period = st.params['llc_period']
+  snapshot = st.node.snapshots.current
+  last = None
+  cycle = 0
+  # control loop
+  while 1:
+
+    # move the tasks of BE containers into the BE group; not by IP, since
+    # containers of a pod (and all containers without K8S) share one
+    moved = 0
+    for _, cont in snapshot.containers.items():
+      if cont.wclass != 'BE':
+        continue
+      try:
+        moved += rc.addTasks(tasks.tasks(cont.docker_id))
+      except IOError:
+        print "Cannot move tasks of container %s" % cont.docker_name
+
+    # memory bandwidth of each group since the last cycle
+    now = time.time()
+    sample = (now, rc.hpBytes(), rc.beBytes())
+    hp_bw = be_bw = None
+    if last is not None and None not in sample[1:] and None not in last[1:]:
+      hp_bw = (sample[1] - last[1]) / (1E6 * (now - last[0]))
+      be_bw = (sample[2] - last[2]) / (1E6 * (now - last[0]))
+    last = sample
+    over_bw = max_mem_bw > 0.0 and hp_bw is not None and hp_bw + be_bw > max_mem_bw
+    under_bw = max_mem_bw <= 0.0 or (hp_bw is not None and hp_bw + be_bw < 0.9 * max_mem_bw)
+
+    # actual controller
+    slack = st.node.slo.current(st.params['slo_max_age'])
+    if slack < st.params['slack_threshold_shrink']:
+      be_ways = max(min_ways, be_ways - 1)
+    if slack < 0.0 or over_bw:
+      be_mba = max(rc.min_mba, be_mba - rc.mba_step)
+    elif slack > st.params['slack_threshold_grow'] and under_bw:
+      be_ways = min(max_ways, be_ways + 1)
+      be_mba = min(100, be_mba + rc.mba_step)
+    try:
+      rc.setAllocation(be_ways, be_mba)
+    except IOError as e:
+      print "Cannot write resctrl schemata: %s" % e
+
+    # loop
+    if st.verbose:
+      print "LLC controller ", cycle, " at ", dt.now().strftime('%H:%M:%S')
+      print " BE: %d ways, MBA %d%%, %d tasks moved" % (be_ways, be_mba, moved)
+      if hp_bw is not None:
+        print " Mem BW: %f MB/s (HP), %f MB/s (BE)" % (hp_bw, be_bw)
+    cycle += 1
+    # early when the set of BE containers changes
+    snapshot = st.node.snapshots.wait(snapshot.be_version, period)
@@ -2,7 +2,7 @@
 Dynamic CPU shares controller based on the Heracles design
 
 Current pitfalls:
-- when shrinking, we penalize all BE containers instead of killing 1-2 of them
+- victims are ranked on network rates that may be a network period old
 
 TODO
 - validate CPU usage measurements
@@ -15,85 +15,105 @@ __copyright__ = "Copyright 2017, HyperPilot Inc"
 
 # standard
 import time
+import math
 from datetime import datetime as dt
 import sys
 import json
 import argparse
 import os.path
 import os
-from io import BytesIO
-import subprocess
 import threading
+import multiprocessing
+from multiprocessing.pool import ThreadPool
 import pycurl
+import requests
+import urllib3
 import docker
 from kubernetes import client, config
 from kubernetes.client.rest import ApiException
 
 # hyperpilot imports
 import settings as st
+import cgroup
+import inventory
+import podcache
+import actuator
 import netcontrol as net
+import llccontrol as llc
+import httppool
+import summaryscan
+import scheduler
+import slosource
+import victims
+import cores
+import metrics
+import snapshot
+import containertable
+import policy
+
+QOSDS_URL = 'http://qos-data-store:7781/v1/apps/metrics'
+
+# shares controller metrics
+PHASE_SECONDS = metrics.Histogram('hyperpilot_shares_phase_seconds', \
+                                  'Time spent in each phase of a shares control cycle', ('phase',))
+CYCLE_SECONDS = metrics.Histogram('hyperpilot_shares_cycle_seconds', \
+                                  'Duration of shares control cycles')
+ACTUATIONS = metrics.Histogram('hyperpilot_shares_actuations', \
+                               'Container updates per shares control cycle', \
+                               buckets=(0, 1, 2, 5, 10, 20, 50, 100, 200, 500))
+DECISIONS = metrics.Counter('hyperpilot_shares_decisions_total', \
+                            'Shares control cycles by decision', ('decision',))
+CONTAINERS = metrics.Gauge('hyperpilot_containers', 'Active containers by class', ('wclass',))
+SHARES = metrics.Gauge('hyperpilot_shares', 'Total CPU shares by class', ('wclass',))
+SLO_SLACK = metrics.Gauge('hyperpilot_slo_slack', 'SLO slack of the QoS app')
+CPU_USAGE = metrics.Gauge('hyperpilot_cpu_usage', 'CPU load used by the shares controller')
 
 
 def ActiveContainers():
   """ Identifies active containers in a docker environment.
   """
-  min_shares = st.params['min_shares']
-  active_containers = {}
-  stats = st.ControllerStats()
-
-  # read container list from docker
-  try:
-    containers = st.node.denv.containers.list()
-  except docker.errors.APIError:
-    print "Cannot communicate with docker daemon, terminating."
-    sys.exit(-1)
-
-  for cont in containers:
+  if st.node.inventory is not None:
+    # kept up to date from docker events
+    active_containers = st.node.inventory.snapshot()
+  else:
+    # read container list from docker
+    active_containers = {}
     try:
-      _ = st.Container()
-      _.docker_id = cont.id
-      _.docker_name = cont.name
-      _.docker = cont
-      # check container shares
-      _.shares = cont.attrs['HostConfig']['CpuShares']
-      if _.shares < min_shares:
-        _.shares = min_shares
-        cont.update(cpu_shares=_.shares)
-      # check container class
-      if 'hyperpilot.io/wclass' in cont.attrs['Config']['Labels']:
-        _.wclass = cont.attrs['Config']['Labels']['hyperpilot.io/wclass']
-      if _.wclass == 'HP':
-        stats.hp_cont += 1
-        stats.hp_shares += _.shares
-      else:
-        stats.be_cont += 1
-        stats.be_shares += _.shares
-      # append to dictionary of active containers
-      active_containers[_.docker_id] = _
+      containers = st.node.denv.containers.list()
     except docker.errors.APIError:
-      print "Problem with docker container"
+      print "Cannot communicate with docker daemon, terminating."
+      sys.exit(-1)
+    for cont in containers:
+      try:
+        _ = inventory.MakeContainer(cont)
+        active_containers[_.docker_id] = _
+      except docker.errors.APIError:
+        print "Problem with docker container"
+    st.node.table.sync(active_containers)
 
   # Check container class in K8S
   if st.k8sOn:
+    if st.node.pods is not None:
+      # node pods and QoS pods come from local watch-fed caches
+      be_pods = [pod for pod in st.node.pods.pods() \
+                 if (pod.metadata.labels or {}).get('hyperpilot.io/wclass') == 'BE']
+      ClassifyBE(active_containers, be_pods)
+      qos_pods = st.node.qos_pods.pods()
+      if len(qos_pods) > 1:
+        print "Multiple QoS tracked workloads, ignoring all but first"
+      try:
+        st.node.qos_app = qos_pods[0].status.container_statuses[0].name
+      except (TypeError, IndexError):
+        print "Cannot find QoS service name"
+      return active_containers, ClassStats()
+
     # get all best effort pods
     label_selector = 'hyperpilot.io/wclass = BE'
     try:
       pods = st.node.kenv.list_pod_for_all_namespaces(watch=False,\
                                             label_selector=label_selector)
-      for pod in pods.items:
-        if pod.spec.node_name == st.node.name:
-          for cont in pod.status.container_statuses:
-            cid = cont.container_id[len('docker://'):]
-            if cid in active_containers:
-              if  active_containers[cid].wclass == 'HP':
-                active_containers[cid].wclass = 'BE'
-                stats.be_cont += 1
-                stats.be_shares += active_containers[cid].shares
-                stats.hp_cont -= 1
-                stats.hp_shares -= active_containers[cid].shares
-              active_containers[cid].k8s_pod_name = pod.metadata.name
-              active_containers[cid].k8s_namespace = pod.metadata.namespace
-              active_containers[cid].ipaddress = pod.status.pod_ip
+      ClassifyBE(active_containers, \
+                 [pod for pod in pods.items if pod.spec.node_name == st.node.name])
     except (ApiException, TypeError, ValueError):
       print "Cannot talk to K8S API server, labels unknown."
     # get all best effort pods
@@ -107,177 +127,346 @@ def ActiveContainers():
     except (ApiException, TypeError, ValueError, IndexError):
       print "Cannot find QoS service name"
 
-  return active_containers, stats
+  return active_containers, ClassStats()
+
+
+def ClassStats():
+  """ Counts containers and their shares by class, from the container table
+  """
+  stats = st.ControllerStats()
+  stats.hp_cont, stats.hp_shares, stats.be_cont, stats.be_shares = st.node.table.totals()
+  return stats
+
+
+def ClassifyBE(active_containers, be_pods):
+  """ Marks the containers of local best effort pods as BE
+  """
+  for pod in be_pods:
+    for cont in pod.status.container_statuses or []:
+      if cont.container_id is None:
+        continue
+      cid = cont.container_id[len('docker://'):]
+      if cid in active_containers:
+        if  active_containers[cid].wclass == 'HP':
+          active_containers[cid].wclass = 'BE'
+          st.node.table.setClass(cid, 'BE')
+        active_containers[cid].k8s_pod_name = pod.metadata.name
+        active_containers[cid].k8s_namespace = pod.metadata.namespace
+        active_containers[cid].ipaddress = pod.status.pod_ip
+        labels = pod.metadata.labels or {}
+        if 'hyperpilot.io/net-weight' in labels:
+          active_containers[cid].net_weight = inventory.NetWeight(labels['hyperpilot.io/net-weight'])
+
+
+def ContainerCpuPercent(cont):
+  """ Reads one Docker stats sample for a container and returns its CPU usage
+      The percentages are system-wide, not scaled per core
+  """
+  percent = 0.0
+  new_stats = st.node.stats_api.stats(cont.docker_id, stream=False, decode=True)
+  new_cpu_stats = new_stats['cpu_stats']
+  past_cpu_stats = new_stats['precpu_stats']
+  cpu_delta = float(new_cpu_stats['cpu_usage']['total_usage']) - \
+              float(past_cpu_stats['cpu_usage']['total_usage'])
+  system_delta = float(new_cpu_stats['system_cpu_usage']) - \
+                 float(past_cpu_stats['system_cpu_usage'])
+  if (system_delta > 0.0) and (cpu_delta > 0.0):
+    percent = (cpu_delta / system_delta) * 100.0
+  return percent
 
 
 def CpuStatsDocker():
   """Calculates CPU usage statistics for each container using Docker APIs
+     Each stats call blocks for about a second, so calls are issued on a
+     bounded pool of workers. Containers whose call fails, or does not return
+     within stats_timeout, count as 0% for this cycle.
   """
-  cpu_usage = 0.0
+  timeout = st.params['stats_timeout']
+  pending = []
   for _, cont in st.active_containers.items():
+    pending.append((cont, st.node.stats_pool.apply_async(ContainerCpuPercent, (cont,))))
+
+  # collect results against a single deadline so that a backlog of slow
+  # calls cannot hold up the cycle for longer than the timeout
+  deadline = time.time() + timeout
+  cpu_usage = 0.0
+  for cont, result in pending:
     try:
+      percent = result.get(max(0.0, deadline - time.time()))
+    except multiprocessing.TimeoutError:
+      print "Timeout reading stats for docker container %s" % cont.docker_name
       percent = 0.0
-      new_stats = cont.docker.stats(stream=False, decode=True)
-      new_cpu_stats = new_stats['cpu_stats']
-      past_cpu_stats = new_stats['precpu_stats']
-      cpu_delta = float(new_cpu_stats['cpu_usage']['total_usage']) - \
-                  float(past_cpu_stats['cpu_usage']['total_usage'])
-      system_delta = float(new_cpu_stats['system_cpu_usage']) - \
-                     float(past_cpu_stats['system_cpu_usage'])
-      # The percentages are system-wide, not scaled per core
-      if (system_delta > 0.0) and (cpu_delta > 0.0):
-        percent = (cpu_delta / system_delta) * 100.0
-      cont.cpu_percent = percent
-      cpu_usage += percent
-    except docker.errors.APIError:
+    except (docker.errors.APIError, requests.exceptions.RequestException):
       print "Problem with docker container %s" % cont.docker_name
+      percent = 0.0
+    cont.cpu_percent = percent
+    cpu_usage += percent
   return cpu_usage
 
 
-def CpuStatsK8S():
-  """Calculates CPU usage statistics using K8S APIs
+def KubeletSummaryUrl():
+  """ URL of the kubelet stats summary, without per container stats
+  """
+  return 'http://' + st.node.name + ':10255/stats/summary?only_cpu_and_memory=true'
+
+
+def CpuStatsK8S(scanner=None):
+  """Calculates CPU usage statistics using K8S APIs, in percent of the node
+     scanner holds the stats summary, when it has already been fetched
+     With kubelet_pod_cpu, BE containers also get their pod CPU usage
   """
   try:
-    _ = pycurl.Curl()
-    data = BytesIO()
-    _.setopt(_.URL, st.node.name + ':10255/stats/summary')
-    _.setopt(_.WRITEFUNCTION, data.write)
-    _.perform()
-    output = json.loads(data.getvalue())
-    usage_nano_cores = output['node']['cpu']['usageNanoCores']
-    cpu_usage = usage_nano_cores / (st.node.cpu * 1E9)
-    return cpu_usage
+    if scanner is None:
+      scanner = summaryscan.SummaryScanner(st.params['kubelet_pod_cpu'])
+      st.node.http.get(KubeletSummaryUrl(), scanner.write)
+    if scanner.node_cpu is None:
+      raise ValueError('No node CPU in stats summary')
+    cpu_usage = scanner.node_cpu / (st.node.cpu * 1E9) * 100.0
   except (ValueError, pycurl.error)  as e:
     print "Problem calculating CpuStatsK8S ", e
     return 100.0
 
+  if scanner.want_pods:
+    # pod usage is split evenly among the pod containers we track
+    pod_containers = {}
+    for _, cont in st.active_containers.items():
+      if cont.wclass == 'BE' and cont.k8s_pod_name:
+        pod_containers.setdefault((cont.k8s_namespace, cont.k8s_pod_name), []).append(cont)
+    for pod, conts in pod_containers.items():
+      percent = scanner.pod_cpu.get(pod, 0) / (st.node.cpu * 1E9) * 100.0 / len(conts)
+      for cont in conts:
+        cont.cpu_percent = percent
+  return cpu_usage
+
+def CpuStatsCgroup():
+  """Calculates CPU usage statistics for each container from cgroup accounting
+     Usage is averaged over the time since the previous cycle
+  """
+  usage = st.node.cgroup.sample(st.active_containers.keys())
+  cpu_usage = 0.0
+  for cid, cont in st.active_containers.items():
+    cont.cpu_percent = usage[cid]
+    cpu_usage += cont.cpu_percent
+  return cpu_usage
+
+
 def CpuStats():
-  """ Calculates CPU usage statistics
+  """ Calculates CPU usage statistics, in percent of the node
   """
-  if st.k8sOn:
+  if st.params['cpu_stats'] == 'cgroup':
+    return CpuStatsCgroup()
+  elif st.params['cpu_stats'] == 'k8s':
     return CpuStatsK8S()
   else:
     return CpuStatsDocker()
 
 
-def SloSlackFile():
-  """ Read SLO slack from local file
+def SloSlack():
+  """ Returns the latest SLO slack, or 0.0 if it is missing or stale
   """
-  with open('slo_slack.txt') as _:
-    array = [[float(x) for x in line.split()] for line in _]
-  return array[0][0]
+  return st.node.slo.current(st.params['slo_max_age'])
 
 
-def SloSlackQoSDS(name):
-  """ Read SLO slack from QoS data store
+def SloViolation(slack):
+  """ Starts a control cycle as soon as a new slack value drops below the
+      shrink threshold
   """
-  print "  Getting SLO for ", name
-  try:
-    _ = pycurl.Curl()
-    data = BytesIO()
-    _.setopt(_.URL, 'qos-data-store:7781/v1/apps/metrics')
-    _.setopt(_.WRITEFUNCTION, data.write)
-    _.perform()
-    output = json.loads(data.getvalue())
-    if output['error']:
-      print "Problem accessing QoS data store"
-      return 0.0
-    if name not in output['data']:
-      print "QoS datastore does not track workload ", name
-      return 0.0
-    elif 'metrics' not in output['data'][name] or \
-       'slack' not in output['data'][name]['metrics']:
-      return 0.0
-    else:
-      return float(output['data'][name]['metrics']['slack'])
-  except (ValueError, pycurl.error) as e:
-    print "Problem accessing QoS data store ", e
-    return 0.0
+  if slack < st.params['slack_threshold_shrink']:
+    st.node.scheduler.trigger()
 
-def SloSlack(name):
-  """ Read SLO slack
+
+def LabelNode(enabled):
+  """ Sets the hyperpilot.io/be-enabled label of the local node with a single
+      API call, unless it is known to have that value; the known value
+      expires after label_refresh seconds, so that labels changed by
+      anyone else are set back
   """
-#  return SloSlackQoSDS(name)
-  return SloSlackFile()
+  if st.node.be_enabled == enabled and \
+     time.time() - st.node.be_enabled_at < st.params['label_refresh']:
+    return
+  body = {'metadata': {'labels': {'hyperpilot.io/be-enabled': 'true' if enabled else 'false'}}}
+  try:
+    _ = st.node.kenv.patch_node(st.node.name, body)
+    st.node.be_enabled = enabled
+    st.node.be_enabled_at = time.time()
+  except (ApiException, urllib3.exceptions.HTTPError) as e:
+    print "Cannot label node %s: %s\n" % (st.node.name, e)
 
 
 def EnableBE():
   """ enables BE workloads, locally
   """
   if st.k8sOn:
-    command = 'kubectl label --overwrite nodes ' + st.node.name + ' hyperpilot.io/be-enabled=true'
-    process = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE, \
-                               stderr=subprocess.STDOUT)
-    _ = process.wait()
+    LabelNode(True)
+
+
+def BEVictims(cpu_usage, minimum):
+  """ BE containers to act on: with be_victims, only the top ranked ones
+      that hold enough BE CPU to bring load back under the grow threshold,
+      and at least minimum of it; otherwise all BE containers
+  """
+  be_containers = [cont for _, cont in st.active_containers.items() \
+                   if cont.wclass == 'BE']
+  if not st.params['be_victims'] or not be_containers:
+    return be_containers
+  be_cpu = sum(cont.cpu_percent for cont in be_containers)
+  fraction = victims.Fraction(cpu_usage, st.params['load_threshold_grow'], be_cpu, minimum)
+  return victims.SelectVictims(be_containers, fraction, st.params['max_bw_mbps'])
+
+
+def KillBE(cont, body):
+  """ Kills one BE container: deletes its pod in K8S, kills it in docker
+  """
+  # K8s delete pod
+  if st.k8sOn:
+    try:
+      _ = st.node.kenv.delete_namespaced_pod(cont.k8s_pod_name, \
+              cont.k8s_namespace, body, grace_period_seconds=0, \
+              orphan_dependents=True)
+    except (ApiException, urllib3.exceptions.HTTPError) as e:
+      print "Cannot kill K8S BE pod: %s\n" % e
+  else:
+  # docker kill container
+    try:
+      cont.docker.kill()
+    except (docker.errors.APIError, requests.exceptions.RequestException):
+      print "Cannot kill container %s" % cont.docker_name
 
 
-def DisableBE():
-  """ kills all BE workloads
+def DisableBE(cpu_usage):
+  """ kills BE workloads
+      Kills are issued concurrently, so disabling takes about as long as
+      the slowest one, and at most kill_timeout; kills still in flight
+      then complete in the background
   """
+  body = None
   if st.k8sOn:
     body = client.V1DeleteOptions()
-  # kill BE containers
-  for _, cont in st.active_containers.items():
-    if cont.wclass == 'BE':
-      # K8s delete pod
-      if st.k8sOn:
-        try:
-          _ = st.node.kenv.delete_namespaced_pod(cont.k8s_pod_name, \
-                  cont.k8s_namespace, body, grace_period_seconds=0, \
-                  orphan_dependents=True)
-        except ApiException as e:
-          print "Cannot kill K8S BE pod: %s\n" % e
-      else:
-      # docker kill container
-        try:
-          cont.docker.kill()
-        except docker.errors.APIError:
-          print "Cannot kill container %s" % cont.name
+  # kill BE containers, once per pod in K8S
+  pending = []
+  killed = set()
+  for cont in BEVictims(cpu_usage, st.params['victim_fraction_disable']):
+    key = (cont.k8s_namespace, cont.k8s_pod_name) if st.k8sOn else cont.docker_id
+    if key in killed:
+      continue
+    killed.add(key)
+    if st.verbose:
+      print " Killing BE container %s" % cont.docker_name
+    pending.append(st.node.kill_pool.apply_async(KillBE, (cont, body)))
+
+  if st.node.cores is not None:
+    st.node.cores.reset()
 
-  # taint local node
+  # taint local node while the kills are in flight
   if st.k8sOn:
-    command = 'kubectl label --overwrite nodes ' + st.node.name + ' hyperpilot.io/be-enabled=false'
-    process = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE, \
-                                 stderr=subprocess.STDOUT)
-    _ = process.wait()
+    LabelNode(False)
+  deadline = time.time() + st.params['kill_timeout']
+  for _ in pending:
+    try:
+      _.get(max(0.0, deadline - time.time()))
+    except multiprocessing.TimeoutError:
+      print "Timeout killing BE containers, continuing"
+      break
 
 
 def GrowBE():
   """ grows number of shares for all BE workloads by be_growth_rate
       assumption: non 0 shares
   """
-  be_growth_rate = st.params['BE_growth_rate']
-  for _, cont in st.active_containers.items():
-    if cont.wclass == 'BE':
-      new_shares = int(be_growth_rate*cont.shares)
-      # if initial shares is very small, boost quickly
-      if new_shares == cont.shares:
-        new_shares = 2 * cont.shares
-      cont.shares = new_shares
-      try:
-        cont.docker.update(cpu_shares=cont.shares)
-      except docker.errors.APIError:
-        print "Cannot update shares for container %s" % cont.name
+  if st.node.cores is not None:
+    st.node.cores.grow()
+  # if initial shares is very small, boost quickly
+  st.node.policy.grow(st.node.table)
 
 
-def ShrinkBE():
-  """ shrinks number of shares for all BE workloads by be_shrink_rate
+def ShrinkBE(cpu_usage):
+  """ shrinks number of shares for BE workloads by be_shrink_rate
       warning: it does not work if shares are 0 to begin with
   """
-  be_shrink_rate = st.params['BE_shrink_rate']
-  min_shares = st.params['min_shares']
-  for _, cont in st.active_containers.items():
-    if cont.wclass == 'BE':
-      new_shares = int(be_shrink_rate*cont.shares)
-      if new_shares == cont.shares:
-        new_shares = int(cont.shares/2)
-      if new_shares < min_shares:
-        new_shares = min_shares
-      cont.shares = new_shares
-      try:
-        cont.docker.update(cpu_shares=cont.shares)
-      except docker.errors.APIError:
-        print "Cannot update shares for container %s" % cont.name
+  if st.node.cores is not None:
+    st.node.cores.shrink()
+  rows = st.node.table.indices(BEVictims(cpu_usage, st.params['victim_fraction_shrink']))
+  st.node.policy.shrink(st.node.table, rows)
+
+
+def AssignCores():
+  """ sets cpusets (BE cores and the HP complement) or BE quotas from the
+      core partition
+  """
+  if st.node.cores is None:
+    return
+  if st.params['be_isolation'] == 'cpuset':
+    be_cpus = cores.FormatCpuList(st.node.cores.beCpus())
+    hp_cpus = cores.FormatCpuList(st.node.cores.hpCpus())
+    for _, cont in st.active_containers.items():
+      cont.cpuset_cpus = be_cpus if cont.wclass == 'BE' else hp_cpus
+  else:
+    be_containers = [cont for _, cont in st.active_containers.items() \
+                     if cont.wclass == 'BE']
+    quota = st.node.cores.beQuota(len(be_containers))
+    for cont in be_containers:
+      cont.cpu_quota = quota
+
+
+def ApplyShares():
+  """ writes the shares, cpusets and quotas decided this cycle, skipping
+      unchanged containers; cpusets and quotas only change with core
+      isolation
+      returns the number of actuations performed
+  """
+  containers = st.active_containers if st.node.cores is not None else None
+  return st.node.actuator.apply(st.node.table, containers)
+
+
+def ControlCycle():
+  """ Runs one cycle of the shares controller
+      Returns the controller stats, CPU usage, SLO slack, the decision
+      taken (disable, shrink, grow or hold) and the number of actuations
+  """
+  start = time.time()
+
+  # get active containers and their class
+  with PHASE_SECONDS.time(phase='containers'):
+    st.active_containers, stats = ActiveContainers()
+    st.node.snapshots.publish(st.active_containers)
+  # get CPU stats and SLO slack
+  with PHASE_SECONDS.time(phase='cpu_stats'):
+    cpu_usage = CpuStats()
+  with PHASE_SECONDS.time(phase='slo_slack'):
+    slo_slack = SloSlack()
+
+  # grow, shrink or disable control
+  with PHASE_SECONDS.time(phase='policy'):
+    decision = st.node.policy.decide(cpu_usage, slo_slack, stats)
+    if decision == 'disable':
+      if st.verbose:
+        print " Disabling phase"
+      DisableBE(cpu_usage)
+    elif decision == 'shrink':
+      if st.verbose:
+        print " Shrinking phase"
+      ShrinkBE(cpu_usage)
+    elif decision == 'grow':
+      if st.verbose:
+        print " Growing phase"
+      GrowBE()
+      EnableBE()
+    else:
+      EnableBE()
+  with PHASE_SECONDS.time(phase='actuation'):
+    AssignCores()
+    actuations = ApplyShares()
+
+  CYCLE_SECONDS.observe(time.time() - start)
+  ACTUATIONS.observe(actuations)
+  DECISIONS.inc(decision=decision)
+  CONTAINERS.set(stats.hp_cont, wclass='HP')
+  CONTAINERS.set(stats.be_cont, wclass='BE')
+  SHARES.set(stats.hp_shares, wclass='HP')
+  SHARES.set(stats.be_shares, wclass='BE')
+  SLO_SLACK.set(slo_slack)
+  CPU_USAGE.set(cpu_usage)
+  return stats, cpu_usage, slo_slack, decision, actuations
 
 
 def ParseArgs():
@@ -306,10 +495,7 @@ def ParseArgs():
 
   # frequently used parameters
   st.k8sOn = (params['mode'] == 'k8s')
-
-  # k8s setup
-  if 'ctlloc' not in params:
-    params['ctlloc'] = 'in'
+  params = DefaultParams(params)
 
   # print configuration parameters
   print "Configuration:"
@@ -320,6 +506,146 @@ def ParseArgs():
   return params
 
 
+def DefaultParams(params):
+  """ fills in default values of missing parameters
+  """
+  # k8s setup
+  if 'ctlloc' not in params:
+    params['ctlloc'] = 'in'
+
+  # docker stats collection
+  if 'stats_workers' not in params:
+    params['stats_workers'] = 16
+  if 'stats_timeout' not in params:
+    params['stats_timeout'] = 3.0
+
+  # follow docker events instead of listing containers every cycle
+  if 'docker_events' not in params:
+    params['docker_events'] = True
+
+  # watch pods instead of listing them every cycle
+  if 'k8s_watch' not in params:
+    params['k8s_watch'] = True
+
+  # shares actuation: docker or cgroup
+  if 'shares_backend' not in params:
+    params['shares_backend'] = 'docker'
+  if 'actuation_workers' not in params:
+    params['actuation_workers'] = 8
+  if 'actuation_timeout' not in params:
+    params['actuation_timeout'] = 3.0
+  # hard BE isolation on top of shares: shares, cpuset or quota
+  if 'be_isolation' not in params:
+    params['be_isolation'] = 'shares'
+  if 'cpu_topology_root' not in params:
+    params['cpu_topology_root'] = '/sys/devices/system/cpu'
+  if 'min_hp_cores' not in params:
+    params['min_hp_cores'] = 1
+  if 'min_be_cores' not in params:
+    params['min_be_cores'] = 1
+  # cache and memory bandwidth partitioning through resctrl
+  if 'llc_control' not in params:
+    params['llc_control'] = False
+  if 'llc_period' not in params:
+    params['llc_period'] = 2
+  if 'resctrl_root' not in params:
+    params['resctrl_root'] = '/sys/fs/resctrl'
+  if 'resctrl_group' not in params:
+    params['resctrl_group'] = 'hyperpilot-be'
+  if 'llc_min_be_ways' not in params:
+    params['llc_min_be_ways'] = 1
+  if 'llc_min_hp_ways' not in params:
+    params['llc_min_hp_ways'] = 2
+  if 'max_mem_bw_mbytes' not in params:
+    params['max_mem_bw_mbytes'] = 0.0
+  # BE shares policy: multiplicative or pi
+  if 'be_policy' not in params:
+    params['be_policy'] = 'multiplicative'
+  if 'policy_kp' not in params:
+    params['policy_kp'] = 0.3
+  if 'policy_ki' not in params:
+    params['policy_ki'] = 0.3
+  if 'policy_deadband' not in params:
+    params['policy_deadband'] = 0.02
+  if 'policy_min_change' not in params:
+    params['policy_min_change'] = 0.05
+  if 'policy_max_be_fraction' not in params:
+    params['policy_max_be_fraction'] = 0.5
+  # Prometheus metrics endpoint, 0 to disable
+  if 'metrics_port' not in params:
+    params['metrics_port'] = 7784
+  # concurrent BE kills when disabling
+  if 'kill_workers' not in params:
+    params['kill_workers'] = 16
+  if 'kill_timeout' not in params:
+    params['kill_timeout'] = 10.0
+  # seconds the be-enabled node label is trusted without setting it again
+  if 'label_refresh' not in params:
+    params['label_refresh'] = 60.0
+
+  # traffic control backend: netlink or tc
+  if 'tc_backend' not in params:
+    params['tc_backend'] = 'netlink'
+  # BE packet marking: ipset or iptables
+  if 'net_marking' not in params:
+    params['net_marking'] = 'ipset'
+  # one HTB class per BE container
+  if 'net_per_container' not in params:
+    params['net_per_container'] = True
+  # ingress shaping through an IFB device
+  if 'net_ingress' not in params:
+    params['net_ingress'] = False
+  if 'iface_ifb' not in params:
+    params['iface_ifb'] = 'ifb0'
+  if 'max_ingress_bw_mbps' not in params:
+    params['max_ingress_bw_mbps'] = params['max_bw_mbps']
+
+  # adaptive control period
+  if 'min_period' not in params:
+    params['min_period'] = 0.5
+  if 'slo_poll_interval' not in params:
+    params['slo_poll_interval'] = 0.05
+
+  # SLO slack source: file, push or qosds
+  if 'slo_source' not in params:
+    params['slo_source'] = 'file'
+  if 'slo_file' not in params:
+    params['slo_file'] = 'slo_slack.txt'
+  if 'slo_push_port' not in params:
+    params['slo_push_port'] = 7782
+  if 'qosds_poll_interval' not in params:
+    params['qosds_poll_interval'] = 1.0
+  # slack older than this is ignored
+  if 'slo_max_age' not in params:
+    params['slo_max_age'] = 3 * params['period']
+
+  # HTTP polling of kubelet and QoS data store
+  if 'http_connect_timeout' not in params:
+    params['http_connect_timeout'] = 1.0
+  if 'http_timeout' not in params:
+    params['http_timeout'] = 2.0
+
+  # per pod CPU of BE pods from the kubelet summary
+  if 'kubelet_pod_cpu' not in params:
+    params['kubelet_pod_cpu'] = True
+
+  # act only on the top ranked BE containers when shrinking or disabling
+  if 'be_victims' not in params:
+    params['be_victims'] = True
+  if 'victim_fraction_shrink' not in params:
+    params['victim_fraction_shrink'] = 0.25
+  if 'victim_fraction_disable' not in params:
+    params['victim_fraction_disable'] = 0.5
+
+  # CPU stats backend: k8s, docker or cgroup
+  if 'cpu_stats' not in params:
+    params['cpu_stats'] = params['mode']
+  if 'cgroup_root' not in params:
+    params['cgroup_root'] = '/sys/fs/cgroup'
+
+  return params
+
+
 def configDocker():
   """ configure Docker environment
       current version does not record node capacity
@@ -327,10 +653,37 @@ def configDocker():
   # always initialize docker
   try:
     st.node.denv = docker.from_env()
+    # separate low-level client so that stats calls get their own timeout
+    st.node.stats_api = docker.from_env(timeout=int(math.ceil(st.params['stats_timeout']))).api
+    st.node.stats_pool = ThreadPool(st.params['stats_workers'])
     print "Docker API initialized."
   except docker.errors.APIError:
     print "Cannot communicate with docker daemon, terminating."
     sys.exit(-1)
+  # docker does not see shares written to the cgroup
+  st.node.table = containertable.ContainerTable(st.params['min_shares'], \
+                                                st.params['shares_backend'] != 'cgroup')
+  if st.params['docker_events']:
+    try:
+      st.node.inventory = inventory.ContainerInventory(st.node.denv, st.node.table)
+      st.node.inventory.start()
+    except (docker.errors.APIError, requests.exceptions.RequestException):
+      print "Cannot follow docker events, listing containers every cycle."
+      st.node.inventory = None
+  if st.params['cpu_stats'] == 'cgroup':
+    st.node.cgroup = cgroup.CgroupCpu(st.params['cgroup_root'])
+  cgroup_shares = None
+  if st.params['shares_backend'] == 'cgroup':
+    cgroup_shares = cgroup.CgroupShares(st.params['cgroup_root'])
+  if st.params['be_isolation'] in ('cpuset', 'quota'):
+    try:
+      st.node.cores = cores.CorePartition(cores.CpuTopology(st.params['cpu_topology_root']), \
+                                          st.params['min_hp_cores'], st.params['min_be_cores'])
+    except (IOError, OSError, ValueError) as e:
+      print "Cannot partition CPU cores, isolating BE with shares only: %s" % e
+  st.node.kill_pool = ThreadPool(st.params['kill_workers'])
+  st.node.actuator = actuator.SharesActuator(ThreadPool(st.params['actuation_workers']), \
+                                             st.params['actuation_timeout'], cgroup_shares)
 
 
 def configK8S():
@@ -358,25 +711,65 @@ def configK8S():
       print "Exception when calling CoreV1Api->read_node: %s\n" % e
       sys.exit(-1)
     st.node.cpu = int(_.status.capacity['cpu'])
+    labels = _.metadata.labels or {}
+    if 'hyperpilot.io/be-enabled' in labels:
+      st.node.be_enabled = (labels['hyperpilot.io/be-enabled'] == 'true')
+      st.node.be_enabled_at = time.time()
+    if st.params['k8s_watch']:
+      try:
+        st.node.pods = podcache.PodCache(st.node.kenv, \
+                         field_selector='spec.nodeName=' + st.node.name)
+        st.node.qos_pods = podcache.PodCache(st.node.kenv, \
+                             label_selector='hyperpilot.io/qos=true')
+        st.node.pods.start()
+        st.node.qos_pods.start()
+      except ApiException as e:
+        print "Cannot watch pods, listing them every cycle: %s\n" % e
+        st.node.pods = None
     EnableBE()
 
 
+def configSlo():
+  """ configure the SLO slack source
+  """
+  if st.params['slo_source'] == 'qosds':
+    # own client, so that polls never wait behind kubelet fetches
+    http = httppool.HttpPool(st.params['http_connect_timeout'], \
+                             st.params['http_timeout'])
+    st.node.slo = slosource.QoSDSSloSource(http, QOSDS_URL, lambda: st.node.qos_app, \
+                                           st.params['qosds_poll_interval'])
+  elif st.params['slo_source'] == 'push':
+    st.node.slo = slosource.PushSloSource(st.params['slo_push_port'])
+  else:
+    st.node.slo = slosource.FileSloSource(st.params['slo_file'], \
+                                          st.params['slo_poll_interval'])
+  st.node.slo.addListener(SloViolation)
+  st.node.slo.start()
+
+
 def __init__():
   """ Main function of shares controller
   """
   # parse arguments
   st.params = ParseArgs()
 
+  if st.params['metrics_port']:
+    try:
+      metrics.Serve(st.params['metrics_port'])
+    except IOError as e:
+      print "Cannot serve metrics: %s" % e
+
   # initialize environment
   configDocker()
   configK8S()
 
-  # simpler parameters
-  slack_threshold_shrink = st.params['slack_threshold_shrink']
-  load_threshold_shrink = st.params['load_threshold_shrink']
-  slack_threshold_grow = st.params['slack_threshold_grow']
-  load_threshold_grow = st.params['load_threshold_grow']
-  period = st.params['period']
+  st.node.http = httppool.HttpPool(st.params['http_connect_timeout'], \
+                                  st.params['http_timeout'])
+
+  st.node.scheduler = scheduler.CycleScheduler(st.params['period'], st.params['min_period'], \
+                                               st.params['slack_threshold_shrink'])
+  st.node.snapshots = snapshot.SnapshotChannel()
+  st.node.policy = policy.MakePolicy(st.params)
 
   # launch other controllers
   if st.verbose:
@@ -388,44 +781,35 @@ def __init__():
   except threading.ThreadError:
     print "Cannot start network controller; continuing without it"
 
+  configSlo()
+
+  if st.params['llc_control']:
+    if st.verbose:
+      print "Starting LLC controller"
+    try:
+      _ = threading.Thread(name='LlcControll', target=llc.LlcControll)
+      _.setDaemon(True)
+      _.start()
+    except threading.ThreadError:
+      print "Cannot start LLC controller; continuing without it"
 
   # control loop
   cycle = 0
   while 1:
-
-    # get active containers and their class
-    st.active_containers, stats = ActiveContainers()
-    # get CPU stats
-    cpu_usage = CpuStats()
-
-    # check SLO slack from file
-    slo_slack = SloSlack(st.node.qos_app)
-
-    # grow, shrink or disable control
-    if slo_slack < 0.0:
-      if st.verbose:
-        print " Disabling phase"
-      DisableBE()
-    elif slo_slack < slack_threshold_shrink or \
-         cpu_usage > load_threshold_shrink:
-      if st.verbose:
-        print " Shrinking phase"
-      ShrinkBE()
-    elif slo_slack > slack_threshold_grow and \
-         cpu_usage < load_threshold_grow:
-      if st.verbose:
-        print " Growing phase"
-      GrowBE()
-      EnableBE()
-    else:
-      EnableBE()
-
+    stats, cpu_usage, slo_slack, _, actuations = ControlCycle()
     if st.verbose:
       print "Shares controller ", cycle, " at ", dt.now().strftime('%H:%M:%S')
       print " Qos app ", st.node.qos_app, ", slack ", slo_slack, ", CPU load ", cpu_usage
       print " HP (%d): %d shares" % (stats.hp_cont, stats.hp_shares)
       print " BE (%d): %d shares" % (stats.be_cont, stats.be_shares)
+      if st.node.cores is not None:
+        print " BE cores: %d" % st.node.cores.be_cores
+      print " Actuations: %d" % actuations
     cycle += 1
-    time.sleep(period)
+    st.node.scheduler.adapt(slo_slack)
+    if st.node.scheduler.wait() and st.verbose:
+      print "Cycle triggered by SLO violation"
+
 
-__init__()
+if __name__ == '__main__':
+  __init__()
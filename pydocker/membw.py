@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+
+"""
+An infinite loop program that streams through memory with the STREAM
+triad kernel and reports the bytes moved per second
+
+Current assumptions:
+- Memory bandwidth antagonist: arrays much larger than the LLC, so that
+  every triad goes to memory
+- Bytes are counted as STREAM does: two arrays read and one written
+
+"""
+
+__author__ = "Christos Kozyrakis"
+__email__ = "christos@hyperpilot.io"
+__copyright__ = "Copyright 2017, HyperPilot Inc"
+
+
+# Standard
+# External
+import numpy as np
+# Local
+import antagonist
+
+SCALAR = 3.0
+# elements per step, and bytes moved per element
+BATCH = 1 << 20
+ELEMENT_BYTES = 3 * 8
+
+def Setup(args):
+  """ Step of one worker: a = b + SCALAR * c over the next batch of its
+      arrays, or fewer elements when budget bytes are left; returns the
+      bytes moved
+  """
+  count = max(int(args.size * 1024 * 1024) // 8, 1)
+  a = np.zeros(count)
+  b = np.ones(count)
+  c = np.full(count, 2.0)
+  state = {'next': 0}
+  def Step(budget=None):
+    size = BATCH
+    if budget is not None:
+      size = min(size, max(1, int(budget) // ELEMENT_BYTES))
+    start = state['next']
+    end = min(start + size, count)
+    state['next'] = end % count
+    out = a[start:end]
+    np.multiply(c[start:end], SCALAR, out=out)
+    np.add(out, b[start:end], out=out)
+    return ELEMENT_BYTES * (end - start)
+  return Step
+
+def main():
+  parser = antagonist.Parser("Memory bandwidth antagonist: STREAM triad")
+  parser.add_argument("-s", "--size", type=float, default=128.0,
+                      help="size of each of the three arrays per worker, in MB")
+  parser.add_argument("-b", "--bandwidth", type=float, default=0,
+                      help="MB per second of all workers, 0 for no limit")
+  args = antagonist.ParseArgs(parser)
+  antagonist.Run(args, Setup, 'bytes', args.bandwidth * 1024 * 1024, size_mbytes=args.size)
+
+if __name__ == "__main__":
+  main()
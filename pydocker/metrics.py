@@ -0,0 +1,215 @@
+"""
+Controller metrics classes
+
+Current assumptions:
+- Metrics live for the whole life of the controller; label sets are few
+- Scrapers read the Prometheus text format, version 0.0.4
+
+"""
+
+__author__ = "Christos Kozyrakis"
+__email__ = "christos@hyperpilot.io"
+__copyright__ = "Copyright 2017, HyperPilot Inc"
+
+# standard
+import time
+import threading
+import BaseHTTPServer
+
+# seconds, from 1 ms to 10 s
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Registry(object):
+  """This class holds all metrics and renders them for scraping.
+  """
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.metrics = []
+
+
+  def register(self, metric):
+    """ Adds a metric to the exposition
+    """
+    with self.lock:
+      self.metrics.append(metric)
+
+
+  def expose(self):
+    """ Renders all metrics in the Prometheus text format
+    """
+    with self.lock:
+      metrics = list(self.metrics)
+    lines = []
+    for metric in metrics:
+      lines.append('# HELP %s %s' % (metric.name, metric.help))
+      lines.append('# TYPE %s %s' % (metric.name, metric.kind))
+      lines.extend(metric.samples())
+    return '\n'.join(lines) + '\n'
+
+
+# metrics register here unless given another registry
+REGISTRY = Registry()
+
+
+def FormatLabels(labels):
+  """ Formats label pairs as {a="x",b="y"}
+  """
+  if not labels:
+    return ''
+  return '{' + ','.join('%s="%s"' % (k, str(v).replace('\\', '\\\\').replace('"', '\\"')) \
+                        for k, v in labels) + '}'
+
+
+def FormatValue(value):
+  """ Formats a sample value
+  """
+  if value == float('inf'):
+    return '+Inf'
+  return repr(float(value))
+
+
+class Metric(object):
+  """This class is the base of all metric types: one value (or set of values)
+     per combination of label values, updated under a lock.
+  """
+  kind = 'untyped'
+
+  def __init__(self, name, help, labels=(), registry=REGISTRY):
+    self.name = name
+    self.help = help
+    self.labels = tuple(labels)
+    self.lock = threading.Lock()
+    self.values = {}
+    if registry is not None:
+      registry.register(self)
+
+
+  def key(self, labels):
+    """ Label pairs of one series, in declaration order
+    """
+    if set(labels) != set(self.labels):
+      raise ValueError('Metric %s takes labels %s' % (self.name, ', '.join(self.labels)))
+    return tuple((_, labels[_]) for _ in self.labels)
+
+
+  def samples(self):
+    """ Exposition lines of all series
+    """
+    with self.lock:
+      return ['%s%s %s' % (self.name, FormatLabels(key), FormatValue(value)) \
+              for key, value in sorted(self.values.items())]
+
+
+class Counter(Metric):
+  """This class counts events.
+  """
+  kind = 'counter'
+
+  def inc(self, amount=1, **labels):
+    """ Adds amount to the counter
+    """
+    key = self.key(labels)
+    with self.lock:
+      self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+  """This class records the current value of something.
+  """
+  kind = 'gauge'
+
+  def set(self, value, **labels):
+    """ Sets the gauge
+    """
+    key = self.key(labels)
+    with self.lock:
+      self.values[key] = value
+
+
+class Timer(object):
+  """This class times a block of code into a histogram.
+  """
+  def __init__(self, histogram, labels):
+    self.histogram = histogram
+    self.labels = labels
+    self.start = None
+
+
+  def __enter__(self):
+    self.start = time.time()
+    return self
+
+
+  def __exit__(self, *args):
+    self.histogram.observe(time.time() - self.start, **self.labels)
+    return False
+
+
+class Histogram(Metric):
+  """This class counts observations in cumulative buckets.
+  """
+  kind = 'histogram'
+
+  def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS, registry=REGISTRY):
+    super(Histogram, self).__init__(name, help, labels, registry)
+    self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+
+  def observe(self, value, **labels):
+    """ Records one observation
+    """
+    key = self.key(labels)
+    with self.lock:
+      if key not in self.values:
+        self.values[key] = [[0] * len(self.buckets), 0.0]
+      counts = self.values[key][0]
+      for i, bound in enumerate(self.buckets):
+        if value <= bound:
+          counts[i] += 1
+          break
+      self.values[key][1] += value
+
+
+  def time(self, **labels):
+    """ Returns a context manager that observes the time spent in it
+    """
+    return Timer(self, labels)
+
+
+  def samples(self):
+    lines = []
+    with self.lock:
+      for key, (counts, total) in sorted(self.values.items()):
+        cumulative = 0
+        for bound, count in zip(self.buckets, counts):
+          cumulative += count
+          lines.append('%s_bucket%s %d' % (self.name, FormatLabels(key + (('le', FormatValue(bound)),)), \
+                                           cumulative))
+        lines.append('%s_sum%s %s' % (self.name, FormatLabels(key), FormatValue(total)))
+        lines.append('%s_count%s %d' % (self.name, FormatLabels(key), cumulative))
+    return lines
+
+
+def Serve(port, registry=REGISTRY):
+  """ Serves GET /metrics on a daemon thread
+  """
+  class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    def do_GET(self):
+      if self.path.split('?')[0] != '/metrics':
+        self.send_response(404)
+        self.end_headers()
+        return
+      body = registry.expose()
+      self.send_response(200)
+      self.send_header('Content-Type', 'text/plain; version=0.0.4')
+      self.send_header('Content-Length', str(len(body)))
+      self.end_headers()
+      self.wfile.write(body)
+    def log_message(self, *args):
+      pass
+  server = BaseHTTPServer.HTTPServer(('', port), Handler)
+  _ = threading.Thread(name='Metrics', target=server.serve_forever)
+  _.setDaemon(True)
+  _.start()
+  return server
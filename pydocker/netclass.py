@@ -12,14 +12,39 @@ __author__ = "Christos Kozyrakis"
 __email__ = "christos@hyperpilot.io"
 __copyright__ = "Copyright 2017, HyperPilot Inc"
 
-import subprocess
-import re
 import time
-import datetime as dt
+
+# hyperpilot imports
+import tcbackend
+import ipmark
+
+# HTB classes: 1:1 is the default (HP) class, 1:10 holds BE traffic,
+# optionally divided into one child class per BE container
+ROOT_CLASS = 0x1
+BE_CLASS = 0x10
+# firewall mark of BE packets
+BE_MARK = 6
+# per container classes below 1:10; each class minor doubles as its mark
+MIN_CONT_CLASS = 0x100
+MAX_CONT_CLASS = 0xfff
+# shaping directions
+EGRESS = 'egress'
+INGRESS = 'ingress'
 
 class NetClass(object):
   """This class performs network bandwidth isolation using HTB qdisc and ipfilters.
 
+     Traffic control goes through a pluggable backend (see tcbackend.py):
+     rtnetlink through pyroute2, the tc command line tool, or an in-memory
+     fake for tests. BE packets are marked through a marking backend (see
+     ipmark.py): an ipset matched by a single iptables rule, or one iptables
+     rule per container IP.
+
+     Egress is shaped on iface_ext. Optionally, ingress traffic of iface_ext
+     is redirected to an IFB device that carries an identical HTB hierarchy.
+     Marks are saved in conntrack on the way out and restored on the way in,
+     so inbound packets of BE connections land in the same classes.
+
      Useful documents and examples:
       - Creating multiple htb service classes:
         http://luxik.cdi.cz/~devik/qos/htb/manual/userg.htm
@@ -27,144 +52,205 @@ class NetClass(object):
         http://lartc.org/howto/lartc.qdisc.filters.html
       - Common iptables commands
         http://www.thegeekstuff.com/2011/06/iptables-rules-examples
+      - Ingress shaping with IFB
+        https://wiki.linuxfoundation.org/networking/ifb
   """
-  def __init__(self, iface_ext, iface_cont, max_bw_mbps, link_bw_mbps):
+  def __init__(self, iface_ext, iface_cont, max_bw_mbps, link_bw_mbps, backend=None, \
+               marker=None, per_container=False, ingress_bw_mbps=None, ifb='ifb0'):
     self.iface_ext = iface_ext
     self.iface_cont = iface_cont
     self.max_bw_mbps = max_bw_mbps
     self.link_bw_mbps = link_bw_mbps
+    self.per_container = per_container
     self.cont_ips = set()
-    self.mark = 6
+    self.mark = BE_MARK
+    # per container HTB classes: IP -> class minor (also used as its mark)
+    self.ip_class = {}
+    self.weights = {}
+    self.free_classes = range(MAX_CONT_CLASS, MIN_CONT_CLASS - 1, -1)
+    # shaped devices and their state, by direction
+    self.devices = {EGRESS: iface_ext}
+    self.max_bw = {EGRESS: max_bw_mbps}
+    if ingress_bw_mbps is not None:
+      self.devices[INGRESS] = ifb
+      self.max_bw[INGRESS] = ingress_bw_mbps
+    self.class_rates = {}
+    self.samplers = {}
+    self.class_stats = {}
+    for _ in self.devices:
+      self.class_rates[_] = {}
+      self.samplers[_] = BwSampler()
+      self.class_stats[_] = {}
+    if backend is None:
+      backend = tcbackend.TcCommand()
+    self.tc = backend
+    if marker is None:
+      marker = ipmark.IptablesMarker(self.iface_cont)
+    self.marker = marker
 
-    # reset IP tables
-    try:
-      subprocess.check_call(('iptables -t mangle -F').split())
-    except subprocess.CalledProcessError:
-      raise Exception('Could not reset iptables')
+    # reset packet marking
+    self.marker.reset()
 
     # make sure HTB is in a reasonable state to begin with
-    try:
-      subprocess.check_call(('tc qdisc del dev %s root' % self.iface_ext).split())
-    except:
-      pass
+    self.tc.resetRoot(self.iface_ext)
 
     # replace root qdisc with HTB
     # need to disable/enable HTB to get the stats working
-    try:
-      subprocess.check_call(('tc qdisc add dev %s root handle 1: htb default 1' \
-                               % self.iface_ext).split())
-      subprocess.check_call(('echo 1 > /sys/module/sch_htb/parameters/htb_rate_est'), shell=True)
-      subprocess.check_call(('tc qdisc del dev %s root' % self.iface_ext).split())
-      subprocess.check_call(('tc qdisc add dev %s root handle 1: htb default 1' \
-                               % self.iface_ext).split())
-      subprocess.check_call(('tc class add dev %s parent 1: classid 1:1 htb rate %dmbit ceil %dmbit' \
-                               % (self.iface_ext, self.link_bw_mbps, self.link_bw_mbps)).split())
-      subprocess.check_call(('tc class add dev %s parent 1: classid 1:10 htb rate %dmbit ceil %dmbit' \
-                               % (self.iface_ext, self.max_bw_mbps, self.max_bw_mbps)).split())
-      subprocess.check_call(('tc filter add dev %s parent 1: protocol all prio 10 handle %d fw flowid 1:10' \
-                               % (self.iface_ext, self.mark)).split())
-    except subprocess.CalledProcessError:
-      raise Exception('Could not setup htb qdisc')
-
-
-  def addIPtoFilter(self, cont_ip):
-    """ Adds the IP of a container to the IPtables filter
+    self.tc.addHtbRoot(self.iface_ext, ROOT_CLASS)
+    self.tc.enableRateEstimator()
+    # the IFB device must exist before it gets its HTB hierarchy
+    if INGRESS in self.devices:
+      self.tc.addIfb(ifb)
+    for direction, dev in self.devices.items():
+      self.setupHtb(dev, self.max_bw[direction])
+
+    # send ingress traffic through the IFB device
+    if INGRESS in self.devices:
+      self.tc.setupIngress(self.iface_ext, ifb)
+      self.marker.saveMarks()
+
+
+  def setupHtb(self, dev, max_bw_mbps):
+    """ Installs the HP and BE classes on a device
+    """
+    self.tc.resetRoot(dev)
+    self.tc.addHtbRoot(dev, ROOT_CLASS)
+    self.tc.setClass(dev, ROOT_CLASS, self.link_bw_mbps, self.link_bw_mbps)
+    self.tc.setClass(dev, BE_CLASS, max_bw_mbps, max_bw_mbps)
+    self.tc.addFwFilter(dev, self.mark, BE_CLASS)
+
+
+  def addIPtoFilter(self, cont_ip, weight=1.0):
+    """ Adds the IP of a container to the BE filter
     """
     if cont_ip in self.cont_ips:
       raise Exception('Duplicate filter for IP %s' % cont_ip)
-    self.cont_ips.add(cont_ip)
-    try:
-      subprocess.check_call(('iptables -t mangle -A PREROUTING -i %s -s %s -j MARK --set-mark %d' \
-                               % (self.iface_cont, cont_ip, self.mark)).split())
-    except subprocess.CalledProcessError:
-      raise Exception('Could not add iptable filter for %s' % cont_ip)
+    self.updateFilter([cont_ip], [], {cont_ip: weight})
 
 
   def removeIPfromFilter(self, cont_ip):
-    """ Adds the IP of a container to the IPtables filter
+    """ Removes the IP of a container from the BE filter
     """
     if cont_ip not in self.cont_ips:
       raise Exception('Not existing filter for %s' % cont_ip)
-    self.cont_ips.remove(cont_ip)
-    try:
-      subprocess.check_call(('iptables -t mangle -D PREROUTING -i %s -s %s -j MARK --set-mark %d' \
-                               % (self.iface_cont, cont_ip, self.mark)).split())
-    except subprocess.CalledProcessError:
-      raise Exception('Could not add iptable filter for %s' % cont_ip)
+    self.updateFilter([], [cont_ip])
 
 
-  def setBwLimit(self, bw_mbps):
-    # replace always work for tc filter
-    try:
-      subprocess.check_call(('tc class replace dev %s parent 1: classid 1:10 htb rate %dmbit ceil %dmbit' \
-                               % (self.iface_ext, bw_mbps, bw_mbps)).split())
-    except subprocess.CalledProcessError:
-      raise Exception('Could not change htb class rate')
+  def updateFilter(self, add_ips, remove_ips, weights=None):
+    """ Applies a batch of BE filter changes
+        weights maps IPs to their share of the BE bandwidth (default 1.0)
+    """
+    add_ips = set(add_ips).difference(self.cont_ips)
+    remove_ips = set(remove_ips).intersection(self.cont_ips)
+    if weights:
+      self.weights.update(weights)
 
+    # new containers get their own class below the BE class
+    marks = {}
+    for _ in add_ips:
+      if self.per_container and self.free_classes:
+        minor = self.free_classes.pop()
+        for direction, dev in self.devices.items():
+          # up to the current ceiling of the BE class
+          ceil = self.class_rates[direction].get(BE_CLASS, (0, max(1, int(self.max_bw[direction]))))[1]
+          self.tc.setClass(dev, minor, 1, ceil, BE_CLASS)
+          self.tc.addFwFilter(dev, minor, minor)
+        self.ip_class[_] = minor
+        marks[_] = minor
+      else:
+        marks[_] = self.mark
+    self.marker.update(marks, remove_ips)
 
-  def getBwStatsBlocking(self):
-    """Performs a blocking read to get one second averaged bandwidth statistics
+    for _ in remove_ips:
+      self.weights.pop(_, None)
+      if _ in self.ip_class:
+        minor = self.ip_class.pop(_)
+        for direction, dev in self.devices.items():
+          self.tc.delFwFilter(dev, minor)
+          self.tc.delClass(dev, minor)
+          self.class_rates[direction].pop(minor, None)
+        self.free_classes.append(minor)
+    self.cont_ips.update(add_ips)
+    self.cont_ips.difference_update(remove_ips)
+
+
+  def setBwLimit(self, bw_mbps, direction=EGRESS):
+    """ Sets the rate and ceiling of the BE class and divides its rate among
+        the container classes by weight. Each container may borrow up to
+        the whole BE allocation when the others are idle.
+        HTB rejects zero rates, so every class gets at least 1 mbit.
     """
-    # helper method to get stats from tc
-    def read_tc_stats():
-      text = subprocess.check_output(('tc -s class show dev %s' % self.iface_ext).split())
-      """Example format to parse. For some reason rate and pps are always 0...
-      class htb 1:1 root prio 0 rate 10000Mbit ceil 10000Mbit burst 0b cburst 0b
-       Sent 108 bytes 2 pkt (dropped 0, overlimits 0 requeues 0)
-       rate 0bit 0pps backlog 0b 0p requeues 0
-       lended: 2 borrowed: 0 giants: 0
-       tokens: 14 ctokens: 14
-
-      class htb 1:2 root prio 0 rate 1000Mbit ceil 1000Mbit burst 1375b cburst 1375b
-       Sent 1253014380 bytes 827622 pkt (dropped 0, overlimits 0 requeues 0)
-       rate 0bit 0pps backlog 0b 0p requeues 0
-       lended: 18460 borrowed: 0 giants: 0
-       tokens: -47 ctokens: -47
-      """
-      results = {}
-      for _ in re.finditer('class htb 1:(?P<cls>\d+).*?\n.*?Sent (?P<bytes>\d+) bytes', text, re.DOTALL):
-        cls = int(_.group('cls'))
-        bytes = int(_.group('bytes'))
-        results[cls] = 8.0*bytes/1000/1000 # convert to mbps
-
-      return results
-
-    # read stats from tc
-    starting_value = read_tc_stats()
-    starting_time = dt.datetime.now()
-    time.sleep(1)
-    ending_value = read_tc_stats()
-    ending_time = dt.datetime.now()
+    dev = self.devices[direction]
+    class_rates = self.class_rates[direction]
+    be_bw = max(1, int(bw_mbps))
+    rates = {BE_CLASS: (be_bw, be_bw)}
+    total_weight = sum(self.weights.get(_, 1.0) for _ in self.ip_class) or 1.0
+    for ip, minor in self.ip_class.items():
+      share = bw_mbps * self.weights.get(ip, 1.0) / total_weight
+      rates[minor] = (min(be_bw, max(1, int(share))), be_bw)
+    # parent first, so that children never exceed its ceiling
+    for minor in sorted(rates):
+      if class_rates.get(minor) != rates[minor]:
+        self.tc.setClass(dev, minor, rates[minor][0], rates[minor][1], \
+                         BE_CLASS if minor != BE_CLASS else 0)
+        class_rates[minor] = rates[minor]
 
-    # take the difference to find the average
-    elapsed_time = (ending_time - starting_time).total_seconds()
+
+  def getContainerBw(self, bw_usage):
+    """ Maps the per class bandwidth returned by getBwStats to container IPs
+    """
     results = {}
-    for _ in dict.iterkeys():
-      results[_] = float(ending_value[_] - starting_value[_]/elapsed_time)
+    for ip, minor in self.ip_class.items():
+      if minor in bw_usage:
+        results[ip] = bw_usage[minor]
     return results
 
 
-  def getBwStats(self):
-    """Performs a non-blocking read averaged bandwidth statistics
+  def getBwStatsBlocking(self, direction=EGRESS):
+    """Performs a blocking read to get one second averaged bandwidth statistics
     """
-    text = subprocess.check_output(('tc -s class show dev %s' % self.iface_ext).split())
+    dev = self.devices[direction]
+    sampler = BwSampler()
+    sampler.update(self.tc.classStats(dev), time.time())
+    time.sleep(1)
+    return sampler.update(self.tc.classStats(dev), time.time())
+
+
+  def getBwStats(self, direction=EGRESS, now=None):
+    """Performs a non-blocking read of bandwidth statistics, averaged since
+       the previous call; now overrides the sample time
     """
-    Example format to parse. Rate and pps are assumed to be valid
-    class htb 1:1 root prio 0 rate 10Gbit ceil 10Gbit burst 0b cburst 0b
-      Sent 3552621 bytes 22143 pkt (dropped 0, overlimits 0 requeues 0)
-      rate 59400bit 50pps backlog 0b 0p requeues 0
-      lended: 22143 borrowed: 0 giants: 0
-      tokens: 13 ctokens: 13
-
-    class htb 1:2 root prio 0 rate 1000Mbit ceil 1000Mbit burst 1375b cburst 1375b
-      Sent 1253014380 bytes 827622 pkt (dropped 0, overlimits 0 requeues 0)
-      rate 59400bit 50pps backlog 0b 0p requeues 0
-      lended: 18460 borrowed: 0 giants: 0
-      tokens: -47 ctokens: -47
+    if now is None:
+      now = time.time()
+    self.class_stats[direction] = self.tc.classStats(self.devices[direction])
+    return self.samplers[direction].update(self.class_stats[direction], now)
+
+
+class BwSampler(object):
+  """This class computes class bandwidth from byte counter deltas between
+     consecutive stats samples, so it does not depend on the kernel rate
+     estimator. On the first sample of a class, or after its counters were
+     reset, the kernel rate is used instead.
+  """
+  def __init__(self):
+    self.last_stats = {}
+    self.last_time = None
+
+
+  def update(self, stats, now):
+    """ Records a {minor: ClassStats} sample taken at time now (seconds)
+        and returns {minor: mbps}
     """
     results = {}
-    for _ in re.finditer('class htb 1:(?P<cls>\d+).*?\n.*?rate (?P<rate>\d+)bit', text, re.DOTALL):
-      cls = int(_.group('cls'))
-      rate = int(_.group('rate'))
-      results[cls] = float(rate / (1000000.0)) # convert to mbps
+    elapsed = 0.0
+    if self.last_time is not None:
+      elapsed = now - self.last_time
+    for cls, _ in stats.items():
+      last = self.last_stats.get(cls)
+      if elapsed > 0.0 and last is not None and _.bytes >= last.bytes:
+        results[cls] = 8.0*(_.bytes - last.bytes)/1000000.0/elapsed # convert to mbps
+      else:
+        results[cls] = _.rate/1000000.0
+    self.last_stats = stats
+    self.last_time = now
     return results
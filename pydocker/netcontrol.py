@@ -19,6 +19,83 @@ from datetime import datetime as dt
 # hyperpilot imports
 import settings as st
 import netclass as netclass
+import tcbackend
+import ipmark
+import metrics
+
+# network controller metrics
+PHASE_SECONDS = metrics.Histogram('hyperpilot_net_phase_seconds', \
+                                  'Time spent in each phase of a network control cycle', ('phase',))
+CYCLE_SECONDS = metrics.Histogram('hyperpilot_net_cycle_seconds', \
+                                  'Duration of network control cycles')
+BANDWIDTH = metrics.Gauge('hyperpilot_net_bw_mbps', 'Network bandwidth by direction', \
+                          ('direction', 'kind'))
+STATS_LOST = metrics.Counter('hyperpilot_net_stats_lost_total', \
+                             'Network cycles without class statistics', ('direction',))
+
+
+def MakeNetClass(backend=None, marker=None):
+  """ Sets up traffic shaping from the parameters
+      backend and marker default to the configured ones
+  """
+  if backend is None:
+    backend = tcbackend.MakeBackend(st.params['tc_backend'])
+  if marker is None:
+    marker = ipmark.MakeMarker(st.params['net_marking'], st.params['iface_cont'])
+  return netclass.NetClass(st.params['iface_ext'], st.params['iface_cont'], \
+                           st.params['max_bw_mbps'], st.params['link_bw_mbps'], \
+                           backend, marker, st.params['net_per_container'], \
+                           st.params['max_ingress_bw_mbps'] if st.params['net_ingress'] else None, \
+                           st.params['iface_ifb'])
+
+
+def NetCycle(net, snapshot, now=None):
+  """ Runs one cycle of the network controller on a container snapshot
+      now is the time of the bandwidth sample, the current time by default
+  """
+  start = time.time()
+
+  # track BW usage of new BE containers, stop tracking departed ones
+  with PHASE_SECONDS.time(phase='filter'):
+    be_containers = snapshot.be_ips
+    new_ips = set(_ for _ in be_containers if _ not in net.cont_ips)
+    old_ips = set(_ for _ in net.cont_ips if _ not in be_containers)
+    if new_ips or old_ips:
+      weights = dict((_, be_containers[_].net_weight) for _ in new_ips)
+      net.updateFilter(new_ips, old_ips, weights)
+
+  # actual controller, separate budgets for each direction
+  for direction in net.devices:
+    with PHASE_SECONDS.time(phase='stats'):
+      bw_usage = net.getBwStats(direction, now)
+    if netclass.ROOT_CLASS in bw_usage and netclass.BE_CLASS in bw_usage:
+      total_bw = bw_usage[netclass.ROOT_CLASS]
+      hp_bw = bw_usage[netclass.ROOT_CLASS] - bw_usage[netclass.BE_CLASS]
+      if hp_bw < 0.0:
+        hp_bw = 0.0
+      max_bw = net.max_bw[direction]
+      be_bw = max_bw - hp_bw - max(0.05*max_bw, 0.10*hp_bw)
+      if be_bw < 0.0:
+        be_bw = 0.0
+      with PHASE_SECONDS.time(phase='limit'):
+        net.setBwLimit(be_bw, direction)
+      BANDWIDTH.set(total_bw, direction=direction, kind='used')
+      BANDWIDTH.set(hp_bw, direction=direction, kind='hp')
+      BANDWIDTH.set(be_bw, direction=direction, kind='be_alloc')
+      # per container usage
+      for ip, bw in net.getContainerBw(bw_usage).items():
+        if ip in be_containers:
+          if direction == netclass.INGRESS:
+            be_containers[ip].ingress_bw_mbps = bw
+          else:
+            be_containers[ip].bw_mbps = bw
+      if st.verbose:
+        print " BW %s: %f (used) %f (HP), %f (BE alloc)" %(direction, total_bw, hp_bw, be_bw)
+    else:
+      STATS_LOST.inc(direction=direction)
+      if st.verbose:
+        print "Net stats lost (%s)" % direction
+  CYCLE_SECONDS.observe(time.time() - start)
 
 
 def NetControll():
@@ -28,43 +105,16 @@ def NetControll():
   if st.verbose:
     print "Starting NetControl (%s, %s, %f, %f)" \
            % (st.params['iface_ext'], st.params['iface_cont'], st.params['max_bw_mbps'], st.params['link_bw_mbps'])
-  net = netclass.NetClass(st.params['iface_ext'], st.params['iface_cont'], \
-                          st.params['max_bw_mbps'], st.params['link_bw_mbps'])
+  net = MakeNetClass()
   period = st.params['net_period']
+  snapshot = st.node.snapshots.current
   cycle = 0
   # control loop
   while 1:
+    NetCycle(net, snapshot)
 
-    # get IP of all active BE containers
-    active_be_ips = set()
-    for _, cont in st.active_containers.items():
-      if cont.wclass == 'BE':
-        active_be_ips.add(cont.ipaddress)
-    # track BW usage of new containers
-    new_ips = active_be_ips.difference(net.cont_ips)
-    for _ in new_ips:
-      net.addIPtoFilter(_)
-    old_ips = net.cont_ips.difference(active_be_ips)
-    for _ in old_ips:
-      net.removeIPfromFilter(_)
-
-    # actual controller
-    bw_usage = net.getBwStats()
-    if 1 in bw_usage and 10 in bw_usage: 
-      total_bw = bw_usage[1]
-      hp_bw = bw_usage[1] - bw_usage[10]
-      if hp_bw < 0.0:
-        hp_bw = 0.0
-      be_bw = net.max_bw_mbps - hp_bw - max(0.05*net.max_bw_mbps, 0.10*hp_bw)
-      if be_bw < 0.0:
-        be_bw = 0.0
-      net.setBwLimit(be_bw)
-    elif st.verbose:
-      print "Net stats lost"
-
-    # loop
+    # loop, early when the set of BE containers changes
     if st.verbose:
       print "Net controller ", cycle, " at ", dt.now().strftime('%H:%M:%S')
-      print " BW: %f (used) %f (HP), %f (BE alloc)" %(total_bw, hp_bw, be_bw)
     cycle += 1
-    time.sleep(period)
+    snapshot = st.node.snapshots.wait(snapshot.be_version, period)
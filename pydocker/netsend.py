@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+
+"""
+An infinite loop program that sends UDP datagrams to a host at a paced
+rate and reports the bytes sent per second
+
+Current assumptions:
+- Network antagonist: the receiver discards the traffic (e.g. the discard
+  port, or a netserver); bytes are counted when the kernel accepts them
+- Datagrams leave through the container interface, so that the network
+  controller classifies them as BE traffic
+
+"""
+
+__author__ = "Christos Kozyrakis"
+__email__ = "christos@hyperpilot.io"
+__copyright__ = "Copyright 2017, HyperPilot Inc"
+
+
+# Standard
+import math
+import errno
+import socket
+# Local
+import antagonist
+
+# datagrams per step
+BATCH = 16
+
+def Setup(args):
+  """ Step of one worker: sends a batch of datagrams, or just enough to use
+      up budget bytes; returns the bytes sent
+  """
+  sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+  target = (args.host, args.port)
+  payload = b'\0' * args.size
+  def Step(budget=None):
+    datagrams = BATCH
+    if budget is not None:
+      datagrams = min(datagrams, max(1, int(math.ceil(budget / float(len(payload) or 1)))))
+    sent = 0
+    for _ in range(datagrams):
+      try:
+        sent += sock.sendto(payload, target)
+      except socket.error as e:
+        # full socket buffer, or an ICMP error of an earlier datagram
+        if e.errno not in (errno.ENOBUFS, errno.EAGAIN, errno.ECONNREFUSED):
+          raise
+    return sent
+  return Step
+
+def main():
+  parser = antagonist.Parser("Network antagonist: paced UDP sender")
+  parser.add_argument("host", type=str, help="receiver host")
+  parser.add_argument("-p", "--port", type=int, default=9,
+                      help="receiver UDP port, discard by default")
+  parser.add_argument("-s", "--size", type=int, default=1400,
+                      help="datagram payload, in bytes")
+  parser.add_argument("-b", "--bandwidth", type=float, default=100.0,
+                      help="Mbps of all workers, 0 for no limit")
+  args = antagonist.ParseArgs(parser)
+  antagonist.Run(args, Setup, 'bytes', args.bandwidth * 1000000 / 8, \
+                 host=args.host, port=args.port)
+
+if __name__ == "__main__":
+  main()
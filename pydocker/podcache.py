@@ -0,0 +1,123 @@
+"""
+Pod cache class
+
+Current assumptions:
+- The API server keeps enough watch history to resume after short breaks;
+  otherwise the cache falls back to a full listing
+
+"""
+
+__author__ = "Christos Kozyrakis"
+__email__ = "christos@hyperpilot.io"
+__copyright__ = "Copyright 2017, HyperPilot Inc"
+
+# standard
+import time
+import threading
+import urllib3
+from kubernetes import watch
+from kubernetes.client.rest import ApiException
+
+
+class PodCache(object):
+  """This class keeps a local copy of the pods matching a field and label selector.
+
+     The cache is seeded with one listing and then fed by a watch that resumes
+     from the last seen resourceVersion. When that version is too old (410
+     Gone), the cache lists the pods again and restarts the watch.
+
+     Useful documents:
+      - Efficient detection of changes
+        https://kubernetes.io/docs/reference/using-api/api-concepts/#efficient-detection-of-changes
+  """
+  def __init__(self, kenv, field_selector='', label_selector='', timeout=300):
+    self.kenv = kenv
+    self.field_selector = field_selector
+    self.label_selector = label_selector
+    self.timeout = timeout
+    self.lock = threading.Lock()
+    self.items = {}
+    self.resource_version = None
+
+
+  def relist(self):
+    """ Rebuilds the cache from a full listing
+    """
+    pods = self.kenv.list_pod_for_all_namespaces(watch=False, \
+             field_selector=self.field_selector, label_selector=self.label_selector)
+    items = {}
+    for pod in pods.items:
+      items[(pod.metadata.namespace, pod.metadata.name)] = pod
+    with self.lock:
+      self.items = items
+      self.resource_version = pods.metadata.resource_version
+
+
+  def start(self):
+    """ Seeds the cache and starts watching for changes
+    """
+    self.relist()
+    watcher = threading.Thread(name='PodCache', target=self.watch)
+    watcher.setDaemon(True)
+    watcher.start()
+
+
+  def watch(self):
+    """ Applies watch events to the cache, forever
+    """
+    while 1:
+      try:
+        self.stream()
+      except ApiException as e:
+        if e.status == 410:
+          self.resync()
+        else:
+          print "Pod watch failed: %s" % e.reason
+          time.sleep(1)
+      except (urllib3.exceptions.HTTPError, ValueError) as e:
+        print "Pod watch failed: %s" % e
+        time.sleep(1)
+
+
+  def stream(self):
+    """ Follows one watch request until the server closes it
+    """
+    _ = watch.Watch()
+    for event in _.stream(self.kenv.list_pod_for_all_namespaces, \
+                          field_selector=self.field_selector, \
+                          label_selector=self.label_selector, \
+                          resource_version=self.resource_version, \
+                          timeout_seconds=self.timeout):
+      if event['type'] == 'ERROR':
+        # resourceVersion too old, the cache may have missed deletions
+        if event['raw_object'].get('code') == 410:
+          _.stop()
+          self.resync()
+        return
+      pod = event['object']
+      key = (pod.metadata.namespace, pod.metadata.name)
+      with self.lock:
+        if event['type'] == 'DELETED':
+          self.items.pop(key, None)
+        else:
+          self.items[key] = pod
+        self.resource_version = pod.metadata.resource_version
+
+
+  def resync(self):
+    """ Lists the pods again, retrying until the API server answers
+    """
+    while 1:
+      try:
+        self.relist()
+        return
+      except (ApiException, urllib3.exceptions.HTTPError, ValueError) as e:
+        print "Cannot list pods: %s" % e
+        time.sleep(1)
+
+
+  def pods(self):
+    """ Returns the cached pods
+    """
+    with self.lock:
+      return self.items.values()
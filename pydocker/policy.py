@@ -0,0 +1,147 @@
+"""
+BE shares policy classes
+
+Current assumptions:
+- A policy decides once per cycle: disable, shrink, grow or hold
+- Negative SLO slack always disables BE, whatever the policy
+- Shares are relative weights: BE gets its share of the node only under
+  contention, so a policy targets the BE fraction of all shares
+
+"""
+
+__author__ = "Christos Kozyrakis"
+__email__ = "christos@hyperpilot.io"
+__copyright__ = "Copyright 2017, HyperPilot Inc"
+
+# HP shares assumed when there are no HP containers (one core)
+DEFAULT_HP_SHARES = 1024
+
+
+class MultiplicativePolicy(object):
+  """This class grows and shrinks BE shares by fixed rates, between the
+     grow and shrink thresholds of slack and load.
+  """
+  def __init__(self, params):
+    self.slack_shrink = params['slack_threshold_shrink']
+    self.slack_grow = params['slack_threshold_grow']
+    self.load_shrink = params['load_threshold_shrink']
+    self.load_grow = params['load_threshold_grow']
+    self.growth_rate = params['BE_growth_rate']
+    self.shrink_rate = params['BE_shrink_rate']
+    self.min_shares = params['min_shares']
+
+
+  def decide(self, cpu_usage, slo_slack, stats):
+    """ Decision of one cycle
+    """
+    if slo_slack < 0.0:
+      return 'disable'
+    elif slo_slack < self.slack_shrink or cpu_usage > self.load_shrink:
+      return 'shrink'
+    elif slo_slack > self.slack_grow and cpu_usage < self.load_grow:
+      return 'grow'
+    return 'hold'
+
+
+  def grow(self, table):
+    """ Grows all BE containers of a table; returns the changed indices
+    """
+    return table.grow(self.growth_rate)
+
+
+  def shrink(self, table, rows):
+    """ Shrinks the BE containers at rows; returns the changed indices
+    """
+    return table.shrink(self.shrink_rate, self.min_shares, rows)
+
+
+class PiPolicy(object):
+  """This class sets BE shares with a proportional-integral controller.
+
+     The error is the smaller of the SLO slack above its setpoint and the
+     relative CPU headroom below its setpoint; the setpoints sit between the
+     grow and shrink thresholds. The output is the BE fraction of all shares,
+     and BE containers are scaled together to reach it in one step.
+
+     The integral only moves while the output is not saturated
+     (anti-windup), and errors within the deadband or changes smaller than
+     min_change are held (hysteresis), so that the controller settles
+     instead of actuating every cycle. The integral starts from the current
+     BE fraction, so switching to this policy does not move shares.
+
+     Useful documents:
+      - Astrom and Murray, Feedback Systems, chapter 10 (PID control)
+  """
+  def __init__(self, params):
+    self.slack_target = (params['slack_threshold_shrink'] + params['slack_threshold_grow']) / 2.0
+    self.load_target = (params['load_threshold_shrink'] + params['load_threshold_grow']) / 2.0
+    self.kp = params['policy_kp']
+    self.ki = params['policy_ki']
+    self.deadband = params['policy_deadband']
+    self.min_change = params['policy_min_change']
+    self.max_fraction = params['policy_max_be_fraction']
+    self.min_shares = params['min_shares']
+    self.integral = None
+    self.target = None
+
+
+  def error(self, cpu_usage, slo_slack):
+    """ Control error: positive when BE can grow
+    """
+    return min(slo_slack - self.slack_target, \
+               (self.load_target - cpu_usage) / self.load_target)
+
+
+  def decide(self, cpu_usage, slo_slack, stats):
+    """ Decision of one cycle; sets the target BE shares for grow and shrink
+    """
+    self.target = None
+    if slo_slack < 0.0:
+      self.integral = None
+      return 'disable'
+    error = self.error(cpu_usage, slo_slack)
+    if not stats.be_cont:
+      # nothing to control; restart from the next BE containers
+      self.integral = None
+      return 'grow' if error > self.deadband else 'hold'
+
+    hp_shares = stats.hp_shares or DEFAULT_HP_SHARES
+    current = float(stats.be_shares) / (hp_shares + stats.be_shares)
+    if self.integral is None:
+      self.integral = min(current, self.max_fraction) - self.kp * error
+    if abs(error) <= self.deadband:
+      return 'hold'
+
+    integral = self.integral + self.ki * error
+    output = self.kp * error + integral
+    fraction = min(max(output, 0.0), self.max_fraction)
+    if fraction == output:
+      self.integral = integral
+
+    target = int(hp_shares * fraction / (1.0 - fraction))
+    if abs(target - stats.be_shares) <= self.min_change * stats.be_shares:
+      return 'hold'
+    self.target = target
+    return 'grow' if target > stats.be_shares else 'shrink'
+
+
+  def grow(self, table):
+    """ Scales all BE containers of a table to the target
+    """
+    if self.target is None:
+      return table.indices([])
+    return table.scale(self.target, self.min_shares)
+
+
+  def shrink(self, table, rows):
+    """ Scales the BE containers at rows so that BE reaches the target
+    """
+    return table.scale(self.target, self.min_shares, rows)
+
+
+def MakePolicy(params):
+  """ BE shares policy: multiplicative or pi
+  """
+  if params['be_policy'] == 'pi':
+    return PiPolicy(params)
+  return MultiplicativePolicy(params)
@@ -0,0 +1,150 @@
+"""
+Resctrl utilities class
+
+Current assumptions:
+- resctrl is mounted and L3 allocation (CAT) is supported; memory bandwidth
+  allocation (MBA) and monitoring (MBM) are used when present
+- All L3 domains get the same allocation
+- The controller owns the schemata of the default group (HP) too
+
+"""
+
+__author__ = "Christos Kozyrakis"
+__email__ = "christos@hyperpilot.io"
+__copyright__ = "Copyright 2017, HyperPilot Inc"
+
+import os
+import errno
+
+
+class Resctrl(object):
+  """This class manages the resctrl group of BE tasks.
+
+     BE tasks get the top cache ways and a memory bandwidth percentage; the
+     default group, which holds every other task, gets the remaining ways
+     and full bandwidth, so the two never share a way. Bandwidth used by
+     each group is measured from the MBM byte counters.
+
+     Useful documents:
+      - Linux resctrl
+        https://www.kernel.org/doc/Documentation/x86/intel_rdt_ui.txt
+  """
+  def __init__(self, root='/sys/fs/resctrl', name='hyperpilot-be'):
+    self.root = root
+    self.group = os.path.join(root, name)
+    self.ways = bin(int(self.readFile(os.path.join(root, 'info', 'L3', 'cbm_mask')), 16)).count('1')
+    self.min_ways = int(self.readFile(os.path.join(root, 'info', 'L3', 'min_cbm_bits')))
+    self.domains = self.readDomains()
+    self.mba = os.path.isdir(os.path.join(root, 'info', 'MB'))
+    self.min_mba = 100
+    self.mba_step = 100
+    if self.mba:
+      self.min_mba = int(self.readFile(os.path.join(root, 'info', 'MB', 'min_bandwidth')))
+      self.mba_step = int(self.readFile(os.path.join(root, 'info', 'MB', 'bandwidth_gran')))
+    self.schemata = None
+
+
+  def readFile(self, path):
+    """ Reads a resctrl file
+    """
+    with open(path) as _:
+      return _.read().strip()
+
+
+  def readDomains(self):
+    """ Lists the L3 domain ids from the default schemata
+    """
+    for line in self.readFile(os.path.join(self.root, 'schemata')).splitlines():
+      resource, _, domains = line.strip().partition(':')
+      if resource == 'L3':
+        return [_.split('=')[0] for _ in domains.split(';')]
+    raise ValueError('No L3 allocation in resctrl schemata')
+
+
+  def create(self):
+    """ Creates the BE group if it does not exist
+    """
+    try:
+      os.mkdir(self.group)
+    except OSError as e:
+      if e.errno != errno.EEXIST:
+        raise
+
+
+  def line(self, resource, value):
+    """ Formats one schemata line with the same value in every domain
+    """
+    return '%s:%s\n' % (resource, ';'.join('%s=%s' % (_, value) for _ in self.domains))
+
+
+  def setAllocation(self, be_ways, be_mba):
+    """ Gives BE the top be_ways cache ways and be_mba percent bandwidth,
+        and the default group the other ways; skips unchanged allocations
+    """
+    if (be_ways, be_mba) == self.schemata:
+      return False
+    full = (1 << self.ways) - 1
+    be_mask = full ^ ((1 << (self.ways - be_ways)) - 1)
+    hp_mask = full ^ be_mask
+    hp = self.line('L3', '%x' % hp_mask)
+    be = self.line('L3', '%x' % be_mask)
+    if self.mba:
+      hp += self.line('MB', 100)
+      be += self.line('MB', be_mba)
+    # shrink the group losing ways first, so that masks never overlap
+    writes = [(self.root, hp), (self.group, be)]
+    if self.schemata is not None and be_ways < self.schemata[0]:
+      writes.reverse()
+    for path, text in writes:
+      with open(os.path.join(path, 'schemata'), 'w') as _:
+        _.write(text)
+    self.schemata = (be_ways, be_mba)
+    return True
+
+
+  def addTasks(self, pids):
+    """ Moves tasks into the BE group, skipping those already there
+        Returns the number of tasks moved
+    """
+    present = set(self.readFile(os.path.join(self.group, 'tasks')).split())
+    moved = 0
+    for pid in pids:
+      if pid in present:
+        continue
+      # one task per write, as the kernel requires
+      try:
+        with open(os.path.join(self.group, 'tasks'), 'w') as _:
+          _.write(pid)
+        moved += 1
+      except IOError as e:
+        # the task exited
+        if e.errno != errno.ESRCH:
+          raise
+    return moved
+
+
+  def readBytes(self, path):
+    """ Returns the total memory bytes counted for a group, None without MBM
+    """
+    mon_data = os.path.join(path, 'mon_data')
+    if not os.path.isdir(mon_data):
+      return None
+    total = 0
+    for domain in os.listdir(mon_data):
+      try:
+        total += int(self.readFile(os.path.join(mon_data, domain, 'mbm_total_bytes')))
+      except (IOError, ValueError):
+        return None
+    return total
+
+
+  def beBytes(self):
+    """ Memory bytes counted for BE tasks
+    """
+    return self.readBytes(self.group)
+
+
+  def hpBytes(self):
+    """ Memory bytes counted for all other tasks
+    """
+    return self.readBytes(self.root)
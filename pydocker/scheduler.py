@@ -0,0 +1,70 @@
+"""
+Control cycle scheduler class
+
+Current assumptions:
+- A cycle that overruns its period is not worth catching up on; the
+  schedule restarts from the end of the late cycle
+
+"""
+
+__author__ = "Christos Kozyrakis"
+__email__ = "christos@hyperpilot.io"
+__copyright__ = "Copyright 2017, HyperPilot Inc"
+
+import time
+import threading
+
+
+class CycleScheduler(object):
+  """This class paces the control loop.
+
+     Cycles start at fixed deadlines (period apart) rather than sleeping a
+     fixed time after each cycle, so the time spent in a cycle does not add
+     to the interval. The period shrinks linearly towards min_period as SLO
+     slack approaches the shrink threshold, and any thread can call trigger()
+     to start the next cycle right away, e.g. on an SLO violation.
+  """
+  def __init__(self, period, min_period, slack_threshold):
+    self.period = float(period)
+    self.min_period = float(min(min_period, period))
+    self.slack_threshold = slack_threshold
+    self.current = self.period
+    self.deadline = time.time()
+    self.wakeup = threading.Event()
+
+
+  def adapt(self, slack):
+    """ Picks the period of the next cycle from the current SLO slack:
+        min_period at or below the shrink threshold, the full period at
+        twice the threshold and above
+    """
+    if self.slack_threshold <= 0.0 or slack <= self.slack_threshold:
+      self.current = self.min_period
+    elif slack >= 2 * self.slack_threshold:
+      self.current = self.period
+    else:
+      fraction = (slack - self.slack_threshold) / self.slack_threshold
+      self.current = self.min_period + fraction * (self.period - self.min_period)
+    return self.current
+
+
+  def trigger(self):
+    """ Starts the next cycle immediately
+    """
+    self.wakeup.set()
+
+
+  def wait(self):
+    """ Blocks until the next cycle is due or triggered
+        Returns True if the cycle was triggered
+    """
+    now = time.time()
+    self.deadline += self.current
+    # late cycle, restart the schedule from now
+    if self.deadline < now:
+      self.deadline = now
+    triggered = self.wakeup.wait(self.deadline - now)
+    if triggered:
+      self.wakeup.clear()
+      self.deadline = time.time()
+    return bool(triggered)
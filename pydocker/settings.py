@@ -12,16 +12,30 @@ from kubernetes import client
 class Container(object):
   """ A class for tracking active containers
   """
+  __slots__ = ('docker_name', 'k8s_pod_name', 'k8s_namespace', 'docker_id', 'wclass',
+               'docker_shares', 'cpuset_cpus', 'applied_cpuset_cpus',
+               'cpu_quota', 'applied_cpu_quota', 'docker', 'cpu_percent', 'ipaddress',
+               'net_weight', 'bw_mbps', 'ingress_bw_mbps', 'started_at')
+
   def __init__(self):
     self.docker_name = ''
     self.k8s_pod_name = ''
     self.k8s_namespace = ''
     self.docker_id = 0
     self.wclass = 'HP'
-    self.shares = 0
+    # cpu shares docker reports; the container table tracks the live ones
+    self.docker_shares = 0
+    self.cpuset_cpus = ''
+    self.applied_cpuset_cpus = ''
+    self.cpu_quota = 0
+    self.applied_cpu_quota = 0
     self.docker = None
     self.cpu_percent = 0
     self.ipaddress = ''
+    self.net_weight = 1.0
+    self.bw_mbps = 0.0
+    self.ingress_bw_mbps = 0.0
+    self.started_at = 0.0
 
   def __repr__(self):
     return "<Container:%s pod:%s class:%s>" \
@@ -53,6 +67,25 @@ class NodeInfo(object):
     self.qos_app = ''
     self.kenv = None
     self.docker = None
+    self.stats_api = None
+    self.stats_pool = None
+    self.cgroup = None
+    self.inventory = None
+    self.table = None
+    self.actuator = None
+    self.http = None
+    self.scheduler = None
+    self.slo = None
+    self.kill_pool = None
+    self.cores = None
+    self.snapshots = None
+    self.policy = None
+    # last known value of the be-enabled node label, None if unknown,
+    # and when it was last read or set
+    self.be_enabled = None
+    self.be_enabled_at = 0.0
+    self.pods = None
+    self.qos_pods = None
 
 
 # globals
@@ -0,0 +1,584 @@
+"""
+Replay simulation of the shares and network controllers
+
+Current assumptions:
+- When HP and BE both want more CPU than the node has, CPU is split in
+  proportion to cpu shares
+- BE network traffic is limited only by the BE class rate
+- SLO slack is replayed as recorded; with slack_gain, it also drops by
+  slack_gain times the fraction of its CPU demand that HP did not get
+- Killed BE pods are rescheduled restart_delay seconds after the node is
+  enabled again
+- Reaction times are in simulated time, per cycle cost in real time
+
+"""
+
+__author__ = "Christos Kozyrakis"
+__email__ = "christos@hyperpilot.io"
+__copyright__ = "Copyright 2017, HyperPilot Inc"
+
+# standard
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from multiprocessing.pool import ThreadPool
+
+# hyperpilot imports
+import settings as st
+import maincontrol
+import netcontrol
+import netclass
+import inventory
+import containertable
+import actuator
+import scheduler
+import slosource
+import tcbackend
+import ipmark
+import snapshot
+import policy
+
+
+class SimObject(object):
+  """ A class for fake API objects with arbitrary attributes
+  """
+  def __init__(self, **kwargs):
+    self.__dict__.update(kwargs)
+
+
+class SimContainer(object):
+  """This class stands in for a docker container object.
+  """
+  def __init__(self, sim, cid, name, started_at, shares=1024):
+    self.sim = sim
+    self.id = cid
+    self.name = name
+    self.attrs = {'HostConfig': {'CpuShares': shares, 'CpusetCpus': '', 'CpuQuota': 0},
+                  'Config': {'Labels': {}},
+                  'State': {'StartedAt': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(started_at))}}
+
+
+  def update(self, cpu_shares=None, cpuset_cpus=None, cpu_quota=None):
+    self.sim.count('docker_update')
+    if cpu_shares is not None:
+      self.attrs['HostConfig']['CpuShares'] = cpu_shares
+    if cpuset_cpus is not None:
+      self.attrs['HostConfig']['CpusetCpus'] = cpuset_cpus
+    if cpu_quota is not None:
+      self.attrs['HostConfig']['CpuQuota'] = cpu_quota
+
+
+  def kill(self):
+    self.sim.count('docker_kill')
+    self.sim.removeContainer(self.id)
+
+
+class SimDocker(object):
+  """This class stands in for the docker client: containers.list/get.
+  """
+  def __init__(self, sim):
+    self.sim = sim
+    self.containers = self
+
+
+  def list(self):
+    self.sim.count('docker_list')
+    with self.sim.lock:
+      return self.sim.containers.values()
+
+
+  def get(self, cid):
+    self.sim.count('docker_get')
+    with self.sim.lock:
+      return self.sim.containers[cid]
+
+
+class SimKube(object):
+  """This class stands in for the K8S CoreV1Api client.
+  """
+  def __init__(self, sim):
+    self.sim = sim
+
+
+  def delete_namespaced_pod(self, name, namespace, body, grace_period_seconds=None, \
+                            orphan_dependents=None):
+    self.sim.count('k8s_delete_pod')
+    self.sim.deletePod(namespace, name)
+
+
+  def patch_node(self, name, body):
+    self.sim.count('k8s_patch_node')
+    self.sim.enabled = (body['metadata']['labels']['hyperpilot.io/be-enabled'] == 'true')
+
+
+class SimPodCache(object):
+  """This class stands in for a pod watch cache.
+  """
+  def __init__(self, sim, qos):
+    self.sim = sim
+    self.qos = qos
+
+
+  def pods(self):
+    with self.sim.lock:
+      if self.qos:
+        return [self.sim.qos_pod]
+      return self.sim.pods.values()
+
+
+class SimKubelet(object):
+  """This class stands in for the HTTP client of the kubelet stats summary.
+  """
+  def __init__(self, sim):
+    self.sim = sim
+
+
+  def get(self, url, writer=None):
+    self.sim.count('kubelet_get')
+    with self.sim.lock:
+      pods = [{'podRef': {'name': pod.metadata.name, 'namespace': pod.metadata.namespace},
+               'cpu': {'usageNanoCores': int(self.sim.cpu.get(pod.sim_id, 0.0) * st.node.cpu * 1E7)}}
+              for pod in self.sim.pods.values()]
+    node_cpu = int(sum(self.sim.cpu.values()) * st.node.cpu * 1E7)
+    body = json.dumps({'node': {'nodeName': st.node.name, 'cpu': {'usageNanoCores': node_cpu}},
+                       'pods': pods})
+    if writer is None:
+      return body
+    for _ in range(0, len(body), 16384):
+      if writer(body[_:_ + 16384]) == 0:
+        break
+    return ''
+
+
+class SimCgroup(object):
+  """This class stands in for cgroup CPU accounting.
+  """
+  def __init__(self, sim):
+    self.sim = sim
+
+
+  def sample(self, docker_ids):
+    self.sim.count('cgroup_sample')
+    return dict((_, self.sim.cpu.get(_, 0.0)) for _ in docker_ids)
+
+
+class SimTc(tcbackend.TcFake):
+  """This class counts traffic control operations.
+  """
+  def __init__(self, sim):
+    super(SimTc, self).__init__()
+    self.sim = sim
+
+
+  def setClass(self, iface, minor, rate_mbps, ceil_mbps, parent=0):
+    self.sim.count('tc_class')
+    super(SimTc, self).setClass(iface, minor, rate_mbps, ceil_mbps, parent)
+
+
+  def delClass(self, iface, minor):
+    self.sim.count('tc_class')
+    super(SimTc, self).delClass(iface, minor)
+
+
+  def addFwFilter(self, iface, mark, minor):
+    self.sim.count('tc_filter')
+    super(SimTc, self).addFwFilter(iface, mark, minor)
+
+
+  def delFwFilter(self, iface, mark):
+    self.sim.count('tc_filter')
+    super(SimTc, self).delFwFilter(iface, mark)
+
+
+class SimMarker(ipmark.FakeMarker):
+  """This class counts marking updates.
+  """
+  def __init__(self, sim):
+    super(SimMarker, self).__init__(None)
+    self.sim = sim
+
+
+  def update(self, add_marks, remove_ips):
+    self.sim.count('mark_update')
+    super(SimMarker, self).update(add_marks, remove_ips)
+
+
+def SyntheticTrace(duration=120.0, step=0.1):
+  """ A trace with a slack dip at 40 s and an SLO violation at 80 s
+      CPU is in percent of the node, bandwidth in mbps
+  """
+  rows = []
+  for i in range(int(duration / step)):
+    t = i * step
+    row = {'t': t, 'slack': 0.3, 'hp_cpu': 30.0, 'be_cpu': 70.0, 'hp_bw': 200.0, 'be_bw': 600.0}
+    if 40.0 <= t < 60.0:
+      row.update({'slack': 0.03, 'hp_cpu': 55.0, 'hp_bw': 400.0})
+    elif 80.0 <= t < 90.0:
+      row.update({'slack': -0.1, 'hp_cpu': 70.0, 'hp_bw': 500.0})
+    rows.append(row)
+  return rows
+
+
+def ReadTrace(path):
+  """ Reads a trace: one JSON object per line with keys t, slack, hp_cpu,
+      be_cpu (BE total), hp_bw and be_bw (BE total)
+  """
+  with open(path) as _:
+    return sorted((json.loads(line) for line in _ if line.strip()), key=lambda row: row['t'])
+
+
+class Simulation(object):
+  """This class runs the shares and network controllers of maincontrol and
+     netcontrol against a simulated node with hp_count HP and be_count BE
+     pods, replaying a trace of SLO slack, CPU and bandwidth demand.
+
+     All controller code runs unchanged; only Docker, K8S, the kubelet,
+     cgroups, tc, packet marking and the SLO source are replaced. Cycles are
+     paced by the real cycle scheduler in simulated time, including
+     immediate cycles triggered by SLO violations.
+  """
+  def __init__(self, params, hp_count, be_count, restart_delay=5.0, seed=1, slack_gain=0.0):
+    self.params = params
+    self.slack_gain = slack_gain
+    self.restart_delay = restart_delay
+    self.random = random.Random(seed)
+    self.lock = threading.Lock()
+    self.calls = {}
+    self.containers = {}
+    self.pods = {}
+    self.cpu = {}
+    self.weights = {}
+    self.enabled = True
+    self.killed = []
+    self.next_id = 0
+    self.now = 0.0
+    for _ in range(hp_count):
+      self.addContainer('HP')
+    for _ in range(be_count):
+      self.addContainer('BE')
+    with self.lock:
+      self.qos_pod = [_ for _ in self.pods.values() if _.wclass == 'HP'][0]
+
+
+  def count(self, name, amount=1):
+    """ Counts one call to a fake API
+    """
+    with self.lock:
+      self.calls[name] = self.calls.get(name, 0) + amount
+
+
+  def addContainer(self, wclass):
+    """ Starts a one container pod; BE pods get a random demand weight and
+        start with the shares of a BestEffort pod
+    """
+    self.next_id += 1
+    cid = '%064x' % self.next_id
+    name = '%s-%d' % (wclass.lower(), self.next_id)
+    cont = SimContainer(self, cid, name, time.time() - self.random.uniform(0.0, 7200.0), \
+                        2 if wclass == 'BE' else 1024)
+    status = SimObject(container_id='docker://' + cid, name=name)
+    pod = SimObject(metadata=SimObject(name=name, namespace='default', \
+                                       labels={'hyperpilot.io/wclass': wclass}),
+                    status=SimObject(pod_ip='10.%d.%d.%d' % (self.next_id >> 16, \
+                                     (self.next_id >> 8) & 0xff, self.next_id & 0xff),
+                                     container_statuses=[status]),
+                    sim_id=cid, wclass=wclass)
+    with self.lock:
+      self.containers[cid] = cont
+      self.pods[('default', name)] = pod
+      if wclass == 'BE':
+        self.weights[cid] = self.random.uniform(0.5, 1.5)
+    return cid
+
+
+  def removeContainer(self, cid):
+    """ Stops a container and its pod
+    """
+    with self.lock:
+      cont = self.containers.pop(cid, None)
+      if cont is None:
+        return
+      self.pods.pop(('default', cont.name), None)
+      self.weights.pop(cid, None)
+      self.cpu.pop(cid, None)
+      self.killed.append(self.now)
+    # docker die event
+    if st.node.inventory is not None:
+      st.node.inventory.forget(cid)
+
+
+  def deletePod(self, namespace, name):
+    """ Deletes a pod and its container
+    """
+    with self.lock:
+      pod = self.pods.get((namespace, name))
+    if pod is not None:
+      self.removeContainer(pod.sim_id)
+
+
+  def reschedule(self):
+    """ Restarts killed BE pods once the node accepts BE work again
+    """
+    while self.enabled and self.killed and self.killed[0] + self.restart_delay <= self.now:
+      self.killed.pop(0)
+      cid = self.addContainer('BE')
+      # docker start event
+      st.node.inventory.handle({'status': 'start', 'id': cid})
+
+
+  def setup(self):
+    """ Points the controllers at the fakes
+    """
+    st.params = self.params
+    st.k8sOn = True
+    st.verbose = False
+    st.active_containers = {}
+    st.node = st.NodeInfo()
+    st.node.name = 'sim-node'
+    st.node.cpu = self.params['sim_cores']
+    st.node.kenv = SimKube(self)
+    st.node.pods = SimPodCache(self, False)
+    st.node.qos_pods = SimPodCache(self, True)
+    st.node.http = SimKubelet(self)
+    st.node.cgroup = SimCgroup(self)
+    st.node.table = containertable.ContainerTable(self.params['min_shares'])
+    st.node.inventory = inventory.ContainerInventory(SimDocker(self), st.node.table)
+    st.node.inventory.seed()
+    st.node.kill_pool = ThreadPool(self.params['kill_workers'])
+    st.node.actuator = actuator.SharesActuator(ThreadPool(self.params['actuation_workers']), \
+                                               self.params['actuation_timeout'])
+    st.node.scheduler = scheduler.CycleScheduler(self.params['period'], self.params['min_period'], \
+                                                 self.params['slack_threshold_shrink'])
+    st.node.snapshots = snapshot.SnapshotChannel()
+    st.node.policy = policy.MakePolicy(self.params)
+    st.node.slo = slosource.SloSource()
+    st.node.slo.addListener(maincontrol.SloViolation)
+    self.net = netcontrol.MakeNetClass(SimTc(self), SimMarker(self))
+
+
+  def shareCpu(self, hp_cpu, be_cpu):
+    """ Splits the node CPU between HP and the BE containers by shares
+        Returns the CPU (percent of node) HP and BE got
+    """
+    with self.lock:
+      conts = self.containers.values()
+      weights = dict(self.weights)
+    hp = [_ for _ in conts if _.id not in weights]
+    be = [_ for _ in conts if _.id in weights]
+    hp_shares = float(sum(_.attrs['HostConfig']['CpuShares'] for _ in hp)) or 1.0
+    be_shares = float(sum(_.attrs['HostConfig']['CpuShares'] for _ in be))
+    total_weight = sum(weights.values()) or 1.0
+    demand = dict((_.id, be_cpu * weights[_.id] / total_weight) for _ in be)
+    hp_fair = 100.0 * hp_shares / (hp_shares + be_shares)
+    hp_got = min(hp_cpu, max(hp_fair, 100.0 - sum(demand.values())))
+    # BE containers split what is left by shares; spare CPU of containers
+    # that want less than their part goes to the others
+    left = 100.0 - hp_got
+    got = dict((_.id, 0.0) for _ in be)
+    hungry = list(be)
+    while hungry and left > 1E-9:
+      shares = float(sum(_.attrs['HostConfig']['CpuShares'] for _ in hungry))
+      part = dict((_.id, left * _.attrs['HostConfig']['CpuShares'] / shares) for _ in hungry)
+      left = 0.0
+      still = []
+      for _ in hungry:
+        want = demand[_.id] - got[_.id]
+        if part[_.id] >= want:
+          got[_.id] += want
+          left += part[_.id] - want
+        else:
+          got[_.id] += part[_.id]
+          still.append(_)
+      if len(still) == len(hungry):
+        break
+      hungry = still
+    cpu = dict(got)
+    for _ in hp:
+      cpu[_.id] = hp_got / len(hp)
+    with self.lock:
+      self.cpu = cpu
+    return hp_got, sum(got.values())
+
+
+  def sendTraffic(self, hp_bw, be_bw, elapsed):
+    """ Accounts elapsed seconds of traffic in the fake tc classes
+        Returns the BE bandwidth (mbps) that got through
+    """
+    dev = self.net.devices[netclass.EGRESS]
+    be_rate = self.net.class_rates[netclass.EGRESS].get(netclass.BE_CLASS, \
+                                                        (self.params['max_bw_mbps'],))[0]
+    with self.lock:
+      be = [(self.pods[('default', _.name)].status.pod_ip, self.weights[_.id]) \
+            for _ in self.containers.values() if _.id in self.weights]
+    total_weight = sum(_[1] for _ in be) or 1.0
+    sent = min(be_bw, be_rate)
+    self.net.tc.send(dev, netclass.ROOT_CLASS, int(hp_bw * 1E6 / 8 * elapsed))
+    for ip, weight in be:
+      minor = self.net.ip_class.get(ip, netclass.BE_CLASS)
+      self.net.tc.send(dev, minor, int(sent * weight / total_weight * 1E6 / 8 * elapsed))
+    return sent
+
+
+  def run(self, trace):
+    """ Replays a trace and returns the results
+    """
+    self.setup()
+    shrink_threshold = self.params['slack_threshold_shrink']
+    net_period = self.params['net_period']
+    next_cycle = trace[0]['t']
+    next_net = trace[0]['t'] + net_period
+    last_slack = None
+    # start of the current slack dip and violation, until the controller reacts
+    shrink_start = disable_start = None
+    in_dip = in_violation = False
+    shrink_times = []
+    disable_times = []
+    cycle_times = []
+    net_times = []
+    cycle_calls = {}
+    net_calls = {}
+    cycles = 0
+    actuations = 0
+    last_actuation = 0
+    cycle_slack = []
+    be_cpu = be_cpu_wanted = be_bw = be_bw_wanted = 0.0
+    for i, row in enumerate(trace):
+      self.now = row['t']
+      step = trace[i + 1]['t'] - row['t'] if i + 1 < len(trace) else 0.0
+      self.reschedule()
+
+      # workload
+      with self.lock:
+        has_be = bool(self.weights)
+      hp_got, got = self.shareCpu(row['hp_cpu'], row['be_cpu'] if has_be else 0.0)
+      be_cpu += got * step
+      be_cpu_wanted += row['be_cpu'] * step
+
+      # SLO source, which may trigger a cycle
+      slack = row['slack']
+      if self.slack_gain and row['hp_cpu'] > 0.0:
+        slack -= self.slack_gain * (row['hp_cpu'] - hp_got) / row['hp_cpu']
+      if slack != last_slack:
+        st.node.slo.update(slack)
+        last_slack = slack
+      if slack < shrink_threshold and not in_dip:
+        shrink_start = self.now
+      elif slack >= shrink_threshold:
+        shrink_start = None
+      in_dip = slack < shrink_threshold
+      if slack < 0.0 and not in_violation:
+        disable_start = self.now
+      elif slack >= 0.0:
+        disable_start = None
+      in_violation = slack < 0.0
+
+      # network controller
+      if self.now >= next_net:
+        sent = self.sendTraffic(row['hp_bw'], row['be_bw'] if has_be else 0.0, net_period)
+        be_bw += sent * net_period
+        be_bw_wanted += row['be_bw'] * net_period
+        calls = dict(self.calls)
+        start = time.time()
+        netcontrol.NetCycle(self.net, st.node.snapshots.current, self.now)
+        net_times.append(time.time() - start)
+        for name, value in self.calls.items():
+          net_calls[name] = net_calls.get(name, 0) + value - calls.get(name, 0)
+        next_net += net_period
+
+      # shares controller
+      triggered = st.node.scheduler.wakeup.is_set()
+      if self.now >= next_cycle or triggered:
+        st.node.scheduler.wakeup.clear()
+        calls = dict(self.calls)
+        start = time.time()
+        _, _, slo_slack, decision, changed = maincontrol.ControlCycle()
+        cycle_times.append(time.time() - start)
+        actuations += changed
+        if changed:
+          last_actuation = cycles
+        cycle_slack.append(slo_slack)
+        for name, value in self.calls.items():
+          cycle_calls[name] = cycle_calls.get(name, 0) + value - calls.get(name, 0)
+        cycles += 1
+        if decision in ('shrink', 'disable') and shrink_start is not None:
+          shrink_times.append(self.now - shrink_start)
+          shrink_start = None
+        if decision == 'disable' and disable_start is not None:
+          disable_times.append(self.now - disable_start)
+          disable_start = None
+        next_cycle = self.now + st.node.scheduler.adapt(slo_slack)
+
+    cycle_times.sort()
+    late_slack = cycle_slack[len(cycle_slack) // 2:]
+    return {'cycles': cycles,
+            'actuations': actuations,
+            'last_actuation_cycle': last_actuation,
+            'late_slack_min': min(late_slack) if late_slack else 0.0,
+            'late_slack_max': max(late_slack) if late_slack else 0.0,
+            'time_to_shrink': shrink_times,
+            'time_to_disable': disable_times,
+            'be_cpu_retained': be_cpu / be_cpu_wanted if be_cpu_wanted else 1.0,
+            'be_bw_retained': be_bw / be_bw_wanted if be_bw_wanted else 1.0,
+            'cycle_ms_mean': 1000.0 * sum(cycle_times) / max(1, len(cycle_times)),
+            'cycle_ms_p95': 1000.0 * cycle_times[int(0.95 * (len(cycle_times) - 1))] \
+                            if cycle_times else 0.0,
+            'net_cycle_ms_mean': 1000.0 * sum(net_times) / max(1, len(net_times)),
+            'calls_per_cycle': dict((name, float(value) / max(1, cycles)) \
+                                    for name, value in cycle_calls.items() if value),
+            'calls_per_net_cycle': dict((name, float(value) / max(1, len(net_times))) \
+                                        for name, value in net_calls.items() if value)}
+
+
+def SimParams(path, cpu_stats):
+  """ Controller parameters for simulation: the configuration file, with
+      fakes for every backend
+      Load thresholds are in percent of the node, like all CPU stats
+  """
+  with open(path) as _:
+    params = json.load(_)
+  params.update({'mode': 'k8s', 'cpu_stats': cpu_stats, 'kubelet_pod_cpu': True,
+                 'tc_backend': 'fake', 'net_marking': 'fake', 'net_ingress': False,
+                 'be_isolation': 'shares', 'llc_control': False,
+                 'load_threshold_shrink': 90.0, 'load_threshold_grow': 75.0})
+  params.setdefault('sim_cores', 16)
+  return maincontrol.DefaultParams(params)
+
+
+def main():
+  """ Runs the simulation for each container count and prints one JSON
+      line of results per run
+  """
+  parser = argparse.ArgumentParser()
+  parser.add_argument("-c", "--config", type=str, default="config.json",
+                      help="configuration file (JSON)")
+  parser.add_argument("-t", "--trace", type=str, default=None,
+                      help="trace file (JSON lines), synthetic trace if missing")
+  parser.add_argument("-n", "--containers", type=str, default="10,30,100,300,1000",
+                      help="comma separated BE container counts")
+  parser.add_argument("--hp", type=int, default=4, help="HP containers, at least 1")
+  parser.add_argument("--cpu-stats", type=str, default="cgroup", choices=("cgroup", "k8s"),
+                      help="CPU stats backend")
+  parser.add_argument("--seed", type=int, default=1, help="random seed")
+  parser.add_argument("--policy", type=str, default=None, choices=("multiplicative", "pi"),
+                      help="BE shares policy, from the configuration file if missing")
+  parser.add_argument("--slack-gain", type=float, default=0.0,
+                      help="slack lost per fraction of HP CPU demand not met")
+  args = parser.parse_args()
+
+  trace = ReadTrace(args.trace) if args.trace else SyntheticTrace()
+  for count in [int(_) for _ in args.containers.split(',')]:
+    params = SimParams(args.config, args.cpu_stats)
+    if args.policy:
+      params['be_policy'] = args.policy
+    sim = Simulation(params, args.hp, count, seed=args.seed, slack_gain=args.slack_gain)
+    results = sim.run(trace)
+    results['be_containers'] = count
+    print json.dumps(results, sort_keys=True)
+    sys.stdout.flush()
+
+
+if __name__ == '__main__':
+  main()
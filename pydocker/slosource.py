@@ -0,0 +1,244 @@
+"""
+SLO slack sources
+
+Current assumptions:
+- A single QoS tracked application per node
+- Slack files hold the current slack as the first number of the first line
+
+"""
+
+__author__ = "Christos Kozyrakis"
+__email__ = "christos@hyperpilot.io"
+__copyright__ = "Copyright 2017, HyperPilot Inc"
+
+# standard
+import os
+import time
+import json
+import threading
+import BaseHTTPServer
+import pycurl
+
+# optional inotify support
+try:
+  import pyinotify
+except ImportError:
+  pyinotify = None
+
+
+def ParseSlackFile(path):
+  """ Reads the slack value of a slack file
+  """
+  with open(path) as _:
+    return float(_.readline().split()[0])
+
+
+def ParseQoSDS(body, name):
+  """ Extracts the slack of application name from a QoS data store response
+      Returns None if the data store does not know it
+  """
+  output = json.loads(body)
+  if output['error']:
+    print "Problem accessing QoS data store"
+    return None
+  if name not in output['data']:
+    print "QoS datastore does not track workload ", name
+    return None
+  if 'metrics' not in output['data'][name] or \
+     'slack' not in output['data'][name]['metrics']:
+    return None
+  return float(output['data'][name]['metrics']['slack'])
+
+
+class SloSource(object):
+  """This class holds the latest SLO slack reported by some backend.
+
+     Backends run in their own thread and call update(); the control loop
+     calls read(), which never blocks on I/O and returns the value with its
+     age so that stale values can be ignored. Listeners are called on every
+     update, from the backend thread.
+  """
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.slack = None
+    self.timestamp = None
+    self.listeners = []
+
+
+  def addListener(self, listener):
+    """ Registers a function called with each new slack value
+    """
+    self.listeners.append(listener)
+
+
+  def update(self, slack):
+    """ Records a new slack value
+    """
+    with self.lock:
+      self.slack = slack
+      self.timestamp = time.time()
+    for _ in self.listeners:
+      _(slack)
+
+
+  def touch(self):
+    """ Marks the latest slack value as still current
+    """
+    with self.lock:
+      if self.timestamp is not None:
+        self.timestamp = time.time()
+
+
+  def read(self):
+    """ Returns (slack, age in seconds), or (None, None) before the first value
+    """
+    with self.lock:
+      if self.timestamp is None:
+        return None, None
+      return self.slack, time.time() - self.timestamp
+
+
+  def current(self, max_age):
+    """ Returns the latest slack, or 0.0 if it is missing or older than
+        max_age seconds
+    """
+    slack, age = self.read()
+    if slack is None or age > max_age:
+      print "SLO slack missing or stale, assuming no slack"
+      return 0.0
+    return slack
+
+
+  def start(self):
+    """ Starts the backend thread
+    """
+    _ = threading.Thread(name=self.__class__.__name__, target=self.run)
+    _.setDaemon(True)
+    _.start()
+
+
+class FileSloSource(SloSource):
+  """This backend reads a slack file whenever it changes: on inotify events
+     when pyinotify is available, otherwise by polling its mtime. A file
+     that exists and does not change keeps its slack current.
+  """
+  def __init__(self, path, poll_interval):
+    super(FileSloSource, self).__init__()
+    self.path = os.path.abspath(path)
+    self.poll_interval = poll_interval
+    self.valid = False
+    self.mtime = None
+
+
+  def reload(self):
+    """ Reads the file, ignoring partial or missing content
+    """
+    try:
+      self.update(ParseSlackFile(self.path))
+      self.valid = True
+    except (IOError, OSError, ValueError, IndexError):
+      self.valid = False
+
+
+  def check(self):
+    """ Keeps the slack of an unchanged file current
+    """
+    if self.valid and os.path.exists(self.path):
+      self.touch()
+
+
+  def poll(self):
+    """ Reads the file if its mtime changed, keeps its slack current
+        otherwise
+    """
+    try:
+      mtime = os.stat(self.path).st_mtime
+    except OSError:
+      self.mtime = None
+      return
+    if mtime != self.mtime:
+      self.mtime = mtime
+      self.reload()
+    else:
+      self.check()
+
+
+  def run(self):
+    if pyinotify is not None:
+      self.reload()
+      self.runInotify()
+    while 1:
+      self.poll()
+      time.sleep(self.poll_interval)
+
+
+  def runInotify(self):
+    """ Waits for writes to the file; watches the directory so that files
+        replaced by rename are seen too
+    """
+    source = self
+    class Handler(pyinotify.ProcessEvent):
+      def process_default(self, event):
+        if event.pathname == source.path:
+          source.reload()
+    manager = pyinotify.WatchManager()
+    manager.add_watch(os.path.dirname(self.path), pyinotify.IN_CLOSE_WRITE | pyinotify.IN_MOVED_TO)
+    notifier = pyinotify.Notifier(manager, Handler(), timeout=int(self.poll_interval * 1000))
+    while 1:
+      if notifier.check_events():
+        notifier.read_events()
+        notifier.process_events()
+      self.check()
+
+
+class PushSloSource(SloSource):
+  """This backend accepts slack values posted by the QoS pipeline:
+     POST /slack with a JSON body {"slack": <float>}
+  """
+  def __init__(self, port):
+    super(PushSloSource, self).__init__()
+    self.port = port
+
+
+  def run(self):
+    source = self
+    class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+      def do_POST(self):
+        if self.path != '/slack':
+          self.send_response(404)
+          self.end_headers()
+          return
+        try:
+          body = self.rfile.read(int(self.headers.getheader('content-length', 0)))
+          source.update(float(json.loads(body)['slack']))
+          self.send_response(204)
+        except (ValueError, KeyError, TypeError):
+          self.send_response(400)
+        self.end_headers()
+      def log_message(self, *args):
+        pass
+    BaseHTTPServer.HTTPServer(('', self.port), Handler).serve_forever()
+
+
+class QoSDSSloSource(SloSource):
+  """This backend polls the QoS data store for the slack of the QoS app.
+     The data store only serves the metrics of all apps at once.
+  """
+  def __init__(self, http, url, app, poll_interval):
+    super(QoSDSSloSource, self).__init__()
+    self.http = http
+    self.url = url
+    self.app = app
+    self.poll_interval = poll_interval
+
+
+  def run(self):
+    while 1:
+      start = time.time()
+      try:
+        slack = ParseQoSDS(self.http.get(self.url), self.app())
+        if slack is not None:
+          self.update(slack)
+      except (ValueError, KeyError, pycurl.error) as e:
+        print "Problem accessing QoS data store ", e
+      time.sleep(max(0.0, self.poll_interval - (time.time() - start)))
@@ -0,0 +1,85 @@
+"""
+Container snapshot classes
+
+Current assumptions:
+- A single writer (the shares controller) publishes snapshots
+- Container records are shared between snapshots; controllers only write
+  their own measurement fields (e.g. bandwidth) into them
+
+"""
+
+__author__ = "Christos Kozyrakis"
+__email__ = "christos@hyperpilot.io"
+__copyright__ = "Copyright 2017, HyperPilot Inc"
+
+import threading
+
+
+def BeKey(containers):
+  """ Identifies the set of BE containers: their IDs with their IPs
+  """
+  return frozenset((cont.docker_id, cont.ipaddress) for _, cont in containers.items() \
+                   if cont.wclass == 'BE')
+
+
+class ContainerSnapshot(object):
+  """This class is an immutable view of the active containers at one cycle.
+
+     version counts published snapshots; be_version only changes when the
+     set of BE containers (or their IPs) changes, so that controllers that
+     only care about BE membership can tell a real change from a new cycle.
+  """
+  __slots__ = ('version', 'be_version', 'be_key', 'containers', 'be_ips')
+
+  def __init__(self, version=0, be_version=0, containers=None, be_key=None):
+    containers = dict(containers or {})
+    if be_key is None:
+      be_key = BeKey(containers)
+    object.__setattr__(self, 'version', version)
+    object.__setattr__(self, 'be_version', be_version)
+    object.__setattr__(self, 'be_key', be_key)
+    object.__setattr__(self, 'containers', containers)
+    object.__setattr__(self, 'be_ips', dict((cont.ipaddress, cont) for _, cont in containers.items() \
+                                            if cont.wclass == 'BE'))
+
+
+  def __setattr__(self, name, value):
+    raise AttributeError('Container snapshots are immutable')
+
+
+class SnapshotChannel(object):
+  """This class publishes container snapshots to other controllers.
+
+     Readers take the current snapshot without locking: publish() replaces
+     it with a single reference assignment. Controllers that react to BE
+     changes block in wait(), which returns as soon as a snapshot with a
+     different BE set is published, or on timeout.
+  """
+  def __init__(self):
+    self.condition = threading.Condition()
+    self.current = ContainerSnapshot()
+
+
+  def publish(self, containers):
+    """ Publishes the containers of a new cycle and returns its snapshot
+    """
+    be_key = BeKey(containers)
+    with self.condition:
+      last = self.current
+      changed = (be_key != last.be_key)
+      snapshot = ContainerSnapshot(last.version + 1, last.be_version + int(changed), \
+                                   containers, be_key)
+      self.current = snapshot
+      if changed:
+        self.condition.notify_all()
+    return snapshot
+
+
+  def wait(self, be_version, timeout):
+    """ Waits up to timeout seconds for a BE set newer than be_version
+        Returns the current snapshot
+    """
+    with self.condition:
+      if self.current.be_version == be_version:
+        self.condition.wait(timeout)
+      return self.current
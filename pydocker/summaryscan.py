@@ -0,0 +1,121 @@
+"""
+Streaming scanner for the kubelet stats summary
+
+Current assumptions:
+- The summary lists the node block before the pods array, as the kubelet does
+- Only node CPU and, optionally, per pod CPU are needed
+
+"""
+
+__author__ = "Christos Kozyrakis"
+__email__ = "christos@hyperpilot.io"
+__copyright__ = "Copyright 2017, HyperPilot Inc"
+
+import re
+import json
+
+# one JSON token: a complete string, a structural character or a bare scalar
+TOKEN_RE = re.compile(r'\s*(?:("(?:[^"\\]|\\.)*")|([{}\[\],:])|([^\s{}\[\],:"]+))')
+
+
+class SummaryScanner(object):
+  """This class extracts CPU usage from a /stats/summary response as it
+     streams in, without building the whole document.
+
+     It is meant to be used as a pycurl write function: feed it chunks with
+     write(). Node CPU comes first in the document, so when per pod CPU is
+     not requested write() returns 0 as soon as it is read, aborting the
+     transfer after a few kilobytes. Otherwise the whole document is
+     consumed, so that libcurl can keep the connection alive.
+  """
+  def __init__(self, pods=False):
+    self.want_pods = pods
+    self.buffer = ''
+    # one entry per open container: [is_object, key or index, expecting_key]
+    self.stack = []
+    self.node_cpu = None
+    self.pod_cpu = {}
+    self.pod = {}
+    # done: nothing more to read; stopped: abort the rest of the transfer
+    self.done = False
+    self.stopped = False
+
+
+  def write(self, chunk):
+    """ Consumes a chunk of the response
+        Returns 0 to abort the transfer early, None otherwise
+    """
+    if self.done:
+      return 0 if self.stopped else None
+    self.buffer += chunk
+    pos = 0
+    end = len(self.buffer)
+    while 1:
+      _ = TOKEN_RE.match(self.buffer, pos)
+      # a scalar at the end of the buffer may continue in the next chunk
+      if _ is None or (_.group(3) is not None and _.end() == end):
+        break
+      pos = _.end()
+      self.token(_.group(1), _.group(2), _.group(3))
+      if self.done:
+        self.buffer = ''
+        return 0 if self.stopped else None
+    self.buffer = self.buffer[pos:]
+    return None
+
+
+  def token(self, string, punct, scalar):
+    """ Advances the parser state by one token
+    """
+    top = self.stack[-1] if self.stack else None
+    if punct == '{':
+      self.stack.append([True, None, True])
+    elif punct == '[':
+      self.stack.append([False, 0, False])
+    elif punct == '}' or punct == ']':
+      self.close()
+    elif punct == ':':
+      top[2] = False
+    elif punct == ',':
+      if top[0]:
+        top[2] = True
+      else:
+        top[1] += 1
+    elif top is not None and top[2]:
+      top[1] = json.loads(string) if '\\' in string else string[1:-1]
+    else:
+      self.value(string, scalar)
+
+
+  def value(self, string, scalar):
+    """ Records the scalar values we are interested in
+    """
+    depth = len(self.stack)
+    keys = [_[1] for _ in self.stack]
+    if depth == 3 and keys == ['node', 'cpu', 'usageNanoCores']:
+      self.node_cpu = int(scalar)
+      if not self.want_pods:
+        self.done = True
+        self.stopped = True
+    elif depth == 4 and keys[0] == 'pods':
+      if keys[2] == 'podRef' and keys[3] in ('name', 'namespace'):
+        self.pod[keys[3]] = json.loads(string)
+      elif keys[2] == 'cpu' and keys[3] == 'usageNanoCores':
+        self.pod['cpu'] = int(scalar)
+
+
+  def close(self):
+    """ Closes the innermost container
+    """
+    self.stack.pop()
+    depth = len(self.stack)
+    keys = [_[1] for _ in self.stack]
+    if depth == 2 and keys[0] == 'pods':
+      # end of one pod
+      if 'name' in self.pod and 'cpu' in self.pod:
+        self.pod_cpu[(self.pod.get('namespace', ''), self.pod['name'])] = self.pod['cpu']
+      self.pod = {}
+    elif depth == 1 and keys[0] == 'pods':
+      self.done = True
+    elif depth == 0:
+      self.done = True
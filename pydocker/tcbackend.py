@@ -0,0 +1,408 @@
+"""
+Traffic control backends for NetClass
+
+Current assumptions:
+- HTB handles are 1:<minor>, with minors given as integers (tc prints them in hex)
+- Rates are given in mbps, stats are returned per class minor as ClassStats
+
+"""
+
+__author__ = "Christos Kozyrakis"
+__email__ = "christos@hyperpilot.io"
+__copyright__ = "Copyright 2017, HyperPilot Inc"
+
+import subprocess
+import re
+from collections import namedtuple
+
+# optional netlink support
+try:
+  from pyroute2 import IPRoute
+  from pyroute2.netlink.exceptions import NetlinkError
+except ImportError:
+  IPRoute = None
+
+
+# counters of one HTB class; backlog in bytes, rate is the kernel estimate
+# in bits per second (often 0 when the estimator is off)
+ClassStats = namedtuple('ClassStats', ['bytes', 'packets', 'drops', 'overlimits', 'backlog', 'rate'])
+
+UNITS = {'': 1, 'K': 1000, 'M': 1000000, 'G': 1000000000, 'T': 1000000000000}
+CLASS_RE = re.compile(r'^class htb 1:(?P<cls>[0-9a-f]+)\s')
+SENT_RE = re.compile(r'Sent (?P<bytes>\d+) bytes (?P<pkts>\d+) pkt \(dropped (?P<drops>\d+), overlimits (?P<over>\d+)')
+RATE_RE = re.compile(r'rate (?P<rate>[\d.]+)(?P<ru>[KMGT]?)bit .*?backlog (?P<backlog>[\d.]+)(?P<bu>[KMGT]?)b')
+
+
+def ParseClassStats(text):
+  """ Parses the output of 'tc -s class show' into {minor: ClassStats}
+
+  Example format to parse; tc scales rates and sizes with K/M/G suffixes
+    class htb 1:1 root prio 0 rate 10Gbit ceil 10Gbit burst 0b cburst 0b
+     Sent 3552621 bytes 22143 pkt (dropped 0, overlimits 0 requeues 0)
+     rate 59400bit 50pps backlog 0b 0p requeues 0
+     lended: 22143 borrowed: 0 giants: 0
+     tokens: 13 ctokens: 13
+
+    class htb 1:10 root prio 0 rate 700Mbit ceil 700Mbit burst 1487b cburst 1487b
+     Sent 1253014380 bytes 827622 pkt (dropped 12, overlimits 3045 requeues 0)
+     rate 9Mbit 780pps backlog 3028b 2p requeues 0
+  """
+  results = {}
+  minor = None
+  for line in text.splitlines():
+    line = line.strip()
+    head = CLASS_RE.match(line)
+    if head:
+      minor = int(head.group('cls'), 16)
+      record = {'bytes': 0, 'packets': 0, 'drops': 0, 'overlimits': 0, 'backlog': 0, 'rate': 0}
+      results[minor] = record
+      continue
+    if minor is None:
+      continue
+    sent = SENT_RE.match(line)
+    if sent:
+      record['bytes'] = int(sent.group('bytes'))
+      record['packets'] = int(sent.group('pkts'))
+      record['drops'] = int(sent.group('drops'))
+      record['overlimits'] = int(sent.group('over'))
+      continue
+    rate = RATE_RE.match(line)
+    if rate:
+      record['rate'] = int(float(rate.group('rate')) * UNITS[rate.group('ru')])
+      record['backlog'] = int(float(rate.group('backlog')) * UNITS[rate.group('bu')])
+  for _ in results:
+    results[_] = ClassStats(**results[_])
+  return results
+
+
+def EnableRateEstimator():
+  """ Turns on the HTB rate estimator, needed for class rate stats
+  """
+  try:
+    subprocess.check_call(('echo 1 > /sys/module/sch_htb/parameters/htb_rate_est'), shell=True)
+  except subprocess.CalledProcessError:
+    raise Exception('Could not setup htb qdisc')
+
+
+class TcCommand(object):
+  """This backend forks the tc command line tool for every operation.
+  """
+  def enableRateEstimator(self):
+    """ Turns on the HTB rate estimator
+    """
+    EnableRateEstimator()
+
+
+  def resetRoot(self, iface):
+    """ Removes the root qdisc of an interface, if any
+    """
+    try:
+      subprocess.check_call(('tc qdisc del dev %s root' % iface).split())
+    except subprocess.CalledProcessError:
+      pass
+
+
+  def addHtbRoot(self, iface, default):
+    """ Installs an HTB root qdisc with handle 1:
+    """
+    try:
+      subprocess.check_call(('tc qdisc add dev %s root handle 1: htb default %x' \
+                               % (iface, default)).split())
+    except subprocess.CalledProcessError:
+      raise Exception('Could not setup htb qdisc')
+
+
+  def setClass(self, iface, minor, rate_mbps, ceil_mbps, parent=0):
+    """ Adds or changes the rate of HTB class 1:minor, child of 1:parent
+    """
+    try:
+      subprocess.check_call(('tc class replace dev %s parent 1:%s classid 1:%x htb rate %dmbit ceil %dmbit' \
+                               % (iface, '%x' % parent if parent else '', minor, rate_mbps, ceil_mbps)).split())
+    except subprocess.CalledProcessError:
+      raise Exception('Could not change htb class rate')
+
+
+  def delClass(self, iface, minor):
+    """ Removes HTB class 1:minor
+    """
+    try:
+      subprocess.check_call(('tc class del dev %s classid 1:%x' % (iface, minor)).split())
+    except subprocess.CalledProcessError:
+      raise Exception('Could not remove htb class 1:%x' % minor)
+
+
+  def addFwFilter(self, iface, mark, minor):
+    """ Sends packets with a firewall mark to HTB class 1:minor
+    """
+    try:
+      subprocess.check_call(('tc filter add dev %s parent 1: protocol all prio 10 handle %d fw flowid 1:%x' \
+                               % (iface, mark, minor)).split())
+    except subprocess.CalledProcessError:
+      raise Exception('Could not add fw filter for mark %d' % mark)
+
+
+  def delFwFilter(self, iface, mark):
+    """ Removes the filter of a firewall mark
+    """
+    try:
+      subprocess.check_call(('tc filter del dev %s parent 1: protocol all prio 10 handle %d fw' \
+                               % (iface, mark)).split())
+    except subprocess.CalledProcessError:
+      raise Exception('Could not remove fw filter for mark %d' % mark)
+
+
+  def addIfb(self, ifb):
+    """ Creates the IFB device ifb, if needed, and brings it up
+    """
+    try:
+      subprocess.check_call(('ip link add %s type ifb' % ifb).split())
+    except subprocess.CalledProcessError:
+      pass # already there
+    try:
+      subprocess.check_call(('ip link set dev %s up' % ifb).split())
+    except subprocess.CalledProcessError:
+      raise Exception('Could not bring up %s' % ifb)
+
+
+  def setupIngress(self, iface, ifb):
+    """ Redirects ingress traffic of iface to the IFB device ifb, restoring
+        the conntrack mark of each packet on the way
+    """
+    try:
+      subprocess.check_call(('tc qdisc del dev %s ingress' % iface).split())
+    except subprocess.CalledProcessError:
+      pass
+    try:
+      subprocess.check_call(('tc qdisc add dev %s handle ffff: ingress' % iface).split())
+      subprocess.check_call(('tc filter add dev %s parent ffff: protocol all u32 match u32 0 0 ' \
+                             'action connmark action mirred egress redirect dev %s' % (iface, ifb)).split())
+    except subprocess.CalledProcessError:
+      raise Exception('Could not redirect %s ingress to %s' % (iface, ifb))
+
+
+  def classStats(self, iface):
+    """ Returns {minor: ClassStats} for the HTB classes of an interface
+    """
+    try:
+      text = subprocess.check_output(('tc -s class show dev %s' % iface).split())
+    except subprocess.CalledProcessError:
+      raise Exception('Could not read htb class stats')
+    return ParseClassStats(text)
+
+
+class TcNetlink(object):
+  """This backend talks rtnetlink directly through pyroute2, without forking.
+
+     Useful documents:
+      - pyroute2 traffic control
+        http://docs.pyroute2.org/iproute.html
+  """
+  def __init__(self):
+    if IPRoute is None:
+      raise Exception('pyroute2 is not installed')
+    self.ipr = IPRoute()
+    self.indexes = {}
+
+
+  def enableRateEstimator(self):
+    """ Turns on the HTB rate estimator
+    """
+    EnableRateEstimator()
+
+
+  def index(self, iface):
+    """ Returns the (cached) interface index
+    """
+    if iface not in self.indexes:
+      _ = self.ipr.link_lookup(ifname=iface)
+      if not _:
+        raise Exception('No such interface %s' % iface)
+      self.indexes[iface] = _[0]
+    return self.indexes[iface]
+
+
+  def resetRoot(self, iface):
+    """ Removes the root qdisc of an interface, if any
+    """
+    try:
+      self.ipr.tc('del', 'htb', self.index(iface), 0x10000)
+    except NetlinkError:
+      pass
+
+
+  def addHtbRoot(self, iface, default):
+    """ Installs an HTB root qdisc with handle 1:
+    """
+    try:
+      self.ipr.tc('add', 'htb', self.index(iface), 0x10000, default=default)
+    except NetlinkError:
+      raise Exception('Could not setup htb qdisc')
+
+
+  def setClass(self, iface, minor, rate_mbps, ceil_mbps, parent=0):
+    """ Adds or changes the rate of HTB class 1:minor, child of 1:parent
+    """
+    try:
+      self.ipr.tc('replace-class', 'htb', self.index(iface), 0x10000 | minor, \
+                  parent=0x10000 | parent, rate='%dmbit' % rate_mbps, ceil='%dmbit' % ceil_mbps)
+    except NetlinkError:
+      raise Exception('Could not change htb class rate')
+
+
+  def delClass(self, iface, minor):
+    """ Removes HTB class 1:minor
+    """
+    try:
+      self.ipr.tc('del-class', 'htb', self.index(iface), 0x10000 | minor)
+    except NetlinkError:
+      raise Exception('Could not remove htb class 1:%x' % minor)
+
+
+  def addFwFilter(self, iface, mark, minor):
+    """ Sends packets with a firewall mark to HTB class 1:minor
+    """
+    try:
+      self.ipr.tc('add-filter', 'fw', self.index(iface), mark, \
+                  parent=0x10000, prio=10, classid=0x10000 | minor)
+    except NetlinkError:
+      raise Exception('Could not add fw filter for mark %d' % mark)
+
+
+  def delFwFilter(self, iface, mark):
+    """ Removes the filter of a firewall mark
+    """
+    try:
+      self.ipr.tc('del-filter', 'fw', self.index(iface), mark, parent=0x10000, prio=10)
+    except NetlinkError:
+      raise Exception('Could not remove fw filter for mark %d' % mark)
+
+
+  def addIfb(self, ifb):
+    """ Creates the IFB device ifb, if needed, and brings it up
+        This is done once, so it goes through the command line tool
+    """
+    TcCommand().addIfb(ifb)
+    self.indexes.pop(ifb, None)
+
+
+  def setupIngress(self, iface, ifb):
+    """ Redirects ingress traffic of iface to the IFB device ifb
+        This is done once, so it goes through the command line tool
+    """
+    TcCommand().setupIngress(iface, ifb)
+
+
+  def classStats(self, iface):
+    """ Returns {minor: ClassStats} for the HTB classes of an interface
+    """
+    try:
+      classes = self.ipr.get_classes(index=self.index(iface))
+    except NetlinkError:
+      raise Exception('Could not read htb class stats')
+    results = {}
+    for msg in classes:
+      stats = msg.get_attr('TCA_STATS')
+      if stats is None:
+        continue
+      results[msg['handle'] & 0xffff] = ClassStats(stats['bytes'], stats['packets'], \
+                                                   stats['drop'], stats['overlimits'], \
+                                                   stats['backlog'], stats['bps'] * 8)
+    return results
+
+
+class TcFake(object):
+  """This backend keeps HTB state in memory, for tests and simulation.
+     Byte counters are advanced by calling send().
+     With ifaces, only those interfaces (and IFB devices it adds) exist.
+  """
+  def __init__(self, ifaces=None):
+    self.classes = {}
+    self.filters = {}
+    self.redirects = {}
+    self.ifaces = set(ifaces) if ifaces is not None else None
+
+
+  def enableRateEstimator(self):
+    pass
+
+
+  def resetRoot(self, iface):
+    self.classes.pop(iface, None)
+    self.filters.pop(iface, None)
+
+
+  def addHtbRoot(self, iface, default):
+    if self.ifaces is not None and iface not in self.ifaces:
+      raise Exception('Could not setup htb qdisc')
+    self.classes[iface] = {}
+    self.filters[iface] = {}
+
+
+  def setClass(self, iface, minor, rate_mbps, ceil_mbps, parent=0):
+    # HTB needs a rate, and a ceiling no lower than it
+    if iface not in self.classes or rate_mbps < 1 or ceil_mbps < rate_mbps:
+      raise Exception('Could not change htb class rate')
+    _ = self.classes[iface].setdefault(minor, {'bytes': 0, 'packets': 0})
+    _['rate_mbps'] = rate_mbps
+    _['ceil_mbps'] = ceil_mbps
+    _['parent'] = parent
+
+
+  def delClass(self, iface, minor):
+    if minor not in self.classes.get(iface, {}):
+      raise Exception('Could not remove htb class 1:%x' % minor)
+    del self.classes[iface][minor]
+
+
+  def addFwFilter(self, iface, mark, minor):
+    if iface not in self.filters:
+      raise Exception('Could not add fw filter for mark %d' % mark)
+    self.filters[iface][mark] = minor
+
+
+  def delFwFilter(self, iface, mark):
+    if mark not in self.filters.get(iface, {}):
+      raise Exception('Could not remove fw filter for mark %d' % mark)
+    del self.filters[iface][mark]
+
+
+  def addIfb(self, ifb):
+    if self.ifaces is not None:
+      self.ifaces.add(ifb)
+
+
+  def setupIngress(self, iface, ifb):
+    if self.ifaces is not None and ifb not in self.ifaces:
+      raise Exception('Could not redirect %s ingress to %s' % (iface, ifb))
+    self.redirects[iface] = ifb
+
+
+  def send(self, iface, minor, nbytes, npackets=1):
+    """ Accounts traffic sent through HTB class 1:minor and its parents
+    """
+    while minor:
+      self.classes[iface][minor]['bytes'] += nbytes
+      self.classes[iface][minor]['packets'] += npackets
+      minor = self.classes[iface][minor]['parent']
+
+
+  def classStats(self, iface):
+    if iface not in self.classes:
+      raise Exception('Could not read htb class stats')
+    results = {}
+    for minor, _ in self.classes[iface].items():
+      results[minor] = ClassStats(_['bytes'], _['packets'], 0, 0, 0, 0)
+    return results
+
+
+def MakeBackend(name):
+  """ Returns the tc backend called name, falling back to the command line
+      tool when netlink support is not available
+  """
+  if name == 'fake':
+    return TcFake()
+  if name == 'netlink':
+    if IPRoute is not None:
+      return TcNetlink()
+    print "pyroute2 not available, using tc commands"
+  return TcCommand()
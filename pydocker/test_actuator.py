@@ -0,0 +1,132 @@
+"""
+Tests of shares actuation through the cgroup backend, driven by the
+shares controller
+
+Current assumptions:
+- A fake cgroup v1 tree and a fake docker client that never sees the shares
+  written to the cgroup
+- Plain docker mode: no K8S, no core isolation
+
+"""
+
+__author__ = "Christos Kozyrakis"
+__email__ = "christos@hyperpilot.io"
+__copyright__ = "Copyright 2017, HyperPilot Inc"
+
+import os
+import json
+import shutil
+import tempfile
+import unittest
+from multiprocessing.pool import ThreadPool
+
+import settings as st
+import actuator
+import cgroup
+import containertable
+import inventory
+import maincontrol
+import policy
+
+ID = 'a' * 64
+
+
+class FakeContainer(object):
+  def __init__(self, cid):
+    self.id = cid
+    self.name = 'be'
+    self.attrs = {'HostConfig': {'CpuShares': 100, 'CpusetCpus': '', 'CpuQuota': 0},
+                  'Config': {'Labels': {'hyperpilot.io/wclass': 'BE'}},
+                  'State': {}}
+
+
+  def update(self, **kwargs):
+    raise AssertionError('shares must not go through docker')
+
+
+class FakeContainers(object):
+  def __init__(self, conts):
+    self.conts = conts
+
+
+  def list(self):
+    return self.conts
+
+
+  def get(self, cid):
+    return [_ for _ in self.conts if _.id == cid][0]
+
+
+class FakeDocker(object):
+  def __init__(self, conts):
+    self.containers = FakeContainers(conts)
+
+
+class CgroupActuationTest(unittest.TestCase):
+  def setUp(self):
+    self.root = tempfile.mkdtemp()
+    self.path = os.path.join(self.root, 'cpu', 'docker', ID, 'cpu.shares')
+    os.makedirs(os.path.dirname(self.path))
+    self.writeShares(100)
+    with open('config.json') as _:
+      st.params = maincontrol.DefaultParams(json.load(_))
+    st.params.update({'shares_backend': 'cgroup', 'docker_events': False, 'be_victims': False})
+    st.k8sOn = False
+    st.node = st.NodeInfo()
+    st.node.denv = FakeDocker([FakeContainer(ID)])
+    st.node.table = containertable.ContainerTable(st.params['min_shares'], False)
+    st.node.actuator = actuator.SharesActuator(ThreadPool(2), st.params['actuation_timeout'], \
+                                               cgroup.CgroupShares(self.root))
+    st.node.policy = policy.MakePolicy(st.params)
+
+
+  def tearDown(self):
+    shutil.rmtree(self.root)
+
+
+  def writeShares(self, shares):
+    with open(self.path, 'w') as _:
+      _.write('%d' % shares)
+
+
+  def readShares(self):
+    with open(self.path) as _:
+      return int(_.read())
+
+
+  def cycle(self, decision):
+    """ One cycle of the shares controller, without stats
+    """
+    st.active_containers, _ = maincontrol.ActiveContainers()
+    if decision == 'grow':
+      maincontrol.GrowBE()
+    elif decision == 'shrink':
+      maincontrol.ShrinkBE(0.0)
+    return maincontrol.ApplyShares()
+
+
+  def testGrowTwice(self):
+    # records are rebuilt from docker every cycle, at 100 shares
+    self.assertEqual(self.cycle('grow'), 1)
+    self.assertEqual(self.readShares(), 110)
+    self.assertEqual(self.cycle('grow'), 1)
+    self.assertEqual(self.readShares(), 121)
+    # and nothing is written again once applied
+    self.assertEqual(self.cycle('hold'), 0)
+    self.assertEqual(self.cycle('shrink'), 1)
+    self.assertEqual(self.readShares(), 108)
+
+
+  def testUpdateEvent(self):
+    st.node.inventory = inventory.ContainerInventory(st.node.denv, st.node.table)
+    st.node.inventory.seed()
+    self.assertEqual(self.cycle('grow'), 1)
+    # e.g. a cpuset update through docker, which still reports 100 shares
+    st.node.inventory.handle({'status': 'update', 'id': ID})
+    self.assertEqual(self.cycle('hold'), 0)
+    self.assertEqual(self.cycle('grow'), 1)
+    self.assertEqual(self.readShares(), 121)
+
+
+if __name__ == '__main__':
+  unittest.main()
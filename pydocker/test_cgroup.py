@@ -0,0 +1,149 @@
+"""
+Tests of the cgroup utilities, on fake cgroup v1 and v2 trees
+
+Current assumptions:
+- v1 trees use the cgroupfs driver layout, v2 trees the systemd one
+- 100 clock ticks per second in the fake /proc/stat
+
+"""
+
+__author__ = "Christos Kozyrakis"
+__email__ = "christos@hyperpilot.io"
+__copyright__ = "Copyright 2017, HyperPilot Inc"
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import cgroup
+
+ID = 'a' * 64
+OTHER_ID = 'b' * 64
+
+
+def WriteFile(path, text):
+  """ Writes a file, creating its directory
+  """
+  if not os.path.isdir(os.path.dirname(path)):
+    os.makedirs(os.path.dirname(path))
+  with open(path, 'w') as _:
+    _.write(text)
+
+
+def ReadFile(path):
+  with open(path) as _:
+    return _.read()
+
+
+class CgroupTest(unittest.TestCase):
+  unified = False
+
+  def setUp(self):
+    self.root = tempfile.mkdtemp()
+    self.proc_stat = os.path.join(self.root, 'stat')
+    if self.unified:
+      WriteFile(os.path.join(self.root, 'cgroup.controllers'), 'cpu io memory\n')
+
+
+  def tearDown(self):
+    shutil.rmtree(self.root)
+
+
+  def container(self, docker_id, controller):
+    """ Cgroup directory of a container in the fake tree
+    """
+    if self.unified:
+      return os.path.join(self.root, 'system.slice', 'docker-%s.scope' % docker_id)
+    return os.path.join(self.root, controller, 'docker', docker_id)
+
+
+  def setUsage(self, docker_id, nanoseconds):
+    path = self.container(docker_id, 'cpuacct')
+    if self.unified:
+      WriteFile(os.path.join(path, 'cpu.stat'), 'usage_usec %d\nuser_usec 0\nsystem_usec 0\n' \
+                % (nanoseconds // 1000))
+    else:
+      WriteFile(os.path.join(path, 'cpuacct.usage'), '%d\n' % nanoseconds)
+
+
+  def setSystemTicks(self, ticks):
+    # user, nice, system, idle, iowait, irq, softirq, steal
+    WriteFile(self.proc_stat, 'cpu  %d 0 0 %d 0 0 0 7\ncpu0 1 0 0 1 0 0 0 0\n' % (ticks // 2, ticks // 2))
+
+
+  def testSample(self):
+    cpu = cgroup.CgroupCpu(self.root, self.proc_stat)
+    cpu.clk_tck = 100
+    self.setUsage(ID, 0)
+    self.setSystemTicks(200)
+    # first sample of a container
+    self.assertEqual(cpu.sample([ID]), {ID: 0.0})
+    # 1 s of container CPU out of 4 s of host CPU
+    self.setUsage(ID, 1000000000)
+    self.setSystemTicks(600)
+    self.assertAlmostEqual(cpu.sample([ID])[ID], 25.0)
+    # counters going backwards do not report negative usage
+    self.setUsage(ID, 0)
+    self.setSystemTicks(800)
+    self.assertEqual(cpu.sample([ID]), {ID: 0.0})
+
+
+  def testContainerGone(self):
+    cpu = cgroup.CgroupCpu(self.root, self.proc_stat)
+    self.setUsage(ID, 0)
+    self.setSystemTicks(200)
+    cpu.sample([ID])
+    shutil.rmtree(self.container(ID, 'cpuacct'))
+    self.setSystemTicks(400)
+    self.assertEqual(cpu.sample([ID]), {ID: 0.0})
+    self.assertNotIn(ID, cpu.paths)
+    self.assertEqual(cpu.samples, {})
+
+
+  def testMisses(self):
+    cpu = cgroup.CgroupCpu(self.root, self.proc_stat)
+    self.setUsage(ID, 0)
+    self.setSystemTicks(200)
+    cpu.sample([ID, OTHER_ID])
+    self.assertIn(OTHER_ID, cpu.misses)
+    # a container that shows up later is found once the miss expires
+    self.setUsage(OTHER_ID, 0)
+    cpu.sample([ID, OTHER_ID])
+    self.assertNotIn(OTHER_ID, cpu.paths)
+    cpu.misses[OTHER_ID] -= cgroup.RESCAN_INTERVAL
+    cpu.sample([ID, OTHER_ID])
+    self.assertIn(OTHER_ID, cpu.paths)
+    self.assertNotIn(OTHER_ID, cpu.misses)
+    # misses of containers no longer sampled are forgotten
+    cpu.findCgroups(['c' * 64])
+    cpu.sample([ID])
+    self.assertEqual(cpu.misses, {})
+
+
+  def testShares(self):
+    shares = cgroup.CgroupShares(self.root)
+    path = self.container(ID, 'cpu')
+    WriteFile(os.path.join(path, 'cpu.weight' if self.unified else 'cpu.shares'), '')
+    shares.setShares(ID, 1024)
+    if self.unified:
+      self.assertEqual(ReadFile(os.path.join(path, 'cpu.weight')), '39')
+    else:
+      self.assertEqual(ReadFile(os.path.join(path, 'cpu.shares')), '1024')
+    self.assertRaises(IOError, shares.setShares, OTHER_ID, 2)
+
+
+  def testTasks(self):
+    tasks = cgroup.CgroupTasks(self.root)
+    path = self.container(ID, 'cpu')
+    WriteFile(os.path.join(path, 'cgroup.threads' if self.unified else 'tasks'), '10\n11\n')
+    self.assertEqual(tasks.tasks(ID), ['10', '11'])
+    self.assertRaises(IOError, tasks.tasks, OTHER_ID)
+
+
+class UnifiedCgroupTest(CgroupTest):
+  unified = True
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,96 @@
+"""
+Tests of the container table
+
+Current assumptions:
+- Records come from inventory.MakeContainer; the tests build them by hand
+
+"""
+
+__author__ = "Christos Kozyrakis"
+__email__ = "christos@hyperpilot.io"
+__copyright__ = "Copyright 2017, HyperPilot Inc"
+
+import unittest
+
+import settings as st
+import containertable
+
+
+def Record(docker_id, wclass='BE', docker_shares=2):
+  _ = st.Container()
+  _.docker_id = docker_id
+  _.wclass = wclass
+  _.docker_shares = docker_shares
+  return _
+
+
+class ContainerTableTest(unittest.TestCase):
+  def setUp(self):
+    self.table = containertable.ContainerTable(2, capacity=2)
+
+
+  def testRows(self):
+    self.table.add(Record('hp', 'HP', 1024))
+    self.table.add(Record('be1', docker_shares=0))
+    # the table grows past its capacity
+    self.table.add(Record('be2', docker_shares=100))
+    self.assertEqual(self.table.totals(), (1, 1024, 2, 102))
+    # freed rows are reused
+    row = self.table.index['be1']
+    self.table.remove('be1')
+    self.table.remove('be1')
+    self.assertEqual(self.table.totals(), (1, 1024, 1, 100))
+    self.assertEqual(self.table.add(Record('be3')), row)
+    self.assertEqual(len(self.table.records), 4)
+
+
+  def testSync(self):
+    records = dict((_, Record(_)) for _ in ('a', 'b'))
+    self.table.sync(records)
+    records = dict((_, Record(_)) for _ in ('b', 'c'))
+    self.table.sync(records)
+    self.assertEqual(sorted(self.table.index), ['b', 'c'])
+    self.assertEqual(self.table.records[self.table.index['c']], records['c'])
+
+
+  def testClass(self):
+    self.table.add(Record('a', 'HP', 10))
+    self.table.setClass('a', 'BE')
+    self.table.setClass('gone', 'BE')
+    self.assertEqual(self.table.totals(), (0, 0, 1, 10))
+
+
+  def testPolicies(self):
+    self.table.add(Record('hp', 'HP', 1024))
+    for _ in ('a', 'b'):
+      self.table.add(Record(_, docker_shares=100))
+    self.assertEqual(len(self.table.grow(1.1)), 2)
+    self.assertEqual(self.table.sharesOf('a'), 110)
+    self.assertEqual(self.table.sharesOf('hp'), 1024)
+    rows = self.table.indices([Record('a'), Record('gone')])
+    self.assertEqual(len(self.table.shrink(0.5, 2, rows)), 1)
+    self.assertEqual((self.table.sharesOf('a'), self.table.sharesOf('b')), (55, 110))
+    # BE adds up to the scale target, outside rows included
+    self.table.scale(200, 2, rows)
+    self.assertEqual(self.table.totals()[3], 200)
+    self.assertIsNone(self.table.sharesOf('gone'))
+
+
+  def testPending(self):
+    self.table.add(Record('a', docker_shares=0))
+    self.table.add(Record('b', docker_shares=100))
+    # shares below min_shares are raised
+    pending = self.table.pending()
+    self.assertEqual([(_.docker_id, shares) for _, shares in pending], [('a', 2)])
+    self.table.setApplied('a', 2)
+    self.table.setApplied('gone', 2)
+    self.assertEqual(self.table.pending(), [])
+    # desired shares survive a new record of the same container
+    self.table.grow(1.1)
+    self.table.add(Record('b', docker_shares=100))
+    self.assertEqual(self.table.sharesOf('b'), 110)
+    self.assertEqual(len(self.table.pending()), 2)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,55 @@
+"""
+Tests of the shares controller glue code
+
+Current assumptions:
+- K8S mode, with a fake API client that records node patches
+
+"""
+
+__author__ = "Christos Kozyrakis"
+__email__ = "christos@hyperpilot.io"
+__copyright__ = "Copyright 2017, HyperPilot Inc"
+
+import json
+import unittest
+
+import settings as st
+import maincontrol
+
+
+class FakeKube(object):
+  def __init__(self):
+    self.labels = []
+
+
+  def patch_node(self, name, body):
+    self.labels.append(body['metadata']['labels']['hyperpilot.io/be-enabled'])
+
+
+class LabelNodeTest(unittest.TestCase):
+  def setUp(self):
+    with open('config.json') as _:
+      st.params = maincontrol.DefaultParams(json.load(_))
+    st.node = st.NodeInfo()
+    st.node.kenv = FakeKube()
+
+
+  def testTransitions(self):
+    maincontrol.LabelNode(True)
+    maincontrol.LabelNode(True)
+    maincontrol.LabelNode(False)
+    maincontrol.LabelNode(False)
+    self.assertEqual(st.node.kenv.labels, ['true', 'false'])
+
+
+  def testRefresh(self):
+    # someone else may have changed the label since it was last set
+    maincontrol.LabelNode(True)
+    st.node.be_enabled_at -= st.params['label_refresh']
+    maincontrol.LabelNode(True)
+    maincontrol.LabelNode(True)
+    self.assertEqual(st.node.kenv.labels, ['true', 'true'])
+
+
+if __name__ == '__main__':
+  unittest.main()
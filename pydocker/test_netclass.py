@@ -0,0 +1,137 @@
+"""
+Tests of the network classes, on the fake traffic control backend
+
+Current assumptions:
+- The fake backend only knows the interfaces it is given, so that setup
+  order problems show up as they would on a real node
+
+"""
+
+__author__ = "Christos Kozyrakis"
+__email__ = "christos@hyperpilot.io"
+__copyright__ = "Copyright 2017, HyperPilot Inc"
+
+import unittest
+
+import netclass
+import tcbackend
+import ipmark
+
+
+def MakeNetClass(ingress=False, per_container=True):
+  """ A NetClass shaping ens3 on a node without an IFB device
+  """
+  return netclass.NetClass('ens3', 'weave', 700, 10000, tcbackend.TcFake(['ens3', 'weave']), \
+                           ipmark.FakeMarker('weave'), per_container, 700 if ingress else None)
+
+
+class CountingTc(tcbackend.TcFake):
+  """This class counts class changes.
+  """
+  def __init__(self, ifaces):
+    super(CountingTc, self).__init__(ifaces)
+    self.set_class = 0
+
+
+  def setClass(self, iface, minor, rate_mbps, ceil_mbps, parent=0):
+    self.set_class += 1
+    super(CountingTc, self).setClass(iface, minor, rate_mbps, ceil_mbps, parent)
+
+
+class NetClassTest(unittest.TestCase):
+  def testSetup(self):
+    net = MakeNetClass()
+    self.assertEqual(net.devices, {netclass.EGRESS: 'ens3'})
+    classes = net.tc.classes['ens3']
+    self.assertEqual((classes[netclass.ROOT_CLASS]['rate_mbps'], classes[netclass.BE_CLASS]['rate_mbps']), \
+                     (10000, 700))
+    self.assertEqual(net.tc.filters['ens3'], {netclass.BE_MARK: netclass.BE_CLASS})
+    self.assertEqual(net.tc.redirects, {})
+
+
+  def testPerContainer(self):
+    net = MakeNetClass()
+    net.updateFilter(['10.0.0.1', '10.0.0.2'], [])
+    minors = dict(net.ip_class)
+    self.assertEqual(net.marker.marks, minors)
+    for minor in minors.values():
+      self.assertEqual(net.tc.classes['ens3'][minor]['parent'], netclass.BE_CLASS)
+      self.assertEqual(net.tc.filters['ens3'][minor], minor)
+    net.updateFilter([], ['10.0.0.1'])
+    self.assertNotIn(minors['10.0.0.1'], net.tc.classes['ens3'])
+    self.assertNotIn(minors['10.0.0.1'], net.tc.filters['ens3'])
+    self.assertEqual(net.marker.marks, {'10.0.0.2': minors['10.0.0.2']})
+    # freed classes are reused
+    net.updateFilter(['10.0.0.3'], [])
+    self.assertEqual(net.ip_class['10.0.0.3'], minors['10.0.0.1'])
+    self.assertEqual(net.cont_ips, set(['10.0.0.2', '10.0.0.3']))
+
+
+  def testSharedClass(self):
+    net = MakeNetClass(per_container=False)
+    net.addIPtoFilter('10.0.0.1')
+    self.assertEqual(net.marker.marks, {'10.0.0.1': netclass.BE_MARK})
+    self.assertEqual(sorted(net.tc.classes['ens3']), [netclass.ROOT_CLASS, netclass.BE_CLASS])
+    self.assertRaises(Exception, net.addIPtoFilter, '10.0.0.1')
+    net.removeIPfromFilter('10.0.0.1')
+    self.assertRaises(Exception, net.removeIPfromFilter, '10.0.0.1')
+    self.assertEqual(net.marker.marks, {})
+
+
+  def testBwLimit(self):
+    net = netclass.NetClass('ens3', 'weave', 700, 10000, CountingTc(['ens3']), \
+                            ipmark.FakeMarker('weave'), True)
+    net.updateFilter(['10.0.0.1', '10.0.0.2'], [], {'10.0.0.1': 3.0})
+    net.setBwLimit(400)
+    classes = net.tc.classes['ens3']
+    self.assertEqual((classes[net.ip_class['10.0.0.1']]['rate_mbps'], \
+                      classes[net.ip_class['10.0.0.2']]['rate_mbps']), (300, 100))
+    for minor in net.ip_class.values():
+      self.assertEqual(classes[minor]['ceil_mbps'], 400)
+    # unchanged limits are not written again
+    count = net.tc.set_class
+    net.setBwLimit(400)
+    self.assertEqual(net.tc.set_class, count)
+
+
+  def testBwStats(self):
+    net = MakeNetClass()
+    net.updateFilter(['10.0.0.1'], [])
+    minor = net.ip_class['10.0.0.1']
+    net.getBwStats(now=100.0)
+    net.tc.send('ens3', minor, 2500000)
+    bw = net.getBwStats(now=102.0)
+    self.assertAlmostEqual(bw[minor], 10.0)
+    self.assertAlmostEqual(bw[netclass.BE_CLASS], 10.0)
+    self.assertAlmostEqual(bw[netclass.ROOT_CLASS], 0.0)
+    self.assertEqual(net.getContainerBw(bw), {'10.0.0.1': bw[minor]})
+
+
+  def testIngress(self):
+    net = MakeNetClass(ingress=True)
+    self.assertEqual(net.tc.redirects, {'ens3': 'ifb0'})
+    for dev in ('ens3', 'ifb0'):
+      self.assertEqual(net.tc.classes[dev][netclass.BE_CLASS]['ceil_mbps'], 700)
+      self.assertEqual(net.tc.filters[dev], {netclass.BE_MARK: netclass.BE_CLASS})
+
+
+  def testSmallBwLimit(self):
+    net = MakeNetClass(ingress=True)
+    net.updateFilter(['10.0.0.1', '10.0.0.2'], [], {'10.0.0.1': 3.0})
+    for bw in (0.5, 0.0, 2.0):
+      for direction, dev in net.devices.items():
+        net.setBwLimit(bw, direction)
+        classes = net.tc.classes[dev]
+        ceil = classes[netclass.BE_CLASS]['ceil_mbps']
+        self.assertEqual(ceil, max(1, int(bw)))
+        for minor in net.ip_class.values():
+          self.assertLessEqual(classes[minor]['ceil_mbps'], ceil)
+          self.assertLessEqual(classes[minor]['rate_mbps'], ceil)
+    # new containers start under the current ceiling too
+    net.setBwLimit(0.5)
+    net.updateFilter(['10.0.0.3'], [])
+    self.assertEqual(net.tc.classes['ens3'][net.ip_class['10.0.0.3']]['ceil_mbps'], 1)
+
+
+if __name__ == '__main__':
+  unittest.main()
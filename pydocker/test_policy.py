@@ -0,0 +1,98 @@
+"""
+Tests of the BE shares policies
+
+Current assumptions:
+- Policies are compared in the replay simulation, on a node where HP and
+  BE contend for CPU and SLO slack drops with the CPU HP does not get
+
+"""
+
+__author__ = "Christos Kozyrakis"
+__email__ = "christos@hyperpilot.io"
+__copyright__ = "Copyright 2017, HyperPilot Inc"
+
+import json
+import unittest
+
+import settings as st
+import policy
+import simulate
+import maincontrol
+
+
+def ContendedTrace(duration=300.0, step=0.1):
+  """ HP and BE together want 140% of the node, with plenty of slack when
+      HP gets all it wants
+  """
+  return [{'t': i * step, 'slack': 0.2, 'hp_cpu': 60.0, 'be_cpu': 80.0, 'hp_bw': 100.0, 'be_bw': 100.0} \
+          for i in range(int(duration / step))]
+
+
+def Simulate(be_policy, slack_gain):
+  """ Results of one simulation with one HP and four BE pods
+  """
+  params = simulate.SimParams('config.json', 'cgroup')
+  # CPU is always contended, so that only slack drives the policies
+  params.update({'be_policy': be_policy, 'load_threshold_shrink': 200.0, 'load_threshold_grow': 150.0})
+  return simulate.Simulation(params, 1, 4, slack_gain=slack_gain).run(ContendedTrace())
+
+
+class PolicySimulationTest(unittest.TestCase):
+  def compare(self, slack_gain):
+    multiplicative = Simulate('multiplicative', slack_gain)
+    pi = Simulate('pi', slack_gain)
+    # settles sooner, with fewer actuations
+    self.assertLess(pi['last_actuation_cycle'], multiplicative['last_actuation_cycle'] / 2)
+    self.assertLess(pi['actuations'], multiplicative['actuations'] / 2)
+    self.assertLessEqual(pi['last_actuation_cycle'], 15)
+    # and stays out of the shrink region once settled
+    shrink = simulate.SimParams('config.json', 'cgroup')['slack_threshold_shrink']
+    self.assertGreaterEqual(pi['late_slack_min'], shrink)
+    self.assertEqual(pi['time_to_disable'], [])
+
+
+  def testConvergence(self):
+    self.compare(1.0)
+
+
+  def testConvergenceSteepSlack(self):
+    self.compare(4.0)
+
+
+class PiPolicyTest(unittest.TestCase):
+  def setUp(self):
+    with open('config.json') as _:
+      self.params = maincontrol.DefaultParams(json.load(_))
+    self.params['be_policy'] = 'pi'
+    self.policy = policy.MakePolicy(self.params)
+
+
+  def stats(self, be_shares, hp_shares=1024):
+    stats = st.ControllerStats()
+    stats.hp_cont, stats.be_cont = 1, 1
+    stats.hp_shares, stats.be_shares = hp_shares, be_shares
+    return stats
+
+
+  def testAntiWindup(self):
+    # saturated for a long time: the integral must not run away
+    for _ in range(100):
+      self.policy.decide(10.0, 0.5, self.stats(1024))
+    self.assertLessEqual(self.policy.integral, self.params['policy_max_be_fraction'])
+    # so the first negative error shrinks at once
+    self.assertEqual(self.policy.decide(10.0, 0.01, self.stats(1024)), 'shrink')
+
+
+  def testDeadband(self):
+    self.policy.decide(10.0, 0.2, self.stats(100))
+    self.assertEqual(self.policy.decide(10.0, 0.08, self.stats(100)), 'hold')
+    self.assertIsNone(self.policy.target)
+
+
+  def testDisable(self):
+    self.assertEqual(self.policy.decide(10.0, -0.1, self.stats(100)), 'disable')
+    self.assertIsNone(self.policy.integral)
+
+
+if __name__ == '__main__':
+  unittest.main()
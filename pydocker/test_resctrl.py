@@ -0,0 +1,112 @@
+"""
+Tests of the resctrl utilities, on a fake /sys/fs/resctrl tree
+
+Current assumptions:
+- The fake tree has 8 cache ways in two L3 domains, with MBA and MBM
+- The kernel populates new groups; the fake tree starts them empty
+
+"""
+
+__author__ = "Christos Kozyrakis"
+__email__ = "christos@hyperpilot.io"
+__copyright__ = "Copyright 2017, HyperPilot Inc"
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import resctrl
+
+
+def WriteFile(path, text):
+  """ Writes a file, creating its directory
+  """
+  if not os.path.isdir(os.path.dirname(path)):
+    os.makedirs(os.path.dirname(path))
+  with open(path, 'w') as _:
+    _.write(text)
+
+
+def ReadFile(path):
+  with open(path) as _:
+    return _.read()
+
+
+class ResctrlTest(unittest.TestCase):
+  def setUp(self):
+    self.root = tempfile.mkdtemp()
+    WriteFile(os.path.join(self.root, 'info', 'L3', 'cbm_mask'), 'ff\n')
+    WriteFile(os.path.join(self.root, 'info', 'L3', 'min_cbm_bits'), '1\n')
+    WriteFile(os.path.join(self.root, 'info', 'MB', 'min_bandwidth'), '10\n')
+    WriteFile(os.path.join(self.root, 'info', 'MB', 'bandwidth_gran'), '10\n')
+    WriteFile(os.path.join(self.root, 'schemata'), '    L3:0=ff;1=ff\n    MB:0=100;1=100\n')
+    self.rc = resctrl.Resctrl(self.root, 'be')
+    self.rc.create()
+    WriteFile(os.path.join(self.rc.group, 'tasks'), '')
+    self.writes = []
+
+
+  def tearDown(self):
+    if hasattr(resctrl, 'open'):
+      del resctrl.open
+    shutil.rmtree(self.root)
+
+
+  def recordWrites(self):
+    """ Records the schemata files written, in order
+    """
+    def Open(path, mode='r'):
+      if 'w' in mode:
+        self.writes.append(os.path.dirname(path))
+      return open(path, mode)
+    resctrl.open = Open
+
+
+  def testInfo(self):
+    self.assertEqual(self.rc.ways, 8)
+    self.assertEqual(self.rc.min_ways, 1)
+    self.assertEqual(self.rc.domains, ['0', '1'])
+    self.assertTrue(self.rc.mba)
+    self.assertEqual((self.rc.min_mba, self.rc.mba_step), (10, 10))
+    # creating an existing group is fine
+    self.rc.create()
+
+
+  def testAllocation(self):
+    self.assertTrue(self.rc.setAllocation(2, 50))
+    self.assertEqual(ReadFile(os.path.join(self.root, 'schemata')), 'L3:0=3f;1=3f\nMB:0=100;1=100\n')
+    self.assertEqual(ReadFile(os.path.join(self.rc.group, 'schemata')), 'L3:0=c0;1=c0\nMB:0=50;1=50\n')
+    self.assertFalse(self.rc.setAllocation(2, 50))
+
+
+  def testWriteOrder(self):
+    self.rc.setAllocation(2, 50)
+    self.recordWrites()
+    # BE grows: the default group gives up its ways first
+    self.rc.setAllocation(3, 50)
+    self.assertEqual(self.writes, [self.root, self.rc.group])
+    # BE shrinks: the BE group gives up its ways first
+    del self.writes[:]
+    self.rc.setAllocation(1, 50)
+    self.assertEqual(self.writes, [self.rc.group, self.root])
+
+
+  def testAddTasks(self):
+    WriteFile(os.path.join(self.rc.group, 'tasks'), '1\n2\n')
+    self.recordWrites()
+    self.assertEqual(self.rc.addTasks(['2', '3', '4']), 2)
+    self.assertEqual(self.writes, [self.rc.group, self.rc.group])
+
+
+  def testBytes(self):
+    self.assertIsNone(self.rc.beBytes())
+    for domain, count in (('mon_L3_00', 100), ('mon_L3_01', 23)):
+      WriteFile(os.path.join(self.rc.group, 'mon_data', domain, 'mbm_total_bytes'), '%d\n' % count)
+      WriteFile(os.path.join(self.root, 'mon_data', domain, 'mbm_total_bytes'), '%d\n' % (10 * count))
+    self.assertEqual(self.rc.beBytes(), 123)
+    self.assertEqual(self.rc.hpBytes(), 1230)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,88 @@
+"""
+Tests of the SLO slack sources
+
+Current assumptions:
+- The file backend is tested one poll at a time, without its thread
+
+"""
+
+__author__ = "Christos Kozyrakis"
+__email__ = "christos@hyperpilot.io"
+__copyright__ = "Copyright 2017, HyperPilot Inc"
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import slosource
+
+MAX_AGE = 0.1
+
+
+class FileSloSourceTest(unittest.TestCase):
+  def setUp(self):
+    self.root = tempfile.mkdtemp()
+    self.path = os.path.join(self.root, 'slo_slack.txt')
+    self.source = slosource.FileSloSource(self.path, MAX_AGE / 10)
+
+
+  def tearDown(self):
+    shutil.rmtree(self.root)
+
+
+  def write(self, text, mtime):
+    with open(self.path, 'w') as _:
+      _.write(text)
+    os.utime(self.path, (mtime, mtime))
+
+
+  def testStaticFile(self):
+    # a file that never changes stays current
+    self.write('0.3\n', 1000)
+    self.source.poll()
+    self.assertEqual(self.source.current(MAX_AGE), 0.3)
+    time.sleep(2 * MAX_AGE)
+    self.source.poll()
+    self.assertEqual(self.source.current(MAX_AGE), 0.3)
+
+
+  def testChange(self):
+    self.write('0.3\n', 1000)
+    self.source.poll()
+    self.write('0.1\n', 1001)
+    self.source.poll()
+    self.assertEqual(self.source.current(MAX_AGE), 0.1)
+
+
+  def testMissingFile(self):
+    self.source.poll()
+    self.assertEqual(self.source.current(MAX_AGE), 0.0)
+    self.write('0.3\n', 1000)
+    self.source.poll()
+    self.assertEqual(self.source.current(MAX_AGE), 0.3)
+    # a removed file goes stale
+    os.remove(self.path)
+    time.sleep(2 * MAX_AGE)
+    self.source.poll()
+    self.assertEqual(self.source.current(MAX_AGE), 0.0)
+    # and comes back with the same mtime
+    self.write('0.2\n', 1000)
+    self.source.poll()
+    self.assertEqual(self.source.current(MAX_AGE), 0.2)
+
+
+  def testInvalidFile(self):
+    # an unparsable file does not keep an older value current
+    self.write('0.3\n', 1000)
+    self.source.poll()
+    self.write('\n', 1001)
+    self.source.poll()
+    time.sleep(2 * MAX_AGE)
+    self.source.poll()
+    self.assertEqual(self.source.current(MAX_AGE), 0.0)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,60 @@
+"""
+Tests of the kubelet stats summary scanner
+
+Current assumptions:
+- Summaries are fed the way libcurl does: in chunks of any size
+
+"""
+
+__author__ = "Christos Kozyrakis"
+__email__ = "christos@hyperpilot.io"
+__copyright__ = "Copyright 2017, HyperPilot Inc"
+
+import json
+import unittest
+
+import summaryscan
+
+SUMMARY = json.dumps({
+  'node': {'nodeName': 'node-1', 'cpu': {'time': '2017-06-01T00:00:00Z', 'usageNanoCores': 1500000000}},
+  'pods': [{'podRef': {'name': 'be-1', 'namespace': 'default'},
+            'cpu': {'usageNanoCores': 200000000}, 'containers': [{'name': 'x'}]},
+           {'podRef': {'name': 'hp "1"', 'namespace': 'hyperpilot'},
+            'cpu': {'usageNanoCores': 900000000}}]}, indent=1, sort_keys=True)
+
+
+def Feed(scanner, size):
+  """ Feeds the summary in chunks of size bytes, the way libcurl does
+      Returns the values returned by write()
+  """
+  results = []
+  for _ in range(0, len(SUMMARY), size):
+    results.append(scanner.write(SUMMARY[_:_ + size]))
+    if results[-1] == 0:
+      break
+  return results
+
+
+class SummaryScannerTest(unittest.TestCase):
+  def testPods(self):
+    for size in (len(SUMMARY), 7, 1):
+      scanner = summaryscan.SummaryScanner(True)
+      # the whole document is consumed: the connection can be reused
+      self.assertEqual(set(Feed(scanner, size)), set([None]))
+      self.assertEqual(scanner.node_cpu, 1500000000)
+      self.assertEqual(scanner.pod_cpu, {('default', 'be-1'): 200000000,
+                                         ('hyperpilot', 'hp "1"'): 900000000})
+
+
+  def testNodeOnly(self):
+    scanner = summaryscan.SummaryScanner(False)
+    results = Feed(scanner, 16)
+    # stops early, right after node CPU
+    self.assertEqual(results[-1], 0)
+    self.assertLess(16 * len(results), SUMMARY.index('"pods"'))
+    self.assertEqual(scanner.node_cpu, 1500000000)
+    self.assertEqual(scanner.pod_cpu, {})
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,79 @@
+"""
+Tests of the traffic control backends
+
+Current assumptions:
+- Netlink tests decode real pyroute2 messages and are skipped without it
+
+"""
+
+__author__ = "Christos Kozyrakis"
+__email__ = "christos@hyperpilot.io"
+__copyright__ = "Copyright 2017, HyperPilot Inc"
+
+import unittest
+
+import tcbackend
+
+try:
+  from pyroute2.netlink.rtnl.tcmsg import tcmsg
+except ImportError:
+  tcmsg = None
+
+
+class FakeIPRoute(object):
+  """This class answers class dumps with given netlink messages.
+  """
+  def __init__(self, classes):
+    self.classes = classes
+
+
+  def link_lookup(self, ifname):
+    return [3]
+
+
+  def get_classes(self, index):
+    return self.classes
+
+
+def ClassMessage(handle, stats):
+  """ A class dump message as the kernel sends it, decoded by pyroute2
+  """
+  msg = tcmsg()
+  msg['index'] = 3
+  msg['handle'] = handle
+  msg['parent'] = 0x10001
+  msg['attrs'] = [('TCA_KIND', 'htb'), ('TCA_STATS', stats)]
+  msg.encode()
+  received = tcmsg(msg.data)
+  received.decode()
+  return received
+
+
+class ParseClassStatsTest(unittest.TestCase):
+  def testParse(self):
+    text = """class htb 1:1 root prio 0 rate 10Gbit ceil 10Gbit burst 0b cburst 0b
+ Sent 3552621 bytes 22143 pkt (dropped 0, overlimits 0 requeues 0)
+ rate 59400bit 50pps backlog 0b 0p requeues 0
+class htb 1:10 root prio 0 rate 700Mbit ceil 700Mbit burst 1487b cburst 1487b
+ Sent 1253014380 bytes 827622 pkt (dropped 12, overlimits 3045 requeues 0)
+ rate 9Mbit 780pps backlog 3028b 2p requeues 0
+"""
+    stats = tcbackend.ParseClassStats(text)
+    self.assertEqual(stats[1], tcbackend.ClassStats(3552621, 22143, 0, 0, 0, 59400))
+    self.assertEqual(stats[0x10], tcbackend.ClassStats(1253014380, 827622, 12, 3045, 3028, 9000000))
+
+
+@unittest.skipIf(tcmsg is None, 'pyroute2 is not installed')
+class TcNetlinkTest(unittest.TestCase):
+  def testClassStats(self):
+    tc = tcbackend.TcNetlink.__new__(tcbackend.TcNetlink)
+    tc.ipr = FakeIPRoute([ClassMessage(0x10010, {'bytes': 1000, 'packets': 10, 'drop': 2,
+                                                 'overlimits': 3, 'bps': 125, 'pps': 1,
+                                                 'qlen': 0, 'backlog': 64})])
+    tc.indexes = {}
+    stats = tc.classStats('ens3')
+    self.assertEqual(stats, {0x10: tcbackend.ClassStats(1000, 10, 2, 3, 64, 1000)})
+
+
+if __name__ == '__main__':
+  unittest.main()
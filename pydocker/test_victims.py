@@ -0,0 +1,80 @@
+"""
+Tests of BE victim selection and its sizing
+
+Current assumptions:
+- Node load, load thresholds and container CPU are all in percent of the
+  node, whatever the CPU stats backend
+
+"""
+
+__author__ = "Christos Kozyrakis"
+__email__ = "christos@hyperpilot.io"
+__copyright__ = "Copyright 2017, HyperPilot Inc"
+
+import json
+import unittest
+
+import settings as st
+import maincontrol
+import summaryscan
+import victims
+
+NOW = 10000.0
+
+
+def Record(docker_id, cpu_percent, started_at=1.0):
+  _ = st.Container()
+  _.docker_id = docker_id
+  _.wclass = 'BE'
+  _.cpu_percent = cpu_percent
+  _.started_at = started_at
+  return _
+
+
+class VictimsTest(unittest.TestCase):
+  def testFraction(self):
+    # node at 130, target 100, BE holds 40: 30 of the 40 must go
+    self.assertAlmostEqual(victims.Fraction(130.0, 100.0, 40.0, 0.25), 0.75)
+    # never less than minimum, never more than all of BE
+    self.assertEqual(victims.Fraction(90.0, 100.0, 40.0, 0.25), 0.25)
+    self.assertEqual(victims.Fraction(180.0, 100.0, 40.0, 0.25), 1.0)
+    # without BE CPU samples, the share of node load
+    self.assertAlmostEqual(victims.Fraction(200.0, 100.0, 0.0, 0.25), 0.5)
+
+
+  def testSelectVictims(self):
+    conts = [Record('%d' % i, 10.0, NOW - 60.0 * i) for i in range(4)]
+    fraction = victims.Fraction(130.0, 100.0, 40.0, 0.25)
+    picked = victims.SelectVictims(conts, fraction, 0.0, NOW)
+    self.assertGreaterEqual(sum(_.cpu_percent for _ in picked), 30.0)
+    # youngest first
+    self.assertEqual([_.docker_id for _ in picked], ['0', '1', '2'])
+    # without CPU samples, by number
+    for _ in conts:
+      _.cpu_percent = 0.0
+    self.assertEqual(len(victims.SelectVictims(conts, 0.5, 0.0, NOW)), 2)
+
+
+  def testBEVictims(self):
+    with open('config.json') as _:
+      st.params = maincontrol.DefaultParams(json.load(_))
+    st.active_containers = dict((_, Record(_, 10.0)) for _ in 'abcd')
+    hp = Record('hp', 90.0)
+    hp.wclass = 'HP'
+    st.active_containers['hp'] = hp
+    picked = maincontrol.BEVictims(130.0, st.params['victim_fraction_shrink'])
+    self.assertEqual(len(picked), 3)
+
+
+  def testK8SLoad(self):
+    # kubelet node CPU is in percent of the node, like the load thresholds
+    st.params = {'kubelet_pod_cpu': False}
+    st.node = st.NodeInfo()
+    st.node.cpu = 4
+    scanner = summaryscan.SummaryScanner()
+    scanner.node_cpu = 5.2E9
+    self.assertAlmostEqual(maincontrol.CpuStatsK8S(scanner), 130.0)
+
+
+if __name__ == '__main__':
+  unittest.main()
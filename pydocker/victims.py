@@ -0,0 +1,72 @@
+"""
+BE victim selection
+
+Current assumptions:
+- CPU percentages of BE containers are comparable with each other
+- Network rates come from the network controller and may be a period old
+- Stopping a young container loses less BE work than stopping an old one
+
+"""
+
+__author__ = "Christos Kozyrakis"
+__email__ = "christos@hyperpilot.io"
+__copyright__ = "Copyright 2017, HyperPilot Inc"
+
+import time
+import heapq
+
+# weight of age in the ranking, reached by containers running for AGE_HORIZON
+AGE_WEIGHT = 0.5
+AGE_HORIZON = 3600.0
+
+
+def Fraction(cpu_usage, load_target, be_cpu, minimum):
+  """ Share of BE CPU to take back: enough to bring node load down to
+      load_target, and at least minimum; both loads and be_cpu, the CPU of
+      all BE containers, are in percent of the node
+      Without BE CPU samples, the share of node load above load_target
+  """
+  excess = 0.0
+  if be_cpu > 0.0:
+    excess = float(cpu_usage - load_target) / be_cpu
+  elif cpu_usage > 0.0:
+    excess = float(cpu_usage - load_target) / cpu_usage
+  return min(1.0, max(minimum, excess))
+
+
+def Score(cont, max_bw_mbps, now):
+  """ Ranks a BE container, higher scores are picked first
+      Heavy CPU and network users rank high, long running containers low;
+      containers of unknown age count as old
+  """
+  score = cont.cpu_percent / 100.0
+  if max_bw_mbps > 0.0:
+    score += (cont.bw_mbps + cont.ingress_bw_mbps) / max_bw_mbps
+  age = AGE_HORIZON
+  if cont.started_at > 0.0:
+    age = min(AGE_HORIZON, max(0.0, now - cont.started_at))
+  return score - AGE_WEIGHT * age / AGE_HORIZON
+
+
+def SelectVictims(containers, fraction, max_bw_mbps, now=None):
+  """ Picks the fewest top ranked containers that account for fraction of
+      the total CPU of containers; without CPU samples, fraction of their
+      number. At least one container is picked if any is given.
+  """
+  if now is None:
+    now = time.time()
+  heap = [(-Score(cont, max_bw_mbps, now), cont.docker_id, cont) for cont in containers]
+  heapq.heapify(heap)
+  total = sum(cont.cpu_percent for cont in containers)
+  if total > 0.0:
+    size = lambda cont: cont.cpu_percent
+  else:
+    total = float(len(containers))
+    size = lambda cont: 1.0
+  victims = []
+  freed = 0.0
+  while heap and (not victims or freed < fraction * total):
+    cont = heapq.heappop(heap)[2]
+    victims.append(cont)
+    freed += size(cont)
+  return victims